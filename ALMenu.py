@@ -4,13 +4,8 @@
 import streamlit as st
 import pandas as pd
 from datetime import datetime, date
-import re
-import numpy as np # User for colour stuff
-from matplotlib import pyplot as plt
-from matplotlib.ticker import FuncFormatter
-from sklearn.linear_model import LinearRegression
-import seaborn as sns
-import squarify
+import os
+# matplotlib and seaborn are slow to import so only the chart pages import them, see below
 from AL_Functions import (
     format_currency,
     format_currency_dollars_only,
@@ -18,18 +13,28 @@ from AL_Functions import (
     format_multiple,
     format_percent,
     format_st_editor_block,
-    calculate_row_xirr,
-    calculate_xirr,
-    calculate_portfolio_xirr,
-    process_and_summarize_data,
-    show_top_X_increase_and_multiple,
-    show_top_X_names_based_on_multiple_by_Lead,
-    show_realised_based_on_Lead,
-    extract_company_name,
-    convert_date,
-    convert_date_two,
-    has_angellist_data
+    convert_date_two
 )
+from AL_Xirr import portfolio_xirr
+from AL_Overwrite import apply_overwrite
+from AL_Charts import (
+    show_figure, treemap_figure, waterfall_figure, pie_figure, valuation_boxplot_figure, round_valuations_figure,
+    year_bars_figure, invested_over_time_figure, multiples_figure, invested_figure,
+    invested_vs_multiple_figure, lead_pie_figure, instruments_figure, themed
+)
+from AL_Pages import (
+    DEFAULT_TOP, DEFAULT_MARKETS, DEFAULT_ROUNDS, top_investments, company_totals, realized_investments, top_rows, top_companies,
+    pie_slices, valid_rounds, valuation_summary, round_investments, has_valuations
+)
+from AL_Prefetch import start_prefetch, stop_prefetch, page_value
+from AL_Ledger import load_ledger, company_transactions, ledger_index, ledger_cash_flows, ledger_company_xirr, ledger_portfolio_xirr, ledger_summary
+from AL_Snapshot import SNAPSHOT_EXTENSION, SnapshotError, load_result, snapshot_bytes
+from AL_Workspace import portfolio_names, active_name, portfolio_ingest_key, open_portfolio, switch_portfolio, workspace
+from AL_Profile import profiler, span, breakdown
+from AL_Query import QueryError, run_query, query_index
+from AL_Names import matched_names
+from AL_Worker import start_ingest, cancel_ingest, completed_jobs, running_jobs, ingest_jobs, ingest_progress
+from AL_Ingest import ingest_key, upload_us_dates, ingest_cache, session_result, run_ingest, invalidate_ingest, bump_data_version, group_store, summarize, summary_matches, update_summary, compact_dtypes
 
 st.set_page_config(layout="wide")
 st.title("Startup Data Analyser")
@@ -52,11 +57,20 @@ if 'has_realized_dates' not in st.session_state:
 
 if 'has_angellist_data' not in st.session_state: 
     st.session_state.has_angellist_data = False
+if 'date_format' not in st.session_state:
+    st.session_state.date_format = None
 
 if 'df' not in st.session_state: 
     st.session_state.df = pd.DataFrame()
 if 'df2' not in st.session_state: 
     st.session_state.df2 = pd.DataFrame()
+# Advanced users can profile each rerun - see the panel at the bottom of the sidebar
+if st.session_state.advanced_user and st.session_state.get('profiling', False):
+    profiler().track_memory = st.session_state.get('profile_memory', False)
+    profiler().start_run()
+elif 'profiler' in st.session_state:
+    # Not profiling - this session no longer keeps memory tracing on for the server
+    st.session_state.profiler.track_memory = False
 if 'total_value' not in st.session_state:   
     st.session_state.total_value = 0
 
@@ -67,7 +81,7 @@ with st.sidebar:
         if st.session_state.advanced_user :
             option = st.selectbox(
                 "Choose an option:",
-                ("About", "Load Data", "Overwrite", "Stats", "Top Investments", "Top by Company", "Round", "Market", "Year", "Realized", "Lead Stats", "Leads no values", "Graphs", "Tax")
+                ("About", "Load Data", "Overwrite", "Stats", "Top Investments", "Top by Company", "Round", "Market", "Year", "Realized", "Lead Stats", "Leads no values", "Graphs", "Ask me anything", "Tax")
             )
         else:
             option = st.selectbox(
@@ -82,6 +96,13 @@ with st.sidebar:
     if st.session_state.menu_choice != option:
         st.session_state.menu_choice = option
 
+    # Switch between the loaded portfolios without reprocessing them
+    portfolios = portfolio_names()
+    if len(portfolios) > 1:
+        portfolio = st.selectbox("Portfolio:", portfolios, index=portfolios.index(active_name()))
+        if portfolio != active_name():
+            switch_portfolio(portfolio)
+
 # Perform actions based on the selected option
 if st.session_state.menu_choice == "About" :
     st.subheader("About", divider=True)
@@ -115,72 +136,48 @@ Once complete, all ongoing calculations will be based on this new data.
     st.markdown(multi)
 
     # Add Overwrite button - add the correct logic
-    # Note that doesn't deal with double/triple ups - if that is the case it needs a way of overwriting just the valuation data for the right value
+    # Double/triple ups are matched on Invest Date too so each investment gets the right value
     if st.button("Overwrite Values", type="primary") :
         if st.session_state.has_enhanced_data_file: #Otherwise we have nothing to overwrite with
-            df = st.session_state.df
-            df2 = st.session_state.df2
+            # The loaded data may be shared with other sessions (see ingest_cache) so edit a copy
+            df = st.session_state.df.copy()
+            # Enhancement names matched to the data file's, allowing for small differences (see AL_Names)
+            df2 = matched_names(st.session_state.df2)
             # Check if 'New Value' column exists in df2
             if 'New Value' in df2.columns:
                 # Ensure both dataframes have 'Company/Fund' and have the right fields to match on
                 if all(col in df.columns for col in ['Company/Fund', 'Invest Date']) and all(col in df2.columns for col in ['Company/Fund', 'Match Date']):
-                    # Merge dataframes on 'Company/Fund' to find matching rows
-                    df2['Match Date'] = df2['Match Date'].apply(convert_date)
-                    merged_df = pd.merge(df, df2[['Company/Fund', 'Match Date', 'New Value']], left_on=['Company/Fund','Invest Date'], right_on=['Company/Fund','Match Date'], how='inner', suffixes=('', '_df2'))
-                    # Filter out rows where 'New Value' is not None
-                    rows_to_update = merged_df[merged_df['New Value'].notnull()]
-                    # Create a list to store changes for display
-                    changes_list = []
-
-                    # Update 'Net Value' in df with 'New Value' from df2
-                    for index, row in rows_to_update.iterrows():
-                        # Find the index in df where Company/Fund matches
-                        df_index = df[df['Company/Fund'] == row['Company/Fund']].index[0]
-                        # Store old values
-                        old_net_value = df.loc[df_index, 'Net Value']
-                        old_real_multiple = 0
-                        old_XIRR = 0
-                        if 'Real Multiple' in df.columns :
-                            old_real_multiple = df.loc[df_index, 'Real Multiple']
-                        if 'XIRR' in df.columns :
-                            old_xirr = df.loc[df_index, 'XIRR']
-                        # Recalculate new values - but also they need to be in the right format so we probably need to do all our normalisation code - maybe put it in a separate file somewhere?
-                        df.loc[df_index, 'Net Value'] = float(row['New Value'])
-                        df.loc[df_index, 'Unrealized Value'] = float(row['New Value']) # If don't set this it gets overridden later when calculating everyhing from scratch
-                        df.loc[df_index, 'Real Multiple'] = row['New Value']/df.loc[df_index, 'Invested']
-                        df.loc[df_index, 'XIRR'] = calculate_row_xirr(df.loc[df_index], datetime.now())
-
-                        # Record the change
-                        changes_list.append({
-                            'Company/Fund': df.loc[df_index, 'Company/Fund'],
-                            'Invest Date' : df.loc[df_index, 'Invest Date'],
-                            'Old Value': old_net_value,
-                            'New Value': df.loc[df_index, 'Net Value'],
-                            'Old Real Multiple' :old_real_multiple,
-                            'New Real Multiple' : df.loc[df_index, 'Real Multiple'],
-                            'old_xirr' : old_xirr,
-                            'New XIRR' : df.loc[df_index, 'XIRR']
-                        })
+                    # Join on Company/Fund and Invest Date and overwrite every matching investment at once
+                    with span('overwrite'):
+                        touched, before, changes_df = apply_overwrite(df, df2, datetime.now())
                     # Display the changes in a DataFrame
-                    if changes_list:
+                    if not changes_df.empty:
                         st.write("Values Overwritten (and recalculated values) were as follows")
-                        changes_df = pd.DataFrame(changes_list)
                         st.dataframe(changes_df)
 
-                        # Run the process thing again
-                            # 2. Process all the data
-
-                        df, summary_df, num_uniques, num_leads, num_zero_value_leads, num_locked, st.session_state.has_realized_dates = process_and_summarize_data(df, st.session_state.date_format)
+                        # Update the summary by the change in the overwritten rows where we can,
+                        # otherwise run the process thing again over all the data
+                        summary_df = None
+                        if st.session_state.get('summary_verified', False):
+                            summary_df = update_summary(st.session_state.base_sumdf, before, df.loc[touched], df)
+                        if summary_df is None:
+                            df, summary_df, num_uniques, num_leads, num_zero_value_leads, num_locked, st.session_state.has_realized_dates = summarize(df, st.session_state.has_angellist_data)
+                            df = compact_dtypes(df)
+                            st.session_state.num_uniques = num_uniques
+                            st.session_state.num_leads = num_leads
+                            st.session_state.num_zero_value_leads = num_zero_value_leads
+                            st.session_state.num_locked = num_locked
+                            st.session_state.summary_verified = summary_matches(df, summary_df)
 
                         st.dataframe(df)
                         # Set session state values for other screens
                         st.session_state.total_value = 0 #Reset this so it doesn't carry over from another session
+                        st.session_state.pop('overall_XIRR', None)
                         st.session_state.df = df
-                        st.session_state.sumdf = summary_df
-                        st.session_state.num_uniques = num_uniques
-                        st.session_state.num_leads = num_leads
-                        st.session_state.num_zero_value_leads = num_zero_value_leads
-                        st.session_state.num_locked = num_locked
+                        st.session_state.base_sumdf = summary_df
+                        st.session_state.sumdf = summary_df.copy()
+                        # The session data no longer matches the uploaded file
+                        invalidate_ingest()
                     else:
                         st.write("No changes made. No matching values found or 'New Value' is empty.")
                 else:
@@ -204,8 +201,9 @@ elif st.session_state.menu_choice == "Load Data":
         filepath = "/Users/deepseek/Downloads/Synd.csv"  
         filepath = "/Users/deepseek/Downloads/test_data.csv"  
 
-        df = pd.read_csv(filepath, header=1, skip_blank_lines=True)
-        st.session_state.has_angellist_data = has_angellist_data(filepath)
+        # Development only so not cached - always reprocess the local file
+        open_portfolio(os.path.basename(filepath), run_ingest(filepath))
+        df = st.session_state.df
         
         # if df is not None:
         #     print(f"Is AngelList data: {st.session_state.has_angellist_data}")
@@ -216,8 +214,6 @@ elif st.session_state.menu_choice == "Load Data":
         # if st.session_state.has_angellist_data: 
         #     st.session_state.date_format = "%m/%d/%y" 
 
-        st.session_state.has_data_file = True
-        st.session_state.df = df
         with st.container(height=200):
             st.write(df)       
         df2 = pd.read_csv(r"/Users/deepseek/Downloads/Enhance.csv", header=1, skip_blank_lines=True)
@@ -226,42 +222,108 @@ elif st.session_state.menu_choice == "Load Data":
         with st.container(height=200):
             st.write(df2)       
     else:
-        # Action 1: Load in Data
-        uploaded_file = st.file_uploader("Choose the file in a CSV [AngelList] format", type="csv")
-
-    if force_load == False and uploaded_file is not None:
-        try:
-            df = pd.read_csv(uploaded_file, header=1, skip_blank_lines=True)
-            st.session_state.has_angellist_data = has_angellist_data(uploaded_file)
-
-            # if st.session_state.has_angellist_data: 
-            #     st.session_state.date_format = "%m/%d/%y" 
-
-            st.session_state.has_data_file = True
-            st.session_state.total_value = 0 #Reset this so it doesn't carry over from another session
-            st.session_state.df = df
+        # Action 1: Load in Data - each file is kept as its own portfolio
+        uploaded_files = st.file_uploader("Choose the file(s) in a CSV [AngelList] format", type="csv", accept_multiple_files=True)
+
+    if force_load == False:
+        # Month or day first dates are picked from each file here and passed on with it, so the
+        # shared result is keyed by them too and never depends on what this session last loaded
+        uploads = []
+        for uploaded_file in uploaded_files:
+            us_dates = upload_us_dates(uploaded_file)
+            uploads.append((uploaded_file, us_dates, ingest_key(uploaded_file, us_dates=us_dates)))
+        # Stop processing any file that has been removed or replaced
+        cancel_ingest(keep={(uploaded_file.name, key) for uploaded_file, _, key in uploads})
+    if force_load == False and uploaded_files:
+        # Each file is processed once, on a background thread (see AL_Worker) - reruns with the
+        # same file reuse the cached result and only republish it if its data has been replaced
+        # since (eg by Overwrite)
+        for uploaded_file, us_dates, key in uploads:
+            if portfolio_ingest_key(uploaded_file.name) != key:
+                result = ingest_cache().get(key)
+                if result is not None:
+                    open_portfolio(uploaded_file.name, result, key)
+                else:
+                    start_ingest(uploaded_file.name, key, uploaded_file, us_dates)
+        for job in completed_jobs():
+            open_portfolio(job.name, job.result, job.key)
+        for job in ingest_jobs().values():
+            if job.stage == 'failed':
+                if isinstance(job.error, pd.errors.ParserError):
+                    st.write(f"Error: Could not parse {job.name} as a CSV file. Please ensure it's a valid CSV.")
+                else:
+                    st.write(f"An unexpected error occurred processing {job.name}: {job.error}")
+            elif job.stage == 'cancelled':
+                st.write(f"Processing {job.name} was cancelled - remove the file and add it again to retry.")
+        if running_jobs():
+            ingest_progress()
+
+        # Optionally prepare every page in the background once the data is in (see the end of the script)
+        st.session_state.prefetch_pages = st.checkbox("Prepare all the pages in the background once loaded (faster page switches, uses more memory)",
+                                                      value=st.session_state.get('prefetch_pages', False))
+        if 'prefetch' in st.session_state:
+            done, failed, total = st.session_state.prefetch.progress()
+            st.caption(f"Pages prepared: {done} of {total}" + (f", {failed} failed" if failed else ""))
+            for page, error in st.session_state.prefetch.errors.items():
+                st.caption(f"Couldn't prepare {page} ahead of time ({type(error).__name__}: {error}) - it is built when opened instead")
+
+        if st.session_state.has_data_file:
             with st.container(height=200):
-                st.write(df)
-        except pd.errors.ParserError:
-            st.write(f"Error: Could not parse file as a CSV file. Please ensure it's a valid CSV.")
-        except Exception as e:
-            st.write(f"An unexpected error occurred: {e}")
+                st.write(st.session_state.df)
+        # List the other portfolios and whether they are in memory or have been put on disk
+        if workspace().names():
+            st.write(f"Active portfolio: {active_name()}. Others loaded (pick one from the sidebar):")
+            st.dataframe(pd.DataFrame([workspace().info(name) for name in workspace().names()]).drop(columns='ingest_key'), hide_index=True)
 
     # Optional - Load in Enhancement file if it exists
     if not force_load:
         uploaded_file2 = st.file_uploader("Choose the Enhancement file in a CSV format. The first row is ignored and the first column must be 'Company/Fund' matching exactly, followed by any other columns", type="csv")
     if not force_load and uploaded_file2 is not None:
         try:
-            df2 = pd.read_csv(uploaded_file2, header=1, skip_blank_lines=True)
-            st.session_state.has_enhanced_data_file = True
-            st.session_state.df2 = df2
+            # Only a different file replaces df2 - the pages, charts and snapshot cached against the
+            # data_version are made again for it
+            df2_key = ingest_key(uploaded_file2)
+            if st.session_state.get('df2_key') != df2_key or not st.session_state.has_enhanced_data_file:
+                st.session_state.df2 = pd.read_csv(uploaded_file2, header=1, skip_blank_lines=True)
+                st.session_state.df2_key = df2_key
+                st.session_state.has_enhanced_data_file = True
+                bump_data_version()
             with st.container(height=200):
-                st.write(df2)               
+                st.write(st.session_state.df2)               
         except pd.errors.ParserError:
             st.write("Error: Could not parse file as a CSV file. Please ensure it's a valid CSV.")
         except Exception as e:
             st.write(f"An unexpected error occurred: {e}")
 
+    # Snapshots of the processed data (and Enhancement file) open without reprocessing the CSVs
+    if not force_load:
+        snapshot_file = st.file_uploader("Or open a saved snapshot", type=SNAPSHOT_EXTENSION)
+    if not force_load and snapshot_file is not None:
+        try:
+            key = ingest_key(snapshot_file)
+            if portfolio_ingest_key(snapshot_file.name) != key:
+                result, df2 = ingest_cache().get_or_build(key, lambda: load_result(snapshot_file))
+                open_portfolio(snapshot_file.name, result, key)
+                if df2 is not None:
+                    st.session_state.has_enhanced_data_file = True
+                    st.session_state.df2 = df2
+                    st.session_state.df2_key = key
+        except (SnapshotError, ImportError) as e:
+            st.write(f"Error: Could not open the snapshot. {e}")
+
+    if not force_load and st.session_state.has_data_file:
+        # Only build the file when asked - it is kept until the data changes
+        if st.button("Save snapshot"):
+            df2 = st.session_state.df2 if st.session_state.has_enhanced_data_file else None
+            try:
+                st.session_state.snapshot = (st.session_state.get('data_version'), snapshot_bytes(session_result(), df2))
+            except (ValueError, TypeError, ImportError) as e:
+                # eg an Enhancement column mixing numbers and text, which Arrow can't store
+                st.error(f"Could not save a snapshot. {e}")
+        version, snapshot = st.session_state.get('snapshot', (None, None))
+        if snapshot is not None and version == st.session_state.get('data_version'):
+            st.download_button("Download snapshot", snapshot, file_name=f"{os.path.splitext(active_name())[0]}.{SNAPSHOT_EXTENSION}")
+
     # Add a button to reset the data load
     if force_load :
         if st.button("Reload all Data", type="primary"):
@@ -269,60 +331,32 @@ elif st.session_state.menu_choice == "Load Data":
             st.session_state.has_data_file = False
             st.session_state.has_enhanced_data_file = False
 
-    # Action 2 is all the data normalisation and analysis logic
-    # Only do it if there is data in the data frame otherwise suggest load the data
+    # Action 2 is all the data normalisation and analysis logic - done by the ingest step above
+    # so only offer to move on if there is data loaded otherwise suggest load the data
     if st.session_state.has_data_file:
-        # Set the df locally from the data session
-        df = st.session_state.df
-    
-    # Do all the data processing    
-    # 1. Drop the data we don't analyse for easy display / debugging - 'Round', 'Market', 'Round Size', 'Invest Date', 'Instrument'
-        todrop = { 'Investment Entity', 'Invest Date_y', # This is a special value caused by the outer join - we shouldn't see it! 
-                'Investment Type', 'Fund Name', 'Allocation',  
-                'Valuation or Cap Type', # 'Valuation or Cap', 
-                'Discount', 'Carry', 'Share Class'}
-        # Get the actual column names from the DataFrame
-        df_columns = df.columns
-        # Convert the column names to a set for efficient comparison
-        df_columns_set = set(df_columns)
-        # Create a new set with only the columns that are present in the DataFrame
-        todrop_filtered = {col for col in todrop if col in df_columns_set}
-        # Drop the filtered columns
-        df = df.drop(columns=todrop_filtered)
-
-    # 2. Process all the data
-        df, summary_df, num_uniques, num_leads, num_zero_value_leads, num_locked, st.session_state.has_realized_dates = process_and_summarize_data(df)
-
- #      st.dataframe(summary_df)
- #      print(summary_df)
-
         # Button
         if st.button("Proceed", type="primary"):
             st.session_state.menu_choice = "Stats"
             option = "Stats"
         #   st.experimental_rerun()
 
-        # Set session state values for other screens
-        st.session_state.df = df
-        st.session_state.sumdf = summary_df
-
-        st.session_state.num_uniques = num_uniques
-        st.session_state.num_leads = num_leads
-        st.session_state.num_zero_value_leads = num_zero_value_leads
-        st.session_state.num_locked = num_locked
-
 elif st.session_state.menu_choice == 'Ask me anything':
     st.markdown('''You can ask a question in query format to get an answer on the dataframe.
-Valid operations are on all column names and can use <,>,=   and or 'column name' == "Value"
+Valid operations are on all column names and can use <,>,=   and or `column name` == "Value".
+Totals by a column are written as eg sum Invested by Market (sum, mean, median, min, max or count), optionally followed by where and a query.
 ''')
-    st.markdown("Example questions include:<br>1. What are the top companies?<br>2. How much was invested in total?<br>3. Which market had the most invested in it?", unsafe_allow_html=True)
+    st.markdown("Example questions include:<br>1. Invested > 10000 and Market == 'Fintech'<br>2. `Invest Date` >= '2020-01-01'<br>3. sum Invested by Market where Round == 'Seed'", unsafe_allow_html=True)
 
     if st.session_state.has_data_file:
-        df = st.session_state.df
         query = st.text_input("Enter your query in simple terms")
         if query:
-            answer = df.query(query)
-            st.write(answer) 
+            # Parsed once per query text and answered from indexes kept until the data changes
+            try:
+                with span('query'):
+                    answer = run_query(query_index(), query)
+                st.write(answer)
+            except QueryError as e:
+                st.error(str(e))
 
 elif st.session_state.menu_choice == "Stats":
     st.subheader("Investment Statistics", divider=True)
@@ -346,7 +380,8 @@ elif st.session_state.menu_choice == "Stats":
             st.session_state.sumdf.loc[st.session_state.sumdf['Category'] == 'Locked', 'Value'] += float(locked_value)
             st.session_state.sumdf.loc[st.session_state.sumdf['Category'] == 'Totals', 'Value'] += float(locked_value)
             # Also recalculate Multiple and XIRR too 
-            overall_XIRR = calculate_portfolio_xirr(st.session_state.df, st.session_state.has_realized_dates, sumdf.loc[sumdf['Category'] == 'Totals', 'Unrealized'].iloc[0])
+            with span('xirr: portfolio'):
+                overall_XIRR = portfolio_xirr(st.session_state.df, st.session_state.has_realized_dates, sumdf.loc[sumdf['Category'] == 'Totals', 'Unrealized'].iloc[0])
             st.session_state.overall_XIRR = overall_XIRR
 
     elif st.session_state.num_locked == 0: # This is when there aren't any locked values so just set total_value at the total of Realized and Unrealized (just in case Value not entered correctly)
@@ -368,7 +403,8 @@ elif st.session_state.menu_choice == "Stats":
         # Calculate overall XIRR
         if 'overall_XIRR' not in st.session_state :                    
             #Make sure we feed it the unrealized value 
-            overall_XIRR = calculate_portfolio_xirr(st.session_state.df, st.session_state.has_realized_dates, sumdf.loc[sumdf['Category'] == 'Totals', 'Unrealized'].iloc[0])
+            with span('xirr: portfolio'):
+                overall_XIRR = portfolio_xirr(st.session_state.df, st.session_state.has_realized_dates, sumdf.loc[sumdf['Category'] == 'Totals', 'Unrealized'].iloc[0])
             st.session_state.overall_XIRR = overall_XIRR
             h.metric(label="IRR",value=format_percent(overall_XIRR), border=True)
         else:
@@ -399,104 +435,31 @@ elif st.session_state.menu_choice == "Top Investments":
     ''')
     # Calculate the top X investments by multiple and show information for them
 
-    # Load the data from the session state
+    # Load the data from the session state - the table is worked out once per data version
     df = st.session_state.df
-    filtered_df = df[df['Real Multiple'] > 1]
-    sorted_df = filtered_df.dropna(subset=['Real Multiple']).sort_values(by='Real Multiple', ascending=False)
+    sorted_df = page_value(('Top Investments', 'table'), lambda: top_investments(df))
+    df2 = matched_names(st.session_state.df2) if st.session_state.has_enhanced_data_file else None
 
-    # Write all the outputs to the screen
-    top_filter = st.slider("Show how many",1,len(sorted_df),5)   
+    # Moving the slider reruns only this section - it depends on sorted_df and df2 alone
+    @st.fragment
+    def top_investments_section(sorted_df, df2):
+        # Write all the outputs to the screen
+        top_filter = st.slider("Show how many",1,len(sorted_df),DEFAULT_TOP)   
 
-    # Get ready for screen display - drop columns and format
-    # Drop the filtered columns
-    sorted_df = sorted_df.drop(columns=['Status','Valuation Unknown', 'Multiple', 'Round Size'])
-    
-    # Reorder columns to place 'Real Multiple' and 'XIRR' after 'Company/Fund'
-    cols = sorted_df.columns.tolist()
-    if 'Real Multiple' in cols and 'XIRR' in cols and 'Company/Fund' in cols :
-        cols.remove('Real Multiple')
-        cols.remove('XIRR')
-        company_index = cols.index('Company/Fund')
-        cols.insert(company_index + 1, 'Real Multiple')
-        cols.insert(company_index + 2, 'XIRR')
-        sorted_df = sorted_df[cols]
-    
-    # Get the top X investments
-    top_X_num = sorted_df.head(top_filter)
-    top_X_num.loc[:,'XIRR'] = top_X_num['XIRR']*100
+        # Get the top X investments and merge the Enhancement file using 'Company/Fund' as the key
+        top_X_num = top_rows(sorted_df, top_filter, df2)
+        
+        format_st_editor_block(top_X_num)
 
-    # Merge the cleaned dataset with the sample dataset using 'Company/Fund' as the key
-    if st.session_state.has_enhanced_data_file:
-        enhanced_df = pd.merge(top_X_num, st.session_state.df2, on='Company/Fund', how='left')
-        top_X_num = enhanced_df
-    
-    format_st_editor_block(top_X_num)
-
-    # Show a tree graph that looks nice
-    # Calculate sizes based on Net Value
-    sizes = top_X_num['Net Value']
-    labels = [f"{company}\n({multiple:.1f}x)" for company, multiple in zip(top_X_num['Company/Fund'], top_X_num['Real Multiple'])]
-    colors = plt.cm.viridis(np.linspace(0, 0.8, len(top_X_num)))
-
-    # Create the plot
-    plt.figure(figsize=(12, 8))
-    squarify.plot(sizes=sizes, label=labels, color=colors, alpha=0.8, text_kwargs={'fontsize':10})
-    plt.axis('off')
-    plt.title('Investment Treemap (Size by Net Value, Labels show Multiple)', pad=20)
-    plt.tight_layout()
-    st.pyplot(plt)
-    plt.cla()
+        # Show a tree graph that looks nice - sizes based on Net Value
+        show_figure(('Top Investments', 'treemap', top_filter, df2 is not None),
+                    lambda: treemap_figure(top_X_num['Net Value'], top_X_num['Company/Fund'], top_X_num['Real Multiple']))
+
+    top_investments_section(sorted_df, df2)
 
     # Also show a Waterfall Chart of value created (which isn't limited by the data set)
-    # Filter out values below the 1% threshold
-    threshold = 0.01
-    temp_df = df.copy()
-    temp_df['Val increase'] = temp_df['Net Value'] - temp_df['Invested']
-    total_increase = temp_df['Val increase'].sum()
-    filtered_df = temp_df[temp_df['Val increase'] / total_increase >= threshold]
-
-    # Group the remaining investments by 'Investment' and sum their 'Val increase'
-    others_increase = temp_df[temp_df['Val increase'] / total_increase < threshold]['Val increase'].sum()
-
-    # Create an 'Others' category
-    others_category = pd.DataFrame({'Company/Fund': ['Others'], 'Val increase': [others_increase]})
-    filtered_df = pd.concat([filtered_df, others_category])
-    sorted_df = filtered_df.sort_values(by='Val increase', ascending=False)
-    total_entries = len(sorted_df)
-
-    # Create the waterfall chart
-    fig, ax = plt.subplots(figsize=(10, 6))
-    # Get the labels and values
-    labels = sorted_df['Company/Fund'].tolist()
-    values = sorted_df['Val increase'].tolist()
-    # Plot the waterfall chart
-
-    # Convert values to millions
-    values_millions = [v / 1e6 for v in values]  # Divide each value by 1 million
-
-    # Plot the waterfall chart
-    # Calculate new ylim based on millions
-    total_increase_millions = total_increase / 1e6
-    others_increase_millions = others_increase / 1e6
-    ax.set_ylim(0, total_increase_millions - others_increase_millions)  # Set y-axis limit for clarity
-
-#        ax.set_ylim(0, total_increase - others_increase) # Set y-axis limit for clarity
-    cmap = plt.get_cmap('coolwarm', total_entries)  # Use 'viridis' or any other colormap you like
-    # Initialize the current value at 0 for the first bar
-    current_value = 0
-    for i, (label, value) in enumerate(zip(labels, values_millions)):
-        next_value = current_value + value
-        ax.bar(i, value, bottom=current_value, label=label if i == 0 else "", color=cmap(i), alpha=0.7, width=0.8) # Set label only for the first bar
-        current_value = next_value
-        ax.text(i, current_value*.9, f"${values[i]:,.0f}", ha='center', va='center')
-
-    ax.set_xticks(range(len(labels)))
-    ax.set_xticklabels(labels, rotation=45, ha='right')
-    ax.set_ylabel("Value Increase ($ M)")
-    ax.set_title("Waterfall Chart of Value Increase by Investment (Over 1%)")
-    #plt.legend() # No longer needed since labels are only set for the first bar
-    plt.tight_layout()
-    st.pyplot(fig)  
+    show_figure(('Top Investments', 'waterfall'),
+                lambda: waterfall_figure(df, 'Net Value', "Waterfall Chart of Value Increase by Investment (Over 1%)"))
 
 elif st.session_state.menu_choice == "Top by Company":
     st.subheader("Top Investments aggregated by Company", divider=True)
@@ -510,504 +473,152 @@ You can use the slider to restrict the number of values shown on the screen
     # Load the data from the session state
     df = st.session_state.df
 
-    # Get ready for screen display - drop columns and format
-    # Drop the filtered columns
-    sorted_df = df.drop(columns=['Status','Valuation Unknown', 'Multiple', 'Round Size'])
-
-    # Now aggregate all the investments by Company/Fund and then recalculate IRR and Multiples, Invested Amount, Etc
-    # Gets a little tricky with XIRR but as long as have all dates and amounts it should be okay
-    # Group by 'Company/Fund' and aggregate data
-    if 'URL' in sorted_df.columns:
-        grouped = sorted_df.groupby('Company/Fund').agg(
-            Invested=('Invested', 'sum'),
-            Net_Value=('Net Value', 'sum'),
-            Unrealized=('Unrealized Value', 'sum'),
-            Realized=('Realized Value', 'sum'),
-            First_Invest_Date=('Invest Date', 'min'),  # don't use either of these values yet
-            Last_Invest_Date=('Invest Date', 'max'), # this is the second not used
-            URL=('URL', 'first'),
-        ).reset_index()
-    else:             
-        grouped = sorted_df.groupby('Company/Fund').agg(
-            Invested=('Invested', 'sum'),
-            Net_Value=('Net Value', 'sum'),
-            Unrealized=('Unrealized Value', 'sum'),
-            Realized=('Realized Value', 'sum'),
-            First_Invest_Date=('Invest Date', 'min'),  # don't use either of these values yet
-            Last_Invest_Date=('Invest Date', 'max'), # this is the second not used
-        ).reset_index()
-
-    # Write all the outputs to the screen
-    top_filter = st.slider("Show how many",1,len(grouped),5)  
-    # Add in 'Website/URL' if it is in the df
-    # if 'Website' in df.columns:
-    #     grouped = pd.merge(grouped, df[['Company/Fund', 'Website']], on='Company/Fund', how='inner')
-    # if 'URL' in df.columns:
-    #     grouped = pd.merge(grouped, df[['Company/Fund', 'URL']], on='Company/Fund', how='inner')
-
-    # Calculate 'Real Multiple' and 'XIRR'
-    grouped['Real Multiple'] = grouped['Net_Value'] / grouped['Invested']
-    
+    # Aggregate all the investments by Company/Fund and then recalculate IRR and Multiples, Invested Amount, Etc
     # Calculate 'XIRR' requires us to look at all the values in the data for the company and treat each 
     # entry of investment as an outflow of money and any realization as an inflow but if no realization use 
     # today's date
-    grouped['XIRR'] = 0.0
-    for index, row in grouped.iterrows():
-        # Get all transactions relating to this fund
-        all_transactions = df.loc[df['Company/Fund'] == row['Company/Fund']]
-        # Create a dataframe to store all the transactions
-
-        debug_harness = False
-        if debug_harness: st.write(row['Company/Fund'])
-        if debug_harness: st.write(all_transactions)
-        # Create a list to store all cash flows
-        company_xirr = 0.0
-        if all_transactions['Net Value'].iloc[0] > 0 : # If no positives then doesn't make sense
-            all_cashflows = []
-            for index, row in all_transactions.iterrows():
-                all_cashflows.append((row['Invest Date'], -row['Invested']))
-            
-            # Add the sum of Net value as exit value with time as now
-            total_net_value = all_transactions['Net Value'].sum()
-            if debug_harness: st.write(row)
-            if st.session_state.has_realized_dates and pd.notna(row["Realized Date"]):
-                realized_date = row["Realized Date"]
-                if debug_harness : st.write("Did find a realized date for the row")
-                all_cashflows.append((realized_date, total_net_value))
-            else:
-                all_cashflows.append((datetime.now(), total_net_value))
-            if debug_harness : st.write(all_cashflows)
-            # Calculate the xirr for this row, and store it in the overall dataframe
-            try:
-                # Calculate the XIRR for this company
-                company_xirr = calculate_xirr(all_cashflows)
-            except ValueError:
-                company_xirr = 0.0
-            # Find the correct index to update in 'grouped'
-            if debug_harness : st.write(f"Company XIRR: {company_xirr}")
-
-        company_name = all_transactions['Company/Fund'].iloc[0]  # Get the company name from all_transactions
-        index_to_update = grouped.index[grouped['Company/Fund'] == company_name]
-        grouped.loc[index_to_update[0], 'XIRR'] = company_xirr # Update the first match - should only be one
+    with span('xirr: by company'):
+        grouped = page_value(('Top by Company', 'companies'), lambda: company_totals(df, st.session_state.has_realized_dates, datetime.now()))
 
-    # sort the values
-    sorted_df = grouped.dropna(subset=['Real Multiple']).sort_values(by='Real Multiple', ascending=False)
+    df2 = matched_names(st.session_state.df2) if st.session_state.has_enhanced_data_file else None
 
-    # Get the top X investments
-    top_X_num = sorted_df.head(top_filter)
-    top_X_num.loc[:,'XIRR'] = top_X_num['XIRR']*100
+    # Moving the slider reruns only this section - the XIRRs above aren't worked out again
+    @st.fragment
+    def top_by_company_section(grouped, df2):
+        # Write all the outputs to the screen
+        top_filter = st.slider("Show how many",1,len(grouped),DEFAULT_TOP)  
 
-    # Reorder columns to place 'Real Multiple' and 'XIRR' after 'Company/Fund'
-    cols = top_X_num.columns.tolist()
-    if 'Real Multiple' in cols and 'XIRR' in cols and 'Company/Fund' in cols :
-        cols.remove('Real Multiple')
-        cols.remove('XIRR')
-        company_index = cols.index('Company/Fund')
-        cols.insert(company_index + 1, 'Real Multiple')
-        cols.insert(company_index + 2, 'XIRR')
-        top_X_num = top_X_num[cols]
-
-    if st.session_state.has_enhanced_data_file:
-        enhanced_df = pd.merge(top_X_num, st.session_state.df2, on='Company/Fund', how='left')
-        top_X_num = enhanced_df
-
-    # Display results in an editor block    
-    format_st_editor_block(top_X_num)
+        # Get the top X investments
+        top_X_num = top_rows(top_companies(grouped), top_filter, df2)
 
-    # Show a tree graph that looks nice
-    # Calculate sizes based on Net Value
-    # First remove zero numbers as they can't be plotted
-    top_X_num = top_X_num[top_X_num['Net_Value'] > 0]
+        # Display results in an editor block    
+        format_st_editor_block(top_X_num)
 
-    sizes = top_X_num['Net_Value']
+        # Show a tree graph that looks nice
+        # Calculate sizes based on Net Value
+        # First remove zero numbers as they can't be plotted
+        top_X_num = top_X_num[top_X_num['Net_Value'] > 0]
 
-    labels = [f"{company}\n({multiple:.1f}x)" for company, multiple in zip(top_X_num['Company/Fund'], top_X_num['Real Multiple'])]
-    colors = plt.cm.viridis(np.linspace(0, 0.8, len(top_X_num)))
+        show_figure(('Top by Company', 'treemap', top_filter, df2 is not None),
+                    lambda: treemap_figure(top_X_num['Net_Value'], top_X_num['Company/Fund'], top_X_num['Real Multiple']))
 
-    # Create the plot
-    plt.figure(figsize=(12, 8))
-    squarify.plot(sizes=sizes, label=labels, color=colors, alpha=0.8, text_kwargs={'fontsize':10})
-    plt.axis('off')
-    plt.title('Investment Treemap (Size by Net Value, Labels show Multiple)', pad=20)
-    plt.tight_layout()
-    st.pyplot(plt)
-    plt.cla()
+    top_by_company_section(grouped, df2)
 
     # Also show a Waterfall Chart of value created (which isn't limited by the data set)
-    # Filter out values below the 1% threshold
-    threshold = 0.01
-    temp_df = grouped.copy() # So we are playing with aggregated values here
-    # Have to groupby again
-    temp_df['Val increase'] = temp_df['Net_Value'] - temp_df['Invested']
-    total_increase = temp_df['Val increase'].sum()
-    filtered_df = temp_df[temp_df['Val increase'] / total_increase >= threshold]
-
-    # Group the remaining investments by 'Investment' and sum their 'Val increase'
-    others_increase = temp_df[temp_df['Val increase'] / total_increase < threshold]['Val increase'].sum()
-
-    # Create an 'Others' category
-    others_category = pd.DataFrame({'Company/Fund': ['Others'], 'Val increase': [others_increase]})
-    filtered_df = pd.concat([filtered_df, others_category])
-    sorted_df = filtered_df.sort_values(by='Val increase', ascending=False)
-    total_entries = len(sorted_df)
-
-    # Create the waterfall chart
-    fig, ax = plt.subplots(figsize=(10, 6))
-    # Get the labels and values
-    labels = sorted_df['Company/Fund'].tolist()
-    values = sorted_df['Val increase'].tolist()
-    # Plot the waterfall chart
-
-    # Convert values to millions
-    values_millions = [v / 1e6 for v in values]  # Divide each value by 1 million
-
-    # Plot the waterfall chart
-    # Calculate new ylim based on millions
-    total_increase_millions = total_increase / 1e6
-    others_increase_millions = others_increase / 1e6
-    ax.set_ylim(0, total_increase_millions - others_increase_millions)  # Set y-axis limit for clarity
-
-#        ax.set_ylim(0, total_increase - others_increase) # Set y-axis limit for clarity
-    cmap = plt.get_cmap('coolwarm', total_entries)  # Use 'viridis' or any other colormap you like
-    # Initialize the current value at 0 for the first bar
-    current_value = 0
-    for i, (label, value) in enumerate(zip(labels, values_millions)):
-        next_value = current_value + value
-        ax.bar(i, value, bottom=current_value, label=label if i == 0 else "", color=cmap(i), alpha=0.7, width=0.8) # Set label only for the first bar
-        current_value = next_value
-        ax.text(i, current_value*.9, f"${values[i]:,.0f}", ha='center', va='center')
-
-    ax.set_xticks(range(len(labels)))
-    ax.set_xticklabels(labels, rotation=45, ha='right')
-    ax.set_ylabel("Value Increase ($ M)")
-    ax.set_title('Value Increase by Investment (showing > 1%)')
-    #plt.legend() # No longer needed since labels are only set for the first bar
-    plt.tight_layout()
-    st.pyplot(fig)
+    # So we are playing with aggregated values here
+    show_figure(('Top by Company', 'waterfall'),
+                lambda: waterfall_figure(grouped, 'Net_Value', 'Value Increase by Investment (showing > 1%)'))
 
 elif st.session_state.menu_choice == "Round":
     # prompt: Create a pie graph of summarised data that is aggregated by Round and sums the Invested amount
     st.subheader("Round Stats", divider=True)
     st.markdown("Show statistics related to rounds of investment")
 
-    # define the round order to use to reset things as required
-    # could use this for filtering/sorting and display order of round data for AngelList for example but have to check that none are missing or it won't display them
-    round_order = ['Preseed', 'Pre-Seed', 'Seed', 'Seed+', 'Series A', 'Series A+','Series B', 'Series B+', 'Series C', 'Other']
-    # Group by 'Round' and sum 'Invested'
-    temp_df = st.session_state.df.copy()
-    all_rounds = temp_df['Round'].unique()
-
-    temp_df["Increase"] = temp_df["Net Value"] - temp_df["Invested"]    
-    grouped = temp_df.groupby("Round", as_index=False).agg({"Invested":"sum", "Increase":"sum"})
-    grouped['Round'] = pd.Categorical(grouped['Round'], categories=round_order, ordered=True)
-    grouped.sort_values('Round', inplace=True)
-
-    invested_sum = grouped["Invested"].sum()
-    value_sum = grouped[grouped["Increase"] > 0]["Increase"].sum()
-    grouped["Perc by Invested"] = grouped["Invested"]/invested_sum if invested_sum !=0 else 0
-    grouped["Perc by Increase"] = grouped["Increase"]/value_sum if invested_sum !=0 else 0
-    # Get median data
-#    median_by_round = temp_df.groupby('Round')['Valuation or Cap'].median()
-#    grouped = grouped.merge(median_by_round.rename('Median Round Price'), on='Round', how='left')
-    overall_median = temp_df['Valuation or Cap'].median()
-
-    # Create a new column in the grouped dataframe to store the examples
-    grouped["Examples"] = ""
-    # Iterate through unique rounds and update the "Examples" column
-    for round_name in temp_df["Round"].unique():
-        examples = show_top_X_increase_and_multiple(temp_df, round_name, 'Round')
-        grouped.loc[grouped["Round"] == round_name, "Examples"] = examples
+    # Invested and Increase by Round were worked out at ingest, copy before adding the display columns
+    df = st.session_state.df
+    groups = group_store()
+    grouped = groups['round'].copy()
+
+    # Top companies by Increase for each round
+    grouped["Examples"] = groups['examples']['Round'].reindex(grouped["Round"]).fillna("").to_numpy()
 
     grouped_styled = grouped.style.format({'Perc by Invested': format_percent, 'Perc by Increase': format_percent, 'Invested': format_currency, 'Increase': format_currency, 'Median Round Price': format_large_number})
     st.dataframe(grouped_styled, hide_index=True)
 
-    # Limited the data displayed
-    sorted_df = grouped.sort_values(by='Invested', ascending=False)
-
     # Create the pie chart showing Invested
-    plt.figure(figsize=(8, 8))
-    plt.pie(sorted_df["Invested"], labels=sorted_df["Round"], autopct='%1.1f%%', startangle=90)
-    plt.title('Investment Amount by Round')
-    plt.axis('equal')  # Equal aspect ratio ensures that pie is drawn as a circle.
-    st.pyplot(plt)
-
-    # Create the pie chart showing Value
-    # set all values to 0 that are negative
-    grouped.loc[grouped["Increase"] < 0, "Increase"] = 0
-    # Limited the data displayed
-    sorted_df = grouped.sort_values(by='Increase', ascending=False)
-
-    plt.figure(figsize=(8, 8))
-    plt.pie(grouped["Increase"], labels=grouped["Round"], autopct='%1.1f%%', startangle=90)
-    plt.title('Value created by Round')
-    plt.axis('equal')  # Equal aspect ratio ensures that pie is drawn as a circle.
-    st.pyplot(plt)
+    sorted_df = pie_slices(groups['round'], 'Invested')
+    show_figure(('Round', 'invested pie'), lambda: pie_figure(sorted_df["Invested"], sorted_df["Round"], 'Investment Amount by Round'))
+
+    # Create the pie chart showing Value - negative values count as 0
+    value_df = pie_slices(groups['round'], 'Increase', sort=False)
+    show_figure(('Round', 'value pie'), lambda: pie_figure(value_df["Increase"], value_df["Round"], 'Value created by Round'))
 
     # Graph the valuation material
-    if 'Valuation or Cap' not in temp_df.columns or temp_df['Valuation or Cap'].isnull().all():
+    if not has_valuations(df):
         st.write("Data contains no 'Valuation or Cap' data.")
     else:
-        # Create a figure with two subplots - one for the box plot and one for the individual points
-        valid_rounds = temp_df['Round'].dropna().unique()
-        valid_round_order = [round_name for round_name in round_order if round_name in valid_rounds]
-
-        top_filter = st.slider("Last round to display in graphs (for readability) categories",1,len(valid_round_order),3)  
-
-        valid_round_order_abridged = valid_round_order[:top_filter]
-
-        fig, ax = plt.subplots(figsize=(12, 8))
-        #gridspec_kw={'height_ratios': [2, 1]})
-        # 1. First subplot: Box plot with individual points
-    #    sns.boxplot(x='Round', y='Valuation or Cap', data=temp_df[temp_df['Round'].isin(valid_rounds)], order=valid_round_order,
-        sns.boxplot(x='Round', y='Valuation or Cap', data=temp_df, order=valid_round_order_abridged,
-                showfliers=False, ax=ax, hue='Round', palette='pastel', legend=False)
-        # Add swarm plot to show individual data points
-    #    sns.swarmplot(x='Round', y='Valuation or Cap', data=temp_df[temp_df['Round'].isin(valid_rounds)], order=valid_round_order,
-        sns.swarmplot(x='Round', y='Valuation or Cap', data=temp_df, order=valid_round_order_abridged,
-                    size=8, color='darkblue', alpha=0.7, ax=ax)
-
-        # Add the overall median line
-        ax.axhline(y=overall_median, color='red', linestyle='--', 
-                label=f'Overall Median: ${overall_median:,.0f}')
-
-        # Format y-axis to show in millions
-        def millions(x, pos):
-            return f'${x/1000000:.1f}M'
-        ax.yaxis.set_major_formatter(FuncFormatter(millions))
-        #ax.set_xticklabels(valid_round_order)
-        
-        # Add title and labels
-        ax.set_title('Valuation or Cap by Investment Round with Individual Data Points', fontsize=14)
-        ax.set_xlabel('Investment Round', fontsize=12)
-        ax.set_ylabel('Valuation or Cap', fontsize=12)
-        ax.legend()
+        valid_round_order = valid_rounds(groups)
+
+        # The slider and the round selector each rerun only their own chart
+        @st.fragment
+        def valuation_boxplot_section(df, valid_round_order, overall_median):
+            # Box plot of the individual points for the earliest rounds
+            top_filter = st.slider("Last round to display in graphs (for readability) categories",1,len(valid_round_order),DEFAULT_ROUNDS)  
 
-        plt.tight_layout()
-        st.pyplot(fig)
-        plt.cla()
+            valid_round_order_abridged = valid_round_order[:top_filter]
+            show_figure(('Round', 'valuation boxplot', top_filter),
+                        lambda: valuation_boxplot_figure(df, valid_round_order_abridged, overall_median))
+
+        @st.fragment
+        def round_valuations_section(df, valid_round_order, summary_df):
+            # Now display a slider that allows us to select specific rounds to examine each investment valuation in that range
+            round_filter = st.pills("Select the round to analyse further", options=valid_round_order, default=valid_round_order[0]) 
+            if round_filter is None:
+                return
+            filtered_round_investments = round_investments(df, round_filter)
+
+            # Calculate the median value
+            median_val = summary_df.loc[summary_df['Round'] == round_filter, 'Median'].iloc[0]
+
+            show_figure(('Round', 'valuation scatter', round_filter),
+                        lambda: round_valuations_figure(filtered_round_investments, round_filter, median_val))
+
+        valuation_boxplot_section(df, valid_round_order, groups['median_valuation'])
 
         # Also print a summary of the data
         st.write("Summary of Valuation/Cap by Round:")
-        # Create a summary DataFrame
-        summary_data = []
-        for round_name in valid_round_order:
-            round_data = temp_df[temp_df['Round'] == round_name]
-            if len(round_data) > 0:
-                median_val = round_data['Valuation or Cap'].median()
-                min_val = round_data['Valuation or Cap'].min()
-                max_val = round_data['Valuation or Cap'].max()
-                if pd.isna(median_val): median_val = 0
-                if pd.isna(min_val): min_val = 0
-                if pd.isna(max_val): max_val = 0
-                count = len(round_data)
-                summary_data.append({
-                    "Round": round_name,
-                    "Count": count,
-                    "Median": median_val,
-                    "Min": min_val,
-                    "Max": max_val
-                })
-            else:
-                summary_data.append({"Round": round_name, "Count": 0, "Median": 0, "Min": 0, "Max": 0 })
-
-        # Create a data frame with the summary data
-        summary_df = pd.DataFrame(summary_data)
-        overall_min = summary_df["Min"].min()
-        overall_max = summary_df["Max"].max()
-        total_row = pd.DataFrame([["Total", temp_df["Round"].size, overall_median, overall_min, overall_max]], columns=summary_df.columns)
-        summary_df = pd.concat([summary_df, total_row], ignore_index=True)
-        summary_df['Round'] = pd.Categorical(summary_df['Round'], categories=round_order + ['Total'], ordered=True)
-
-        #summary_df.loc[len(summary_df)] = ["Total", temp_df["Round"].size, overall_median, overall_min, overall_max]
-        summary_df = summary_df.sort_values("Round")
+        summary_df = valuation_summary(df, groups)
         st.dataframe(summary_df.style.format({'Median': format_large_number, 'Min': format_large_number, 'Max': format_large_number}), hide_index=True)
 
-        # Now display a slider that allows us to select specific rounds to examine each investment valuation in that range
-        round_filter = st.pills("Select the round to analyse further", options=valid_round_order, default=valid_round_order[0]) 
-        filtered_round_investments = temp_df[temp_df['Round'] == round_filter]
-        filtered_round_investments = filtered_round_investments.sort_values(by='Invest Date')
-        # Drop no valuation or cap data ones - because we can't plot them anyway!
-        filtered_round_investments = filtered_round_investments.dropna(subset=['Valuation or Cap'])
-
-        # Create a scatter plot for 'Valuation or Cap' with company names as labels and add a median line
-        fig2, ax2 = plt.subplots(figsize=(12, 8))
-        sns.scatterplot(data=filtered_round_investments, x='Invest Date', y='Valuation or Cap', s=100)
-        # Calculate the median value
-        median_val = summary_df.loc[summary_df['Round'] == round_filter, 'Median'].iloc[0]
-        
-        # Prepare data for trendline
-        X = np.arange(len(filtered_round_investments)).reshape(-1, 1)  # X as index
-        Y = filtered_round_investments['Valuation or Cap']
-        weights = filtered_round_investments['Invested']  # This should be numeric
-        
-               # Fit the model
-        model = LinearRegression()
-        model.fit(X, Y, sample_weight=weights)
-        trendline = model.predict(X)
-
-        # Show the median line
-        ax2.axhline(median_val, color='red', linestyle='--', label='Median Valuation')
-
-        # Plot the trendline
-        ax2.plot(filtered_round_investments['Invest Date'], trendline, color='blue', label='Trendline', linewidth=1)
-
-        # Add labels for each company
-        for i in range(filtered_round_investments.shape[0]):
-            ax2.text(x=filtered_round_investments['Invest Date'].iloc[i], y=filtered_round_investments['Valuation or Cap'].iloc[i],
-                    s=filtered_round_investments['Company/Fund'].iloc[i], fontsize=9, ha='right')
-
-#        # Format x-axis labels as "Month Year"
-#        st.write(filtered_round_investments)
-#        def format_display_date(x,pos):
-#            st.write(x, x.strftime('%b %Y'), pd.to_datetime(x).strftime('%b %Y'))
-#            return pd.to_datetime(x).strftime('%b %Y')
-#       ax2.xaxis.set_major_formatter(FuncFormatter(format_display_date))
-
-        # Format y-axis to show in millions
-        ax2.tick_params(axis='x', labelrotation=45)
-
-        ax2.yaxis.set_major_formatter(FuncFormatter(millions))
-        ax2.set_title('Valuation/Cap for ' + round_filter + ' Round Investments with Median and Investment amount weighted TrendLine')
-        ax2.set_xlabel('Investment Date')
-        ax2.set_ylabel('Valuation or Cap ($M)')
-        ax2.grid(True)
-        ax2.legend()
-        plt.tight_layout()
-        st.pyplot(fig2)
+        round_valuations_section(df, valid_round_order, summary_df)
 
 elif st.session_state.menu_choice == "Market":
     st.subheader("Market Stats", divider=True)
     st.markdown("Show statistics related to markets invested in")
 
-    temp_df = st.session_state.df.copy()
-    temp_df["Increase"] = temp_df["Net Value"] - temp_df["Invested"]    
-    grouped = temp_df.groupby("Market", as_index=False).agg({"Invested":"sum", "Increase":"sum"})
-    top_filter = st.slider("Show how many in graphs",1,len(grouped),8) 
-
-    invested_sum = grouped["Invested"].sum()
-    value_sum = grouped[grouped["Increase"] > 0]["Increase"].sum()
-    grouped["Invested %"] = grouped["Invested"]/invested_sum if invested_sum !=0 else 0
-    grouped["Increase %"] = grouped["Increase"]/value_sum if invested_sum !=0 else 0
-
-    # Create a new column in the grouped dataframe to store the examples
-    grouped["Examples"] = ""
+    df = st.session_state.df
+    groups = group_store()
+    grouped = groups['market'].copy()
 
-    # Iterate through unique rounds and update the "Examples" column
-    for round_name in temp_df["Market"].unique():
-        examples = show_top_X_increase_and_multiple(temp_df, round_name, 'Market')
-        grouped.loc[grouped["Market"] == round_name, "Examples"] = examples
+    # Top companies by Increase for each market
+    grouped["Examples"] = groups['examples']['Market'].reindex(grouped["Market"]).fillna("").to_numpy()
  
     grouped_styled = grouped.style.format({'Invested %': format_percent, 'Increase %': format_percent, 'Invested': format_currency, 'Increase': format_currency})
     st.dataframe(grouped_styled, hide_index=True)
 
-    # Limited the data displayed
-    sorted_df = grouped.sort_values(by='Invested', ascending=False)
-    filtered_grouped = sorted_df.head(top_filter)
+    # The slider only limits the graphs so moving it reruns just them, not the table above
+    @st.fragment
+    def market_pies_section(market):
+        top_filter = st.slider("Show how many in graphs",1,len(market),DEFAULT_MARKETS) 
 
-    # Create the pie chart showing Invested
-    plt.figure(figsize=(8, 8))
-    plt.pie(filtered_grouped["Invested"], labels=filtered_grouped["Market"], autopct='%1.1f%%', startangle=90)
-    plt.title('Investment Amount by Market')
-    plt.axis('equal')  # Equal aspect ratio ensures that pie is drawn as a circle.
-    st.pyplot(plt)
-
-    # Create the pie chart showing Value
-    # set all values to 0 that are negative
-    grouped.loc[grouped["Increase"] < 0, "Increase"] = 0
-    sorted_df = grouped.sort_values(by='Increase', ascending=False)
-    filtered_grouped = sorted_df.head(top_filter)
-
-    plt.figure(figsize=(8, 8))
-    plt.pie(filtered_grouped["Increase"], labels=filtered_grouped["Market"], autopct='%1.1f%%', startangle=90)
-    plt.title('Value created by Market')
-    plt.axis('equal')  # Equal aspect ratio ensures that pie is drawn as a circle.
-    st.pyplot(plt)
+        # Create the pie chart showing Invested - limited the data displayed
+        invested_df = pie_slices(market, 'Invested', top_filter)
+        show_figure(('Market', 'invested pie', top_filter), lambda: pie_figure(invested_df["Invested"], invested_df["Market"], 'Investment Amount by Market'))
+
+        # Create the pie chart showing Value - negative values count as 0
+        value_df = pie_slices(market, 'Increase', top_filter)
+        show_figure(('Market', 'value pie', top_filter), lambda: pie_figure(value_df["Increase"], value_df["Market"], 'Value created by Market'))
+
+    market_pies_section(groups['market'])
 
 elif st.session_state.menu_choice == "Year":
     st.subheader("Yearly Stats", divider=True)
     st.markdown("Yearly investment statistics")
 
-    temp_df = st.session_state.df.copy()
-
-    # Clean 'Invest Date' column
-    if 'Invest Date' in temp_df.columns:
-        temp_df['Year'] = temp_df['Invest Date'].dt.year
-
-    # Group by year
-    if 'Year' in temp_df.columns:
-        summary_df = temp_df.groupby('Year').agg(
-            Investments=('Year', 'count'),
-            Leads=('Lead', 'nunique'),
-            Invested=('Invested', 'sum'),
-            Value=('Net Value', 'sum'),
-            Avg = ('Invested', 'mean'),
-            Min=('Invested', 'min'),
-            Max=('Invested', 'max')
-        ).reset_index()
-
-        summary_df['Multiple'] = summary_df['Value']/summary_df['Invested']
+    df = st.session_state.df
+
+    # Yearly figures were worked out at ingest
+    if 'Invest Date' in df.columns:
+        summary_df = group_store()['year']
         formatted_summary_df = summary_df.style.format({'Multiple': format_multiple, 'Invested': format_currency, 'Value': format_currency, 'Min': format_currency, 'Max': format_currency, 'Avg': format_currency})
         st.dataframe(formatted_summary_df, hide_index=True)
 
         # Display a nice graph
-        fig, ax1 = plt.subplots(figsize=(12, 6))
-        # Bar plot for Invested Amount and Value against each other with multiple displayed
-        ax1.bar(summary_df['Year'], summary_df['Value'], color='green', label='Net Value')  # Adjust alpha for visibilit
-        ax1.set_xlabel('Investment Year')
-        ax1.set_ylabel('Invested Amount', color='skyblue')
-        ax1.tick_params(axis='y', labelcolor='skyblue')
-        ax1.set_xticks(summary_df['Year']) # Set x-ticks to years
-        ax1.bar(summary_df['Year'], summary_df['Invested'], color='skyblue', label='Invested Amount', alpha=0.5)
-        # Add annotations for Multiple values on top of the bars
-        for i, multiple in enumerate(summary_df['Multiple']):
-            ax1.text(summary_df['Year'][i], summary_df['Value'][i], f'{multiple:.2f} x', ha='center', va='bottom')
-        # Combine legends
-        lines, labels = ax1.get_legend_handles_labels()
-        #lines2, labels2 = ax2.get_legend_handles_labels()
-        ax1.legend(lines, labels, loc='upper right')
-
-        plt.title('Analysis by Year')
-        st.pyplot(plt)
+        show_figure(('Year', 'bars'), lambda: year_bars_figure(summary_df))
         
         # Show the second graph of Investments over time
         # prompt: Sort df by Invest Date. Graph invest date by amount and show it as a scatterpot using Seaborn. Also on the right hand axis show the cumulative amount invested over time as bars representing a month of time
-        import matplotlib.ticker as mtick
-
-        # Sort by Invest Date before calculating cumulative sum
-        temp_df.sort_values(by='Invest Date', inplace=True)
-        # Calculate cumulative investment
-        temp_df['Cumulative Invested'] = temp_df['Invested'].cumsum()        
-            # Create the figure and axes
-        fig, ax1 = plt.subplots(figsize=(12, 6))
-        # Plot the scatter plot on the first axis
-        sns.scatterplot(x='Invest Date', y='Invested', data=temp_df, ax=ax1, label='Investment Amount', color="blue")
-        ax1.set_xlabel('Date of Investment')
-        ax1.set_ylabel('Amount Invested', color='blue')
-        ax1.tick_params(axis='y', labelcolor='blue')
-        # Create a second y-axis for the cumulative investment
-        ax2 = ax1.twinx()
-        # Calculate monthly cumulative investments
-        df_monthly = temp_df.groupby(pd.Grouper(key='Invest Date', freq='ME'))['Cumulative Invested'].last().reset_index()
-        # Plot the cumulative investment as bars on the second axis
-        ax2.bar(df_monthly['Invest Date'], df_monthly['Cumulative Invested'], width=25, color="orange", alpha = 0.5, label='Cumulative Investment')
-        ax2.set_ylabel('Cumulative Amount Invested', color='orange')
-        ax2.tick_params(axis='y', labelcolor='orange')
-        # Format y-axis ticks as currency
-        formatter = mtick.FormatStrFormatter('$%1.0f')
-        ax1.yaxis.set_major_formatter(formatter)        
-        ax2.yaxis.set_major_formatter(formatter)
-        # Set title and rotate x-axis labels
-        plt.title('Investment amount over time')
-        plt.xticks(rotation=45)
-        # Add legends
-        lines, labels = ax1.get_legend_handles_labels()
-        lines2, labels2 = ax2.get_legend_handles_labels()
-        # Only show one legend
-        ax1.get_legend().remove()
-        ax2.legend(lines + lines2, labels + labels2, loc='upper center')
-        # Improve layout
-        plt.tight_layout()
-        st.pyplot(fig)        
+        show_figure(('Year', 'over time'), lambda: invested_over_time_figure(df))
     else:
         st.write("Error: 'Invest Date' or 'Value' column not found in DataFrame.")
 
@@ -1018,49 +629,20 @@ elif st.session_state.menu_choice == "Lead Stats":
     # Load the data from the session state
     df = st.session_state.df
 
-    # now group them by Lead and calculate the average multiple
-    aggregated_df = df.groupby('Lead').agg(
-                Investments=('Company/Fund', 'size'),
-                Invested=('Invested', 'sum'),
-                Unrealized=('Unrealized Value', 'sum'),
-                Invested_avg=('Invested', 'mean'),
-                Value=('Unrealized Value', 'sum')
-    ).reset_index()
+    # Grouped by Lead with the average multiple and realised count at ingest
+    aggregated_df = group_store()['lead']
 
     top_filter = st.slider("Show how many",1,len(aggregated_df),5)   
     # Exclude where no value as sum (result would be infinite)
     #aggregated_df = aggregated_df[aggregated_df["sum_value"] != 0]
-
-    # Calculate average multiple
-    aggregated_df['Multiple'] = (aggregated_df['Value'] / aggregated_df['Invested'])
-
-    # Get the realised count
-    # Filter for rows where Status is 'Realized'
-    realized_df = df[df['Status'] == 'Realized']
-    # Group by Lead and count the number of rows
-    realized_counts = realized_df.groupby('Lead').size().reset_index(name='num_Realized')
-    # Merge the realized counts back into the aggregated DataFrame
-    aggregated_df = pd.merge(aggregated_df, realized_counts, on='Lead', how='left').fillna(0)
-
-    aggregated_df['Realised %'] = aggregated_df['num_Realized']/aggregated_df['Investments']
-    aggregated_df['num_Realized'] = aggregated_df['num_Realized'].astype(int)
     # Take top values
     top_X_num = aggregated_df.nlargest(top_filter, 'Multiple')
 
-    # Shows the companies with the top multiples in 'Company (X.X)x, ...' format by matching on the Lead = mname
-    # Not sure how to generalise this but if I can then can reduce file size
-
-    # Create a new column in the grouped dataframe to store the examples
-    top_X_num["Best"] = ""
-    top_X_num["Worst"] = ""
-
-    # Iterate through unique rounds and update the "Examples" column
-    topX = 4
-    for lead_name in top_X_num["Lead"].unique():
-        examples = show_top_X_names_based_on_multiple_by_Lead(topX, df, lead_name)
-        top_X_num.loc[top_X_num["Lead"] == lead_name, "Best"] = examples
-        examples = show_realised_based_on_Lead(topX, df, lead_name)
-        top_X_num.loc[top_X_num["Lead"] == lead_name, "Worst"] = examples
+    # Shows the companies with the top multiples in 'Company (X.XXx), ...' format for each Lead,
+    # and the worst of their realised ones - worked out for every lead at once at ingest
+    examples = group_store()['examples']
+    top_X_num["Best"] = examples['Best'].reindex(top_X_num["Lead"]).fillna("").to_numpy()
+    top_X_num["Worst"] = examples['Worst'].reindex(top_X_num["Lead"]).fillna("").to_numpy()
 
     # Reorder columns to place 'Real Multiple' and 'XIRR' after 'Company/Fund'
     cols = top_X_num.columns.tolist()
@@ -1084,12 +666,7 @@ elif st.session_state.menu_choice == "Leads no values":
 
     # Calculate the percentage of companies with 'Locked' in the 'Net Value' column for each deal lead and identifies the lead with the highest percentage
     # Group by Lead and aggregate investment count, average Invested, average Multiple and locked percentage
-    grouped = df.groupby('Lead').agg(
-        total_investments=('Company/Fund', 'size'),
-        avg_invested=('Invested', 'mean'),
-        sum_invested=('Invested', 'sum'),
-        locked_count=('Valuation Unknown', 'sum')
-    ).reset_index()
+    grouped = group_store()['locked'].copy()
 
     # Add locked %
     grouped['locked_percentage'] = 100 * grouped['locked_count'] / grouped['total_investments']
@@ -1113,28 +690,19 @@ elif st.session_state.menu_choice == "Leads no values":
 elif st.session_state.menu_choice == "Realized":
     st.subheader("Realized Investments", divider=True)
     st.markdown("Show all the deals that were exited either as a full loss (Dead) or with a (partial) return of capital as recorded by AngelList")
-    st.markdown("Note that IRR has not been recalculated here based on actual exit dates")
+    if st.session_state.has_finance_data_file:
+        st.markdown("Ledger XIRR is recalculated from the actual dated cash flows in the finance file loaded on the Tax page")
+    else:
+        st.markdown("Note that IRR has not been recalculated here based on actual exit dates (load the finance file on the Tax page to do that)")
     
     # Load the data from the session state
     df = st.session_state.df
-
-    # Find rows where 'Status' is 'Realized' or 'Dead' - note not using Dead any more
-    status_realized_or_dead = df[df['Status'].isin(['Realized', 'Dead'])]
-
-    # Calculate profit and loss and Real Multiple (can be inaccurate in AngelList)
-    result_a = status_realized_or_dead.copy()
-    result_a["Profit"] = result_a["Realized Value"] - result_a["Invested"]
-    result_a['Real Multiple'] = result_a['Realized Value']/result_a['Invested']
-    result_sorted = result_a.sort_values(by='Real Multiple', ascending=False)        
-
-    # reorder some columns
-    # insert Multiple after and remove the prior position 
+    result_sorted = realized_investments(df)
     name_column_index = result_sorted.columns.get_loc('Company/Fund')
-    result_sorted.insert(name_column_index+1, 'Lead', result_sorted.pop('Lead'))
-    result_sorted.insert(name_column_index+1, 'XIRR', result_sorted.pop('XIRR'))
-    result_sorted.insert(name_column_index+1, 'Profit', result_sorted.pop('Profit'))
-    result_sorted.insert(name_column_index+1, 'Real Multiple', result_sorted.pop('Real Multiple'))
-    result_sorted['XIRR']=result_sorted['XIRR']*100 # For display only
+    if st.session_state.has_finance_data_file:
+        with span('xirr: ledger by company'):
+            ledger_xirr = ledger_company_xirr(ledger_cash_flows(matched_names(st.session_state.df3)), df)
+        result_sorted.insert(name_column_index+2, 'Ledger XIRR', ledger_xirr.reindex(result_sorted['Company/Fund'].astype(str)).to_numpy()*100)
 
     # Put in the summary analysis to help people understand what is happening here
     #display_text = f"Successful exits: turned ${st.session_state.invested_realised_1x:,.2f} into ${st.session_state.value_realised_1x:,.2f} a {(st.session_state.value_realised_1x/st.session_state.invested_realised_1x):.1f}x multiple" 
@@ -1144,7 +712,7 @@ elif st.session_state.menu_choice == "Realized":
     st.text("Note that other amounts may have been realised but those investments aren't fully realised yet - eg partial earn outs")
 
     if st.session_state.has_enhanced_data_file:
-        enhanced_df = pd.merge(result_sorted, st.session_state.df2, on='Company/Fund', how='left')
+        enhanced_df = pd.merge(result_sorted, matched_names(st.session_state.df2), on='Company/Fund', how='left')
         # enhanced needs to be resorted too
         enhanced_df.insert(name_column_index+1, 'Comment', enhanced_df.pop('Comment'))
         enhanced_df.insert(name_column_index+1, 'AngelList URL', enhanced_df.pop('AngelList URL'))
@@ -1160,8 +728,7 @@ elif st.session_state.menu_choice == "Graphs":
     # Load the data from the session state
     df = st.session_state.df
 
-    # set themes and sizes - note I couldn't display it neatly
-    sns.set_theme()
+    # The charts use the seaborn theme (see themed) - sizes are set by the builders
 
     # Set up the formatting and dimensions
     col1, col2 = st.columns(2)
@@ -1170,64 +737,25 @@ elif st.session_state.menu_choice == "Graphs":
 
     # 1. Distribution of Multiples > 1
     with col1:
-        data_mult = df[df['Real Multiple'] > 1]['Real Multiple'].dropna()
-        fig, ax = plt.subplots()
-        sns.histplot(data=data_mult, bins=20, color='skyblue')
-        ax.set_title('Distribution of Investment Multiples (>1x)')
-        ax.set_xlabel('Multiple')            
-        ax.set_ylabel('Count')    
-        st.pyplot(fig)
+        show_figure(('Graphs', 'multiples'), themed(lambda: multiples_figure(df)))
         
     # 2. Distribution of Investment Amounts
     with col2:
-        fig, ax = plt.subplots()
-        sns.histplot(data=df['Invested'].dropna(), bins=20, color='salmon')
-        ax.set_title('Distribution of Investment Amounts')
-        ax.set_xlabel('Investment Amount ($)')
-        ax.set_ylabel('Count')
-        st.pyplot(fig)
+        show_figure(('Graphs', 'invested'), themed(lambda: invested_figure(df)))
         
     # 3. Investment Amount vs Multiple (for multiples > 1)
     with col3:
-        scatter_df = df[(df['Real Multiple'] > 1) & (df['Invested'].notnull())]
-        fig, ax = plt.subplots()
-        sns.regplot(data=scatter_df, x='Invested', y='Real Multiple', color='red', scatter_kws={'color': 'purple', 'alpha': 0.6})          
-        ax.set_title('Investment Amount vs Multiple')
-        ax.set_xlabel('Investment Amount ($)')
-        ax.set_ylabel('Multiple')
-        st.pyplot(fig)
+        show_figure(('Graphs', 'invested vs multiple'), themed(lambda: invested_vs_multiple_figure(df)))
 
     # 4. Pie chart of Lead summary for Multiples > 2
     with col4:
-        high_multiple_deals = df[df['Real Multiple'] > 2]
-        lead_summary = high_multiple_deals['Lead'].value_counts()
-        fig, ax = plt.subplots()          
-        ax.pie(lead_summary, labels=lead_summary.index, autopct='%1.1f%%', startangle=90, colors=sns.color_palette('pastel'))
-        ax.set_title('Lead Summary for Multiples > 2')
-        st.pyplot(fig)
+        show_figure(('Graphs', 'lead pie'), themed(lambda: lead_pie_figure(df)))
 
     # 5. Plot of Instrument vs Invested
     if st.session_state.advanced_user:
         with col5:
             if 'Instrument' in df.columns :
-                # Really dumb way of fudging the legends by renaming in the data
-                # Calculate the percentage of total investment for each instrument
-                instrument_investment_percentage = df.groupby('Instrument')['Invested'].sum() / df['Invested'].sum() * 100
-                # Set up a temporary data set and rename all the Instruments to showing % so they are in the final graph
-                df_temp = df.copy()
-                df_temp['Instrument'] = df_temp['Instrument'].replace("debt", f"debt ({instrument_investment_percentage.get('debt', 0):.1f}%)")
-                df_temp['Instrument'] = df_temp['Instrument'].replace("equity", f"equity ({instrument_investment_percentage.get('equity', 0):.1f}%)")
-                df_temp['Instrument'] = df_temp['Instrument'].replace("safe", f"safe ({instrument_investment_percentage.get('safe', 0):.1f}%)")
-                # Create the violin plot
-                fig, ax = plt.subplots(figsize=(10, 6))  # Increase figure size
-                sns.violinplot(df_temp, x='Invested', y='Instrument', hue='Instrument', inner='stick', ax=ax)
-                sns.despine(top=True, right=True, bottom=True, left=True)
-                ax.set_title('Instrument vs Invested')
-                ax.set_xlabel('Investment Amount ($)')
-                ax.set_ylabel('Instrument')
-                # ax.legend(loc='upper right') - wasn't displaying clearly
-                plt.tight_layout()  # Improve layout
-                st.pyplot(fig)
+                show_figure(('Graphs', 'instruments'), themed(lambda: instruments_figure(df, group_store()['stats']['Instrument']['Invested'])))
 
         # 6. Plot of Round Size and Multiple
         # from scipy import stats
@@ -1244,6 +772,7 @@ elif st.session_state.menu_choice == "Graphs":
 elif st.session_state.menu_choice == "Tax":
     st.subheader("Tax and Finance Analysis", divider=True)
     st.markdown("Look at the money flows (money into the account, out of the account). This is in preparation for tax time but also to more accurately calculate the XIRR by using exact dates of returned funds.")
+    uploaded_file = None
     if st.session_state.has_finance_data_file:
         df3 = st.session_state.df3
     else:
@@ -1251,9 +780,13 @@ elif st.session_state.menu_choice == "Tax":
     # If the uploaded_file is true
     if uploaded_file is not None :
         try:
-            df3 = pd.read_csv(uploaded_file, header=0, skip_blank_lines=True)
+            # Read and parse the ledger once per file - company names and dates are worked out
+            # for whole columns (see AL_Ledger)
+            with span('tax: parse ledger'):
+                df3 = load_ledger(uploaded_file)
             st.session_state.has_finance_data_file = True
             st.session_state.df3 = df3
+            st.session_state.ledger_index = ledger_index(df3)
             with st.container(height=200):
                 st.write(df3)
         except pd.errors.ParserError:
@@ -1266,33 +799,55 @@ elif st.session_state.menu_choice == "Tax":
         subtotals = df3.groupby('Transaction')['Amount'].sum()
         st.table(subtotals)
 
-        # prompt: Create a new column called 'Company/Fund' that looks at the Transaction and Description column. It should have an empty value where 'Transaction' is a Deposit or Refill otherwise it should return the value from 'Description' but ignore words like "Closing Proceeds", "Amount Adjustment for", "Refund for", "Investment in", "Return of Capital", "Dissolution Proceeds" and also ignore anything after an initial hyphen ('-').
-        # Ignore specific phrases
-        phrases_to_remove = ["Closing Proceeds from", "Amount adjustment for", "Refund for", "Closing proceeds from",
-                            "Investment in", "For investment in", "Return of Capital", "Dissolution Proceeds", "Holdback", "Acquisition", "acquisition.", "acquisition", "Merger", "Distribution"]
-        # Escape special characters in phrases for regex
-        escaped_phrases = [re.escape(phrase) for phrase in phrases_to_remove]
-        # Create a regex pattern to match any of the phrases
-        pattern = "|".join(escaped_phrases)
-        
-        # Apply the function to create the new 'Company/Fund' column
-        df3['Company/Fund'] = df3.apply(lambda row: "" if row['Transaction'] in ['Deposit', 'Refill'] else extract_company_name(row['Description'], pattern), axis=1)
-        df3['New Date'] = df3['Date'].apply(convert_date)
-
         # prompt: Show all the values where there is one or more matches on Company/Fund, sort them by Company/Fund but also by Date in reverse order. Drop the Balance column and show the Company/Fund coloumn first. Don't show any values where there isn't an entry on the Company/Fund column. Also convert the date to a date field first. As a final step only show company/Fund values where there was at least one Disbursement
-        # Filter out rows where 'Company/Fund' is empty
-        df_t = df3[df3['Company/Fund'] != ""]
-        # Group by 'Company/Fund' and check if there's at least one disbursement
-        companies_with_disbursements = df_t[df_t['Transaction'] == 'Disbursement'].groupby('Company/Fund').size().index
-        # Filter the DataFrame to keep only companies with disbursements
-        df_f = df_t[df_t['Company/Fund'].isin(companies_with_disbursements)]
-        # Sort the DataFrame by 'Company/Fund' and 'Date' in reverse order
-        df_sorted = df_f.sort_values(['Company/Fund', 'New Date'], ascending=[True, True])
-        # Drop the 'Balance' column
-        df_sorted = df_sorted.drop(columns=['Balance'])
-        # Reorder columns to show 'Company/Fund' first
-        cols = ['Company/Fund', 'New Date', 'Transaction', 'Description', 'Amount', 'Date'] # + [col for col in df_sorted.columns if col != 'Company/Fund']
-        df_final = df_sorted[cols]
+        df_final = company_transactions(df3)
         # Display the final DataFrame
         st.write("These are the companies that have more than just an investment")
         st.table(df_final)
+
+        # XIRR from the actual dated cash flows in the ledger rather than the export's dates.
+        # Values still held (from the data file) go back in at today's date
+        st.subheader("IRR from the ledger cash flows", divider=True)
+        with span('tax: ledger xirr'):
+            # Ledger names matched to the data file's so held values and XIRRs line up
+            flows = ledger_cash_flows(matched_names(df3))
+            df = st.session_state.df if st.session_state.has_data_file else None
+            ledger_df = ledger_summary(flows, df)
+        unrealized = 0.0
+        if st.session_state.has_data_file:
+            sumdf = st.session_state.sumdf
+            unrealized = sumdf.loc[sumdf['Category'] == 'Totals', 'Unrealized'].iloc[0]
+        st.metric(label="IRR (ledger)", value=format_percent(ledger_portfolio_xirr(flows, unrealized)), border=True)
+        st.dataframe(ledger_df.style.format({'Invested': format_currency, 'Returned': format_currency, 'Unrealized': format_currency, 'Ledger XIRR': format_percent}), hide_index=True)
+
+        # Look up one company's ledger lines through the index rather than filtering the ledger
+        if 'ledger_index' not in st.session_state:
+            st.session_state.ledger_index = ledger_index(df3)
+        companies = sorted(name for name in st.session_state.ledger_index if name != "")
+        if companies:
+            company = st.selectbox("Show the ledger lines for", companies)
+            st.dataframe(df3.iloc[st.session_state.ledger_index[company]], hide_index=True)
+
+# Warm up the other pages for the data as it now is - after the page so anything it loaded or changed is included
+if st.session_state.get('prefetch_pages', False) and st.session_state.has_data_file:
+    start_prefetch()
+elif 'prefetch' in st.session_state:
+    stop_prefetch()
+
+# Profiling panel - drawn last so this rerun's spans are all in it
+if st.session_state.advanced_user:
+    with st.sidebar:
+        with st.expander("Profiling"):
+            st.checkbox("Profile each rerun", key='profiling')
+            st.checkbox("Track memory (slower)", key='profile_memory', disabled=not st.session_state.get('profiling', False))
+            run = profiler().finish_run(st.session_state.menu_choice, st.session_state)
+            if run is not None:
+                st.metric(label="Rerun", value=f"{run['seconds']*1000:,.0f} ms")
+                if 'peak_bytes' in run:
+                    st.metric(label="Peak memory", value=f"{run['peak_bytes']/2**20:,.1f} MB")
+                    st.caption("Memory is traced for the whole server process - the figures include anything other sessions were doing during this rerun")
+                st.dataframe(breakdown(run).style.format({'ms': '{:,.1f}', '%': '{:.0f}', 'Peak MB': '{:,.1f}'}, na_rep=''), hide_index=True)
+                st.caption("Session state DataFrames")
+                st.dataframe(pd.Series(run['state_bytes'], name='MB', dtype=float).div(2**20).round(2))
+            if profiler().runs:
+                st.download_button("Download spans (JSON)", profiler().to_json(), file_name="profile.json", mime="application/json")
@@ -0,0 +1,164 @@
+# AL_Aggregates
+# Round / Market / Year / Lead aggregates shared by the pages and the batch runner
+
+import numpy as np
+import pandas as pd
+
+# define the round order to use to reset things as required
+# could use this for filtering/sorting and display order of round data for AngelList for example but have to check that none are missing or it won't display them
+ROUND_ORDER = ['Preseed', 'Pre-Seed', 'Seed', 'Seed+', 'Series A', 'Series A+','Series B', 'Series B+', 'Series C', 'Other']
+
+
+def _invested_and_increase(df, key):
+    # Sum Invested and value Increase by key, with each as a share of the total
+    temp_df = df[[key, 'Invested']].copy()
+    temp_df['Increase'] = df['Net Value'] - df['Invested']
+    grouped = temp_df.groupby(key, as_index=False, observed=True).agg({"Invested":"sum", "Increase":"sum"})
+    invested_sum = grouped["Invested"].sum()
+    value_sum = grouped[grouped["Increase"] > 0]["Increase"].sum()
+    return grouped, invested_sum, value_sum
+
+
+def round_summary(df):
+    """Invested and Increase by Round in round order, with the share of each."""
+    grouped, invested_sum, value_sum = _invested_and_increase(df, 'Round')
+    grouped['Round'] = pd.Categorical(grouped['Round'], categories=ROUND_ORDER, ordered=True)
+    grouped = grouped.sort_values('Round')
+    grouped["Perc by Invested"] = grouped["Invested"]/invested_sum if invested_sum !=0 else 0
+    grouped["Perc by Increase"] = grouped["Increase"]/value_sum if invested_sum !=0 else 0
+    return grouped
+
+
+def market_summary(df):
+    """Invested and Increase by Market, with the share of each."""
+    grouped, invested_sum, value_sum = _invested_and_increase(df, 'Market')
+    grouped["Invested %"] = grouped["Invested"]/invested_sum if invested_sum !=0 else 0
+    grouped["Increase %"] = grouped["Increase"]/value_sum if invested_sum !=0 else 0
+    return grouped
+
+
+def year_summary(df):
+    """Investments, Leads, amounts and Multiple by year of Invest Date."""
+    temp_df = df[['Invest Date', 'Lead', 'Invested', 'Net Value']].copy()
+    temp_df['Year'] = temp_df['Invest Date'].dt.year
+    summary_df = temp_df.groupby('Year').agg(
+        Investments=('Year', 'count'),
+        Leads=('Lead', 'nunique'),
+        Invested=('Invested', 'sum'),
+        Value=('Net Value', 'sum'),
+        Avg = ('Invested', 'mean'),
+        Min=('Invested', 'min'),
+        Max=('Invested', 'max')
+    ).reset_index()
+    summary_df['Multiple'] = summary_df['Value']/summary_df['Invested']
+    return summary_df
+
+
+def lead_summary(df):
+    """Investments, amounts, Multiple and realised count by Lead."""
+    aggregated_df = df.groupby('Lead', observed=True).agg(
+                Investments=('Company/Fund', 'size'),
+                Invested=('Invested', 'sum'),
+                Unrealized=('Unrealized Value', 'sum'),
+                Invested_avg=('Invested', 'mean'),
+                Value=('Unrealized Value', 'sum')
+    ).reset_index()
+    # Calculate average multiple
+    aggregated_df['Multiple'] = (aggregated_df['Value'] / aggregated_df['Invested'])
+
+    # Get the realised count - group the rows where Status is 'Realized' by Lead and count them
+    realized_counts = df[df['Status'] == 'Realized'].groupby('Lead', observed=True).size().reset_index(name='num_Realized')
+    # Merge the realized counts back into the aggregated DataFrame
+    aggregated_df = pd.merge(aggregated_df, realized_counts, on='Lead', how='left')
+    # Lead may be a categorical so only fill the numbers
+    numbers = aggregated_df.columns.drop('Lead')
+    aggregated_df[numbers] = aggregated_df[numbers].fillna(0)
+    aggregated_df['Realised %'] = aggregated_df['num_Realized']/aggregated_df['Investments']
+    aggregated_df['num_Realized'] = aggregated_df['num_Realized'].astype(int)
+    return aggregated_df
+
+
+def locked_summary(df):
+    """Investments, amounts and how many have no disclosed valuation, by Lead."""
+    return df.groupby('Lead', observed=True).agg(
+        total_investments=('Company/Fund', 'size'),
+        avg_invested=('Invested', 'mean'),
+        sum_invested=('Invested', 'sum'),
+        locked_count=('Valuation Unknown', 'sum')
+    ).reset_index()
+
+
+def group_stats(df, key):
+    """Counts, sums and medians by key (a column, or 'Year' of Invest Date), in key order."""
+    keys = df['Invest Date'].dt.year.rename('Year') if key == 'Year' else df[key]
+    temp_df = df[['Invested', 'Net Value']].copy()
+    temp_df['Increase'] = df['Net Value'] - df['Invested']
+    temp_df['Realized'] = (df['Status'] == 'Realized') if 'Status' in df.columns else False
+    aggregations = {
+        'Investments': ('Invested', 'size'),
+        'Invested': ('Invested', 'sum'),
+        'Value': ('Net Value', 'sum'),
+        'Increase': ('Increase', 'sum'),
+        'Median Invested': ('Invested', 'median'),
+        'Realized': ('Realized', 'sum'),
+    }
+    if 'Valuation or Cap' in df.columns:
+        temp_df['Valuation or Cap'] = df['Valuation or Cap']
+        aggregations.update({
+            'Median Valuation': ('Valuation or Cap', 'median'),
+            'Min Valuation': ('Valuation or Cap', 'min'),
+            'Max Valuation': ('Valuation or Cap', 'max'),
+        })
+    return temp_df.groupby(keys, observed=True).agg(**aggregations)
+
+
+# Keys group_stats is precomputed for, when the data has them
+GROUP_KEYS = ['Round', 'Market', 'Lead', 'Year', 'Instrument']
+
+# How many companies the Examples (Round, Market) and Best/Worst (Lead) columns name
+CATEGORY_EXAMPLES = 5
+LEAD_EXAMPLES = 4
+
+
+def top_examples(df, key, values, k, ascending=False):
+    """'Company (X.XXx), ...' naming the k rows of each key group with the highest values.
+
+    values is a Series aligned with df (ascending=True for the lowest). The whole frame is sorted
+    once and cut with groupby().head(k) so the cost doesn't grow with the number of groups.
+    Returns a Series of strings indexed by key.
+    """
+    ranked = df[[key, 'Company/Fund', 'Real Multiple']].assign(Rank=values)
+    ranked = ranked.sort_values('Rank', ascending=ascending, kind='stable', na_position='last')
+    ranked = ranked.groupby(key, observed=True, sort=False).head(k)
+    labels = ranked['Company/Fund'].astype(str) + ' (' + ranked['Real Multiple'].map('{:.2f}x)'.format)
+    return labels.groupby(ranked[key], observed=True).agg(', '.join)
+
+
+def build_group_store(df):
+    """Every page aggregate for df, computed once so the pages don't regroup the raw data on each rerun.
+
+    Holds group_stats for each of GROUP_KEYS the data has, the page tables (round, market, year,
+    lead and locked), the Examples/Best/Worst strings and the overall median valuation. Treat it as read only - copy a table
+    before changing it for display.
+    """
+    present = [key for key in GROUP_KEYS if key in df.columns or (key == 'Year' and 'Invest Date' in df.columns)]
+    store = {'stats': {key: group_stats(df, key) for key in present}}
+    increase = df['Net Value'] - df['Invested']
+    store['examples'] = {}
+    if 'Round' in df.columns:
+        store['round'] = round_summary(df)
+        store['examples']['Round'] = top_examples(df, 'Round', increase, CATEGORY_EXAMPLES)
+    if 'Market' in df.columns:
+        store['market'] = market_summary(df)
+        store['examples']['Market'] = top_examples(df, 'Market', increase, CATEGORY_EXAMPLES)
+    if 'Invest Date' in df.columns:
+        store['year'] = year_summary(df)
+    if 'Lead' in df.columns:
+        store['lead'] = lead_summary(df)
+        store['locked'] = locked_summary(df)
+        # Best multiples overall and worst of the realised ones
+        store['examples']['Best'] = top_examples(df, 'Lead', df['Real Multiple'], LEAD_EXAMPLES)
+        realized = df[df['Status'] == 'Realized'] if 'Status' in df.columns else df.iloc[:0]
+        store['examples']['Worst'] = top_examples(realized, 'Lead', realized['Real Multiple'], LEAD_EXAMPLES, ascending=True)
+    store['median_valuation'] = df['Valuation or Cap'].median() if 'Valuation or Cap' in df.columns else np.nan
+    return store
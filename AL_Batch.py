@@ -0,0 +1,116 @@
+# AL_Batch
+# Headless batch mode - run the analysis pipeline over a directory of investor exports without Streamlit
+#
+#   python -m AL_Batch batch <dir> [--out <dir>] [--workers N] [--format csv|parquet]
+
+import argparse
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from pathlib import Path
+import pandas as pd
+from streamlit.logger import set_log_level
+from AL_Ingest import run_ingest
+from AL_Xirr import company_xirr
+
+# Nothing here runs under `streamlit run` - Streamlit's warnings about the missing session are expected
+set_log_level('error')
+
+
+def analyse_export(path):
+    """Run the same pipeline as the Load Data page plus the page aggregates over one export."""
+    result = run_ingest(str(path))
+    df = result['df']
+    sumdf = result['sumdf']
+    xirr_by_company = company_xirr(df, result['has_realized_dates'])
+    # The page aggregates come with the ingest result
+    groups = result['groups']
+    tables = {
+        'investments': df,
+        'summary': sumdf,
+        'company_xirr': xirr_by_company.rename_axis('Company/Fund').reset_index(),
+        **{name: groups[name] for name in ('round', 'market', 'year', 'lead', 'locked') if name in groups},
+    }
+    stats = dict(result['counters'])
+    stats['rows'] = len(df)
+    stats['overall_XIRR'] = result['overall_XIRR']
+    return tables, stats
+
+
+def write_tables(tables, out_dir, file_format):
+    out_dir.mkdir(parents=True, exist_ok=True)
+    for name, table in tables.items():
+        if file_format == 'parquet':
+            table.to_parquet(out_dir / f"{name}.parquet", index=False)
+        else:
+            table.to_csv(out_dir / f"{name}.csv", index=False)
+
+
+def _run_one(path, out_root, file_format):
+    # Worker - returns a status row rather than raising so one bad export doesn't stop the batch
+    start = time.perf_counter()
+    try:
+        tables, stats = analyse_export(path)
+        write_tables(tables, out_root / Path(path).stem, file_format)
+        status = 'ok'
+    except Exception as e:
+        stats = {'error': f"{type(e).__name__}: {e}"}
+        status = 'failed'
+    return {'file': Path(path).name, 'status': status, 'seconds': time.perf_counter() - start, **stats}
+
+
+def run_batch(in_dir, out_dir, workers=None, file_format='csv'):
+    """Process every CSV in in_dir with a process pool, writing one folder of results per export.
+
+    Returns a DataFrame with a status row per file, also written to out_dir as batch_report.csv.
+    """
+    paths = sorted(Path(in_dir).glob('*.csv'))
+    out_dir = Path(out_dir)
+    out_dir.mkdir(parents=True, exist_ok=True)
+    start = time.perf_counter()
+    rows = []
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = [pool.submit(_run_one, path, out_dir, file_format) for path in paths]
+        for future in as_completed(futures):
+            row = future.result()
+            rows.append(row)
+            print(f"{row['status']:>6}  {row['seconds']:7.2f}s  {row['file']}", flush=True)
+    elapsed = time.perf_counter() - start
+
+    report = pd.DataFrame(rows)
+    report.to_csv(out_dir / 'batch_report.csv', index=False)
+    done = report[report['status'] == 'ok'] if not report.empty else report
+    total_rows = int(done['rows'].sum()) if 'rows' in done.columns else 0
+    throughput = {
+        'files': len(paths),
+        'succeeded': len(done),
+        'failed': len(report) - len(done),
+        'seconds': round(elapsed, 3),
+        'files_per_second': round(len(paths) / elapsed, 3) if elapsed > 0 else None,
+        'rows_per_second': round(total_rows / elapsed, 1) if elapsed > 0 else None,
+    }
+    with open(out_dir / 'throughput.json', 'w') as f:
+        json.dump(throughput, f, indent=2)
+    print(json.dumps(throughput))
+    return report
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='AL_Batch', description="Startup Data Analyser - headless mode")
+    commands = parser.add_subparsers(dest='command', required=True)
+    batch = commands.add_parser('batch', help="Process every AngelList CSV export in a directory")
+    batch.add_argument('dir', help="Directory of AngelList CSV exports")
+    batch.add_argument('--out', default=None, help="Where to write the results (default <dir>/results)")
+    batch.add_argument('--workers', type=int, default=os.cpu_count(), help="Number of worker processes")
+    batch.add_argument('--format', choices=['csv', 'parquet'], default='csv', help="Output file format (parquet needs pyarrow)")
+    args = parser.parse_args(argv)
+
+    if args.command == 'batch':
+        out_dir = args.out or os.path.join(args.dir, 'results')
+        report = run_batch(args.dir, out_dir, args.workers, args.format)
+        return 0 if (report.empty or (report['status'] == 'ok').all()) else 1
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
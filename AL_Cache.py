@@ -0,0 +1,97 @@
+# AL_Cache
+# Process-wide content-addressed cache shared by every session, bounded by entries and bytes
+
+import threading
+from collections import OrderedDict
+import pandas as pd
+
+# How often a caller waiting on someone else's build checks in (see SharedCache.get_or_build)
+WAIT_POLL_SECONDS = 0.2
+
+
+def value_bytes(value):
+    """Approximate memory held by the pandas objects in value, looking inside dicts, lists and tuples."""
+    if isinstance(value, pd.DataFrame):
+        return int(value.memory_usage(deep=True).sum())
+    if isinstance(value, pd.Series):
+        return int(value.memory_usage(deep=True))
+    if isinstance(value, dict):
+        return sum(value_bytes(v) for v in value.values())
+    if isinstance(value, (list, tuple)):
+        return sum(value_bytes(v) for v in value)
+    return 0
+
+
+class SharedCache:
+    """Least recently used cache of values by content key, safe to use from several sessions at once.
+
+    Values are handed out as is, not copied, so callers must treat them as read only and copy
+    anything they are going to change. Concurrent requests for the same missing key wait for one
+    build rather than each doing the work.
+    """
+
+    def __init__(self, max_entries, max_bytes):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._building = {}
+
+    def get(self, key):
+        with self._lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                return None
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def get_or_build(self, key, build, waiting=None):
+        """The cached value for key, calling build() to make it on a miss.
+
+        While another caller is building key, waiting() (if given) is called every
+        WAIT_POLL_SECONDS - it can raise to stop waiting, eg when the caller has been cancelled.
+        """
+        while True:
+            with self._lock:
+                if key in self.entries:
+                    self.entries.move_to_end(key)
+                    self.hits += 1
+                    return self.entries[key][0]
+                pending = self._building.get(key)
+                if pending is None:
+                    pending = self._building[key] = threading.Event()
+                    self.misses += 1
+                    break
+            # Someone else is building it - wait, then look again (they may have failed)
+            while not pending.wait(WAIT_POLL_SECONDS if waiting is not None else None):
+                waiting()
+        try:
+            value = build()
+            self.put(key, value)
+            return value
+        finally:
+            with self._lock:
+                self._building.pop(key).set()
+
+    def put(self, key, value):
+        size = value_bytes(value)
+        with self._lock:
+            self.entries[key] = (value, size)
+            self.entries.move_to_end(key)
+            # Evict the least recently used until back within budget, always keeping the newest
+            while len(self.entries) > 1 and (len(self.entries) > self.max_entries or self.total_bytes() > self.max_bytes):
+                self.entries.popitem(last=False)
+
+    def total_bytes(self):
+        return sum(size for _, size in self.entries.values())
+
+    def clear(self):
+        with self._lock:
+            self.entries.clear()
+
+    def stats(self):
+        with self._lock:
+            return {'entries': len(self.entries), 'bytes': self.total_bytes(), 'hits': self.hits, 'misses': self.misses}
@@ -0,0 +1,371 @@
+# AL_Charts
+# Chart builders shared by the pages and a per-session cache of the rendered images
+
+import io
+import threading
+from collections import OrderedDict
+import streamlit as st
+import numpy as np
+import pandas as pd
+from AL_Profile import span
+from AL_Trend import trendline
+# matplotlib and squarify are imported by the builders so pages without charts don't pay for them
+#
+# The builders draw on their own Figure rather than through pyplot. pyplot's figures are shared by
+# the whole process and Streamlit closes them all at the end of every script run, which would
+# pull a figure from under a chart being drawn on another thread (another session or a prefetch
+# worker, see AL_Prefetch).
+
+# Rendered images kept per session - least recently shown is evicted first
+MAX_CACHED_FIGURES = 48
+MAX_CACHED_BYTES = 64 * 1024 * 1024
+
+# rcParams are shared by the whole process and themed charts change them while drawing, so
+# charts are drawn and rendered one at a time whichever thread is drawing them
+_draw_lock = threading.Lock()
+
+
+def _figure_cache():
+    if 'figure_cache' not in st.session_state:
+        st.session_state.figure_cache = OrderedDict()
+    return st.session_state.figure_cache
+
+
+def new_figure(figsize=None):
+    """A Figure with one Axes, not registered with pyplot."""
+    from matplotlib.figure import Figure
+    fig = Figure(figsize=figsize)
+    return fig, fig.add_subplot()
+
+
+def render_figure(fig, image_format='png'):
+    # Render to bytes - the figure isn't kept anywhere else so goes once the caller drops it
+    buffer = io.BytesIO()
+    fig.savefig(buffer, format=image_format, bbox_inches='tight', dpi=100)
+    return buffer.getvalue()
+
+
+def draw_image(draw, image_format='png'):
+    """The rendered image of the figure returned by draw(), safe to call from any thread."""
+    with _draw_lock:
+        return render_figure(draw(), image_format)
+
+
+def show_figure(key, draw, image_format='png'):
+    """Show the matplotlib figure returned by draw(), reusing the rendered image on reruns.
+
+    key identifies the chart and every widget value it depends on. It is combined with the
+    session data_version so a new load or an Overwrite redraws everything.
+    """
+    cache = _figure_cache()
+    full_key = (st.session_state.get('data_version'), image_format) + tuple(key)
+    image = cache.get(full_key)
+    if image is None:
+        # Drawn ahead of time after the data was loaded (see AL_Prefetch), or now
+        prefetch = st.session_state.get('prefetch')
+        image = prefetch.take(full_key) if prefetch is not None else None
+        if image is None:
+            with span(f"chart: {' '.join(str(part) for part in key[:2])}"):
+                image = draw_image(draw, image_format)
+        cache[full_key] = image
+        # Evict the least recently used images until we're back within budget
+        while len(cache) > 1 and (len(cache) > MAX_CACHED_FIGURES or sum(len(v) for v in cache.values()) > MAX_CACHED_BYTES):
+            cache.popitem(last=False)
+    else:
+        cache.move_to_end(full_key)
+    if image_format == 'svg':
+        st.image(image.decode(), width='stretch')
+    else:
+        st.image(image, width='stretch')
+
+
+def clear_figure_cache():
+    _figure_cache().clear()
+
+
+def treemap_figure(sizes, names, multiples):
+    # Treemap sized by Net Value with the multiple in each label
+    import matplotlib
+    import squarify
+    labels = [f"{company}\n({multiple:.1f}x)" for company, multiple in zip(names, multiples)]
+    colors = matplotlib.colormaps['viridis'](np.linspace(0, 0.8, len(labels)))
+
+    fig, ax = new_figure(figsize=(12, 8))
+    squarify.plot(sizes=sizes, label=labels, color=colors, alpha=0.8, ax=ax, text_kwargs={'fontsize':10})
+    ax.axis('off')
+    ax.set_title('Investment Treemap (Size by Net Value, Labels show Multiple)', pad=20)
+    fig.tight_layout()
+    return fig
+
+
+def waterfall_figure(df, net_value_col, title, threshold=0.01):
+    # Waterfall chart of value created by 'Company/Fund' (which isn't limited by the data set)
+    import matplotlib
+    # Filter out values below the 1% threshold
+    temp_df = df[['Company/Fund']].astype(object)
+    temp_df['Val increase'] = df[net_value_col] - df['Invested']
+    total_increase = temp_df['Val increase'].sum()
+    filtered_df = temp_df[temp_df['Val increase'] / total_increase >= threshold]
+
+    # Group the remaining investments by 'Investment' and sum their 'Val increase'
+    others_increase = temp_df[temp_df['Val increase'] / total_increase < threshold]['Val increase'].sum()
+
+    # Create an 'Others' category
+    others_category = pd.DataFrame({'Company/Fund': ['Others'], 'Val increase': [others_increase]})
+    filtered_df = pd.concat([filtered_df, others_category])
+    sorted_df = filtered_df.sort_values(by='Val increase', ascending=False)
+    total_entries = len(sorted_df)
+
+    # Create the waterfall chart
+    fig, ax = new_figure(figsize=(10, 6))
+    # Get the labels and values
+    labels = sorted_df['Company/Fund'].tolist()
+    values = sorted_df['Val increase'].tolist()
+
+    # Convert values to millions
+    values_millions = [v / 1e6 for v in values]  # Divide each value by 1 million
+
+    # Plot the waterfall chart
+    # Calculate new ylim based on millions
+    total_increase_millions = total_increase / 1e6
+    others_increase_millions = others_increase / 1e6
+    ax.set_ylim(0, total_increase_millions - others_increase_millions)  # Set y-axis limit for clarity
+
+    cmap = matplotlib.colormaps['coolwarm'].resampled(total_entries)  # Use 'viridis' or any other colormap you like
+    # Initialize the current value at 0 for the first bar
+    current_value = 0
+    for i, (label, value) in enumerate(zip(labels, values_millions)):
+        next_value = current_value + value
+        ax.bar(i, value, bottom=current_value, label=label if i == 0 else "", color=cmap(i), alpha=0.7, width=0.8) # Set label only for the first bar
+        current_value = next_value
+        ax.text(i, current_value*.9, f"${values[i]:,.0f}", ha='center', va='center')
+
+    ax.set_xticks(range(len(labels)))
+    ax.set_xticklabels(labels, rotation=45, ha='right')
+    ax.set_ylabel("Value Increase ($ M)")
+    ax.set_title(title)
+    fig.tight_layout()
+    return fig
+
+
+def pie_figure(values, labels, title):
+    fig, ax = new_figure(figsize=(8, 8))
+    ax.pie(values, labels=labels, autopct='%1.1f%%', startangle=90)
+    ax.set_title(title)
+    ax.axis('equal')  # Equal aspect ratio ensures that pie is drawn as a circle.
+    return fig
+
+
+def themed(draw):
+    """draw wrapped to use the seaborn theme (as the Graphs page does) without leaving it set for
+    every other chart drawn afterwards."""
+    def draw_themed():
+        import matplotlib
+        import seaborn as sns
+        with matplotlib.rc_context():
+            sns.set_theme()
+            return draw()
+    return draw_themed
+
+
+def _millions(x, pos):
+    # Format y-axis to show in millions
+    return f'${x/1000000:.1f}M'
+
+
+def valuation_boxplot_figure(df, rounds, overall_median):
+    # Valuation or Cap for each of rounds as a box plot with the individual investments over it
+    from matplotlib.ticker import FuncFormatter
+    import seaborn as sns
+    fig, ax = new_figure(figsize=(12, 8))
+    sns.boxplot(x='Round', y='Valuation or Cap', data=df, order=rounds,
+            showfliers=False, ax=ax, hue='Round', palette='pastel', legend=False)
+    # Add swarm plot to show individual data points
+    sns.swarmplot(x='Round', y='Valuation or Cap', data=df, order=rounds,
+                size=8, color='darkblue', alpha=0.7, ax=ax)
+
+    # Add the overall median line
+    ax.axhline(y=overall_median, color='red', linestyle='--', 
+            label=f'Overall Median: ${overall_median:,.0f}')
+
+    ax.yaxis.set_major_formatter(FuncFormatter(_millions))
+
+    # Add title and labels
+    ax.set_title('Valuation or Cap by Investment Round with Individual Data Points', fontsize=14)
+    ax.set_xlabel('Investment Round', fontsize=12)
+    ax.set_ylabel('Valuation or Cap', fontsize=12)
+    ax.legend()
+
+    fig.tight_layout()
+    return fig
+
+
+def round_valuations_figure(investments, round_name, median_val):
+    # Scatter of one round's Valuation or Cap by Invest Date with company names as labels, the
+    # median line and a trendline weighted by the amount invested
+    from matplotlib.ticker import FuncFormatter
+    import seaborn as sns
+    fig2, ax2 = new_figure(figsize=(12, 8))
+    sns.scatterplot(data=investments, x='Invest Date', y='Valuation or Cap', s=100, ax=ax2)
+    # Trendline over the investment index weighted by the amount invested
+    trend = trendline(np.arange(len(investments)), investments['Valuation or Cap'],
+                      weights=investments['Invested'])
+
+    # Show the median line
+    ax2.axhline(median_val, color='red', linestyle='--', label='Median Valuation')
+
+    # Plot the trendline and its 95% confidence band
+    ax2.plot(investments['Invest Date'], trend['fit'], color='blue', label='Trendline', linewidth=1)
+    ax2.fill_between(investments['Invest Date'], trend['lower'], trend['upper'], color='blue', alpha=0.1)
+
+    # Add labels for each company
+    for i in range(investments.shape[0]):
+        ax2.text(x=investments['Invest Date'].iloc[i], y=investments['Valuation or Cap'].iloc[i],
+                s=investments['Company/Fund'].iloc[i], fontsize=9, ha='right')
+
+    ax2.tick_params(axis='x', labelrotation=45)
+
+    ax2.yaxis.set_major_formatter(FuncFormatter(_millions))
+    ax2.set_title('Valuation/Cap for ' + round_name + ' Round Investments with Median and Investment amount weighted TrendLine')
+    ax2.set_xlabel('Investment Date')
+    ax2.set_ylabel('Valuation or Cap ($M)')
+    ax2.grid(True)
+    ax2.legend()
+    fig2.tight_layout()
+    return fig2
+
+
+def year_bars_figure(summary_df):
+    # Bar plot for Invested Amount and Value by year against each other with multiple displayed
+    fig, ax1 = new_figure(figsize=(12, 6))
+    ax1.bar(summary_df['Year'], summary_df['Value'], color='green', label='Net Value')  # Adjust alpha for visibilit
+    ax1.set_xlabel('Investment Year')
+    ax1.set_ylabel('Invested Amount', color='skyblue')
+    ax1.tick_params(axis='y', labelcolor='skyblue')
+    ax1.set_xticks(summary_df['Year']) # Set x-ticks to years
+    ax1.bar(summary_df['Year'], summary_df['Invested'], color='skyblue', label='Invested Amount', alpha=0.5)
+    # Add annotations for Multiple values on top of the bars
+    for i, multiple in enumerate(summary_df['Multiple']):
+        ax1.text(summary_df['Year'][i], summary_df['Value'][i], f'{multiple:.2f} x', ha='center', va='bottom')
+    # Combine legends
+    lines, labels = ax1.get_legend_handles_labels()
+    ax1.legend(lines, labels, loc='upper right')
+
+    ax1.set_title('Analysis by Year')
+    return fig
+
+
+def invested_over_time_figure(df):
+    # Scatter of each investment by Invest Date with the cumulative amount invested as monthly bars
+    # on the right hand axis
+    import matplotlib.ticker as mtick
+    import seaborn as sns
+    # Sort by Invest Date before calculating cumulative sum
+    temp_df = df[['Invest Date', 'Invested']].sort_values(by='Invest Date')
+    # Calculate cumulative investment
+    temp_df['Cumulative Invested'] = temp_df['Invested'].cumsum()        
+    # Create the figure and axes
+    fig, ax1 = new_figure(figsize=(12, 6))
+    # Plot the scatter plot on the first axis
+    sns.scatterplot(x='Invest Date', y='Invested', data=temp_df, ax=ax1, label='Investment Amount', color="blue")
+    ax1.set_xlabel('Date of Investment')
+    ax1.set_ylabel('Amount Invested', color='blue')
+    ax1.tick_params(axis='y', labelcolor='blue')
+    # Create a second y-axis for the cumulative investment
+    ax2 = ax1.twinx()
+    # Calculate monthly cumulative investments
+    df_monthly = temp_df.groupby(pd.Grouper(key='Invest Date', freq='ME'))['Cumulative Invested'].last().reset_index()
+    # Plot the cumulative investment as bars on the second axis
+    ax2.bar(df_monthly['Invest Date'], df_monthly['Cumulative Invested'], width=25, color="orange", alpha = 0.5, label='Cumulative Investment')
+    ax2.set_ylabel('Cumulative Amount Invested', color='orange')
+    ax2.tick_params(axis='y', labelcolor='orange')
+    # Format y-axis ticks as currency
+    formatter = mtick.FormatStrFormatter('$%1.0f')
+    ax1.yaxis.set_major_formatter(formatter)        
+    ax2.yaxis.set_major_formatter(formatter)
+    # Set title and rotate x-axis labels
+    ax2.set_title('Investment amount over time')
+    ax1.tick_params(axis='x', labelrotation=45)
+    # Add legends
+    lines, labels = ax1.get_legend_handles_labels()
+    lines2, labels2 = ax2.get_legend_handles_labels()
+    # Only show one legend
+    ax1.get_legend().remove()
+    ax2.legend(lines + lines2, labels + labels2, loc='upper center')
+    # Improve layout
+    fig.tight_layout()
+    return fig
+
+
+def multiples_figure(df):
+    # Distribution of Multiples > 1
+    import seaborn as sns
+    data_mult = df[df['Real Multiple'] > 1]['Real Multiple'].dropna()
+    fig, ax = new_figure()
+    sns.histplot(data=data_mult, bins=20, color='skyblue', ax=ax)
+    ax.set_title('Distribution of Investment Multiples (>1x)')
+    ax.set_xlabel('Multiple')            
+    ax.set_ylabel('Count')    
+    return fig
+
+
+def invested_figure(df):
+    # Distribution of Investment Amounts
+    import seaborn as sns
+    fig, ax = new_figure()
+    sns.histplot(data=df['Invested'].dropna(), bins=20, color='salmon', ax=ax)
+    ax.set_title('Distribution of Investment Amounts')
+    ax.set_xlabel('Investment Amount ($)')
+    ax.set_ylabel('Count')
+    return fig
+
+
+def invested_vs_multiple_figure(df):
+    # Investment Amount vs Multiple (for multiples > 1) with a trendline
+    scatter_df = df[(df['Real Multiple'] > 1) & (df['Invested'].notnull())]
+    fig, ax = new_figure()
+    ax.scatter(scatter_df['Invested'], scatter_df['Real Multiple'], color='purple', alpha=0.6)
+    trend = trendline(scatter_df['Invested'], scatter_df['Real Multiple'],
+                      at=np.linspace(scatter_df['Invested'].min(), scatter_df['Invested'].max(), 100) if len(scatter_df) else [])
+    ax.plot(trend['x'], trend['fit'], color='red')
+    ax.fill_between(trend['x'], trend['lower'], trend['upper'], color='red', alpha=0.15)
+    ax.set_title('Investment Amount vs Multiple')
+    ax.set_xlabel('Investment Amount ($)')
+    ax.set_ylabel('Multiple')
+    return fig
+
+
+def lead_pie_figure(df):
+    # Pie chart of Lead summary for Multiples > 2
+    import seaborn as sns
+    high_multiple_deals = df[df['Real Multiple'] > 2]
+    lead_summary = high_multiple_deals['Lead'].value_counts()
+    lead_summary = lead_summary[lead_summary > 0] # Leads are categories so the ones with no deals are counted too
+    fig, ax = new_figure()
+    ax.pie(lead_summary, labels=lead_summary.index, autopct='%1.1f%%', startangle=90, colors=sns.color_palette('pastel'))
+    ax.set_title('Lead Summary for Multiples > 2')
+    return fig
+
+
+def instruments_figure(df, instrument_invested):
+    # Violin plot of Instrument vs Invested, instrument_invested is the amount Invested by Instrument
+    import seaborn as sns
+    # Really dumb way of fudging the legends by renaming in the data
+    # Calculate the percentage of total investment for each instrument
+    instrument_investment_percentage = instrument_invested / df['Invested'].sum() * 100
+    # Set up a temporary data set and rename all the Instruments to showing % so they are in the final graph
+    df_temp = df.copy()
+    df_temp['Instrument'] = df_temp['Instrument'].astype(object)
+    df_temp['Instrument'] = df_temp['Instrument'].replace("debt", f"debt ({instrument_investment_percentage.get('debt', 0):.1f}%)")
+    df_temp['Instrument'] = df_temp['Instrument'].replace("equity", f"equity ({instrument_investment_percentage.get('equity', 0):.1f}%)")
+    df_temp['Instrument'] = df_temp['Instrument'].replace("safe", f"safe ({instrument_investment_percentage.get('safe', 0):.1f}%)")
+    # Create the violin plot
+    fig, ax = new_figure(figsize=(10, 6))  # Increase figure size
+    sns.violinplot(df_temp, x='Invested', y='Instrument', hue='Instrument', inner='stick', ax=ax)
+    sns.despine(ax=ax, top=True, right=True, bottom=True, left=True)
+    ax.set_title('Instrument vs Invested')
+    ax.set_xlabel('Investment Amount ($)')
+    ax.set_ylabel('Instrument')
+    # ax.legend(loc='upper right') - wasn't displaying clearly
+    fig.tight_layout()  # Improve layout
+    return fig
@@ -0,0 +1,425 @@
+# AL_Ingest
+# Load Data pipeline - read the AngelList export, drop unused columns, normalise and summarise it once per file
+
+import csv
+import hashlib
+import io
+import logging
+import streamlit as st
+from streamlit.runtime.scriptrunner import get_script_run_ctx
+import numpy as np
+import pandas as pd
+from pandas.api.types import union_categoricals, is_object_dtype, is_string_dtype
+from AL_Functions import process_and_summarize_data, has_angellist_data
+from AL_Aggregates import ROUND_ORDER, build_group_store
+from AL_Cache import SharedCache
+from AL_Xirr import portfolio_xirr
+from AL_Profile import span
+
+# Columns we don't analyse - dropped up front for easy display / debugging
+TODROP = {'Investment Entity', 'Invest Date_y', # This is a special value caused by the outer join - we shouldn't see it!
+          'Investment Type', 'Fund Name', 'Allocation',
+          'Valuation or Cap Type', # 'Valuation or Cap',
+          'Discount', 'Carry', 'Share Class'}
+
+# The two ways process_and_summarize_data reads the Invest and Realized dates (see convert_date_two
+# in AL_Functions) - AngelList's own exports are month first
+US_DATE_FORMAT = "%m/%d/%Y"
+DAY_FIRST_DATE_FORMAT = "%d/%m/%Y"
+# Tried in turn by parse_dates for dates the first doesn't read - some exports have 2 digit years
+EXPORT_DATE_FORMATS = {True: [US_DATE_FORMAT, "%m/%d/%y"], False: [DAY_FIRST_DATE_FORMAT, "%d/%m/%y"]}
+
+# Exports bigger than this are read in chunks of INGEST_CHUNK_ROWS rows so the raw text for the
+# whole file is never held at once
+CHUNKED_INGEST_BYTES = 20 * 1024 * 1024
+INGEST_CHUNK_ROWS = 50_000
+
+# Date columns parsed before process_and_summarize_data sees them (see parse_dates)
+DATE_COLUMNS = ['Invest Date', 'Realized Date']
+
+# Columns process_and_summarize_data writes a number into (0 for Locked values) before converting
+# the rest of their text - read as object, as pandas 3's default string columns won't take it
+OBJECT_COLUMNS = ['Net Value', 'Unrealized Value']
+
+# Processed uploads kept for the whole server, least recently used dropped first
+INGEST_CACHE_ENTRIES = 16
+INGEST_CACHE_BYTES = 512 * 1024 * 1024
+
+# Counters returned by process_and_summarize_data that the other pages read from session state
+COUNTERS = ['num_uniques', 'num_leads', 'num_zero_value_leads', 'num_locked']
+
+# Repeated text columns the pages group by - held as categories rather than python strings
+CATEGORY_COLUMNS = ['Company/Fund', 'Lead', 'Market', 'Status', 'Instrument']
+
+# Which rows make up each summary category, as process_and_summarize_data picks them, so the
+# summary can be updated by deltas after an edit. summary_matches checks these against what the
+# helper produced before they are trusted - anything else means a full recompute
+SUMMARY_CATEGORIES = {
+    'Totals': lambda df: pd.Series(True, index=df.index),
+    'Realized >=1x': lambda df: (df['Status'] == 'Realized') & (df['Real Multiple'] >= 1),
+    'Realized <1x': lambda df: (df['Status'] == 'Realized') & (df['Real Multiple'] < 1),
+    'Locked': lambda df: (df['Status'] != 'Realized') & (df['Valuation Unknown'] == True),
+    'Marked Up': lambda df: (df['Status'] != 'Realized') & (df['Valuation Unknown'] == False) & (df['Real Multiple'] > 1),
+    'Not Marked Up': lambda df: (df['Status'] != 'Realized') & (df['Valuation Unknown'] == False) & (df['Real Multiple'] <= 1),
+}
+# Summary column -> the df column it sums. Value is Realized plus Unrealized, not the Net Value
+SUMMARY_SUMS = {'Invested': 'Invested', 'Realized': 'Realized Value', 'Unrealized': 'Unrealized Value'}
+# Best Real Multiples named in each category's Examples
+SUMMARY_EXAMPLES = 5
+
+logger = logging.getLogger(__name__)
+
+def drop_unused_columns(df):
+    # Only drop the columns that are actually present in the DataFrame
+    return df.drop(columns=[col for col in TODROP if col in df.columns])
+
+
+def compact_dtypes(df):
+    """Store the grouping columns as categoricals (Round ordered by ROUND_ORDER) and downcast integers."""
+    df = df.copy()
+    for col in CATEGORY_COLUMNS:
+        if col in df.columns:
+            df[col] = df[col].astype('category')
+    if 'Round' in df.columns:
+        # Any round we don't know about goes after the known ones so it isn't lost
+        extra_rounds = sorted(set(df['Round'].dropna().astype(str)) - set(ROUND_ORDER))
+        df['Round'] = pd.Categorical(df['Round'], categories=ROUND_ORDER + extra_rounds, ordered=True)
+    # Money stays float64 - float32 can't hold dollar amounts to the cent much past $100k
+    for col in df.select_dtypes(include='integer').columns:
+        df[col] = pd.to_numeric(df[col], downcast='integer')
+    return df
+
+
+def ingest_key(uploaded_file, **options):
+    """Content hash of the uploaded bytes plus the processing options - the cache key for ingest_upload."""
+    digest = hashlib.sha256(uploaded_file.getbuffer())
+    for name in sorted(options):
+        digest.update(f"|{name}={options[name]!r}".encode())
+    return digest.hexdigest()
+
+
+def _stream_size(handle):
+    position = handle.tell()
+    size = handle.seek(0, io.SEEK_END)
+    handle.seek(position)
+    return size
+
+
+def _concat_chunks(chunks, category_columns):
+    # Each chunk has its own categories - union them so the columns stay categorical (plain
+    # concat would turn them back into object columns)
+    columns = chunks[0].columns
+    df = pd.concat([chunk.drop(columns=category_columns) for chunk in chunks], ignore_index=True)
+    for col in category_columns:
+        df[col] = union_categoricals([chunk[col] for chunk in chunks], ignore_order=True)
+    return df[columns]
+
+
+def export_date_format(us_dates):
+    return US_DATE_FORMAT if us_dates else DAY_FIRST_DATE_FORMAT
+
+
+def parse_dates(df, us_dates):
+    """Parse the DATE_COLUMNS still held as text - month first if us_dates, otherwise day first.
+
+    Each of the convention's EXPORT_DATE_FORMATS is tried in turn on what the ones before it
+    didn't read. Anything none of them reads is left empty (NaT) and logged as a warning.
+    """
+    for col in DATE_COLUMNS:
+        if col not in df.columns or not (is_string_dtype(df[col]) or is_object_dtype(df[col])):
+            continue
+        present = df[col].fillna('').astype(str).str.strip() != ''
+        parsed = None
+        for date_format in EXPORT_DATE_FORMATS[bool(us_dates)]:
+            if parsed is not None and not (present & parsed.isna()).any():
+                break
+            text = df[col] if parsed is None else df[col].where(present & parsed.isna())
+            more = pd.to_datetime(text, format=date_format, errors='coerce')
+            # An all empty result can come back in a coarser unit (pandas 3) - don't keep that one's
+            parsed = more if parsed is None or parsed.isna().all() else parsed.fillna(more)
+        unread = present & parsed.isna()
+        if unread.any():
+            logger.warning("%d %s values aren't %s dates, eg '%s' - left empty", unread.sum(), col,
+                           'month first' if us_dates else 'day first', df.loc[unread, col].iloc[0])
+        df[col] = parsed
+    return df
+
+
+def read_export_chunked(handle, us_dates, chunksize=INGEST_CHUNK_ROWS):
+    """Read the export from handle (positioned after the title row) a chunk of rows at a time.
+
+    Only the columns we use are parsed, the grouping columns are categorical from the start and
+    the dates are parsed per chunk (see parse_dates), so memory is bounded by one chunk of text plus the compact
+    result rather than the whole file as python strings.
+    """
+    names = next(csv.reader([handle.readline().decode('utf-8-sig')]))
+    usecols = [name for name in names if name not in TODROP]
+    category_columns = [col for col in CATEGORY_COLUMNS + ['Round'] if col in usecols]
+    dtype = {col: 'category' for col in category_columns}
+    dtype.update({col: object for col in OBJECT_COLUMNS if col in usecols})
+    reader = pd.read_csv(handle, header=None, names=names, usecols=usecols, skip_blank_lines=True,
+                         dtype=dtype, chunksize=chunksize)
+    chunks = [parse_dates(chunk, us_dates) for chunk in reader]
+    if not chunks:
+        return pd.DataFrame(columns=usecols)
+    return _concat_chunks(chunks, category_columns)
+
+
+def upload_us_dates(uploaded_file):
+    """Whether an upload's dates are month first, from its title row - AngelList's own exports are.
+    Worked out before the upload is processed so it can go into the ingest key."""
+    uploaded_file.seek(0)
+    title_row = uploaded_file.readline()
+    uploaded_file.seek(0)
+    return has_angellist_data(io.BytesIO(title_row))
+
+
+def read_export(source, chunksize=None, us_dates=None):
+    """Read an export in a single pass: sniff the title row, then parse the rest of the same stream.
+
+    Returns the DataFrame (unused columns never parsed) and whether it is AngelList data. source
+    can be an uploaded file or a path. Exports over CHUNKED_INGEST_BYTES (or any, given a
+    chunksize) are read in chunks - see read_export_chunked - with their dates parsed month first
+    if us_dates, or day first, or as picked from the file when us_dates is None.
+    """
+    handle = open(source, 'rb') if isinstance(source, str) else source
+    try:
+        handle.seek(0)
+        if chunksize is None and _stream_size(handle) > CHUNKED_INGEST_BYTES:
+            chunksize = INGEST_CHUNK_ROWS
+        # The first row is a title/comment row - only it is handed to the AngelList check
+        title_row = handle.readline()
+        is_angellist = has_angellist_data(io.BytesIO(title_row))
+        # Carry on from where the title row ended so the bytes are only parsed once
+        if chunksize:
+            df = read_export_chunked(handle, is_angellist if us_dates is None else us_dates, chunksize)
+        else:
+            df = pd.read_csv(handle, header=0, skip_blank_lines=True, usecols=lambda col: col not in TODROP,
+                             dtype={col: object for col in OBJECT_COLUMNS})
+    finally:
+        if handle is not source:
+            handle.close()
+    return df, is_angellist
+
+
+def summarize(df, us_dates):
+    """process_and_summarize_data for df, with its dates read month first (us_dates) or day first.
+
+    The helper takes the date convention from st.session_state.has_angellist_data rather than as
+    an argument, so the dates are parsed here first (see parse_dates) - it keeps them as they are
+    whichever convention it finds there. Outside a script run (AL_Batch, AL_Worker's threads) the
+    helper still needs the key to be there, so it is set in Streamlit's stand-in session state -
+    every time, as that is shared by everything the process summarises.
+    """
+    if get_script_run_ctx(suppress_warning=True) is None:
+        st.session_state.has_angellist_data = us_dates
+    return process_and_summarize_data(parse_dates(df, us_dates))
+
+
+def _no_progress(stage):
+    pass
+
+
+def run_ingest(source, us_dates=None, progress=_no_progress):
+    # Read, clean and summarise a single export. us_dates (month first dates) overrides what is
+    # picked from the file - AngelList's exports are month first, anything else day first.
+    # progress is called with each stage's name as it starts (see AL_Worker.INGEST_STAGES)
+    progress('parse')
+    with span('ingest: read csv'):
+        df, is_angellist = read_export(source, us_dates=us_dates)
+    if us_dates is None:
+        us_dates = is_angellist
+    df = drop_unused_columns(df)
+    progress('summarize')
+    with span('ingest: process_and_summarize_data'):
+        df, summary_df, num_uniques, num_leads, num_zero_value_leads, num_locked, has_realized_dates = summarize(df, us_dates)
+    progress('normalize')
+    with span('ingest: compact dtypes'):
+        df = compact_dtypes(df)
+    with span('ingest: check summary'):
+        summary_verified = summary_matches(df, summary_df)
+    progress('xirr')
+    with span('ingest: portfolio xirr'):
+        # What the Stats page shows until a total value is entered for any locked investments
+        overall_xirr = portfolio_xirr(df, has_realized_dates, summary_df.loc[summary_df['Category'] == 'Totals', 'Unrealized'].iloc[0])
+    progress('aggregate')
+    with span('ingest: page aggregates'):
+        groups = build_group_store(df)
+    return {
+        'df': df,
+        'sumdf': summary_df,
+        'counters': dict(zip(COUNTERS, [num_uniques, num_leads, num_zero_value_leads, num_locked])),
+        'has_angellist_data': is_angellist,
+        'has_realized_dates': has_realized_dates,
+        'date_format': export_date_format(us_dates),
+        'summary_verified': summary_verified,
+        'overall_XIRR': overall_xirr,
+        'groups': groups,
+    }
+
+
+def _summary_rows(df, category):
+    rows = SUMMARY_CATEGORIES[category](df)
+    return df[rows.fillna(False).astype(bool)]
+
+
+def _summary_companies(rows):
+    return len(rows['Company/Fund'].unique())
+
+
+def _summary_examples(rows):
+    # 'Company (X.XXx), ...' for the best Real Multiples, sorted the same way as the helper so ties
+    # come out in the same order
+    top = rows.sort_values(by='Real Multiple', ascending=False).head(SUMMARY_EXAMPLES)
+    return ', '.join(f"{name} ({multiple:.2f}x)" for name, multiple in zip(top['Company/Fund'], top['Real Multiple']))
+
+
+def _summary_ratios(summary_df):
+    # The columns worked out from the sums - 0 rather than a division by nothing
+    summary_df['Value'] = summary_df['Realized'] + summary_df['Unrealized']
+    invested = summary_df['Invested']
+    summary_df['Multiple'] = (summary_df['Value'] / invested).where(invested != 0, 0.0)
+    total_invested = invested[summary_df['Category'] == 'Totals'].iloc[0]
+    summary_df['Percentage'] = invested / total_invested if total_invested != 0 else 0.0
+    return summary_df
+
+
+def summary_matches(df, summary_df):
+    """True if every column of every summary category can be rebuilt from SUMMARY_CATEGORIES, ie
+    update_summary is safe to use."""
+    try:
+        if list(summary_df['Category']) != list(SUMMARY_CATEGORIES):
+            return False
+        for i, category in zip(summary_df.index, summary_df['Category']):
+            rows = _summary_rows(df, category)
+            if len(rows) != summary_df.at[i, 'Investments'] or _summary_companies(rows) != summary_df.at[i, 'Companies']:
+                return False
+            if _summary_examples(rows) != summary_df.at[i, 'Examples']:
+                return False
+            for col, source in SUMMARY_SUMS.items():
+                if not np.isclose(rows[source].sum(), summary_df.at[i, col]):
+                    return False
+        rebuilt = _summary_ratios(summary_df.copy())
+        for col in ['Value', 'Multiple', 'Percentage']:
+            if not np.allclose(rebuilt[col].astype(float), summary_df[col].astype(float)):
+                return False
+    except (KeyError, IndexError, TypeError, ValueError):
+        return False
+    return True
+
+
+def update_summary(summary_df, before, after, df):
+    """Incremental process_and_summarize_data summary after some rows of the DataFrame were edited.
+
+    before and after hold just the edited rows as they were and as they are now, df is the whole
+    DataFrame after the edit. The counts and sums of each category are adjusted by the difference.
+    Companies and Examples can't be - they are rebuilt from df, but only for the categories the
+    edited rows moved in or out of (Companies) or were in (Examples).
+    """
+    summary_df = summary_df.copy()
+    for i, category in zip(summary_df.index, summary_df['Category']):
+        old_rows = _summary_rows(before, category)
+        new_rows = _summary_rows(after, category)
+        summary_df.at[i, 'Investments'] += len(new_rows) - len(old_rows)
+        for col, source in SUMMARY_SUMS.items():
+            summary_df.at[i, col] += new_rows[source].sum() - old_rows[source].sum()
+        if old_rows.empty and new_rows.empty:
+            continue
+        rows = _summary_rows(df, category)
+        if not old_rows.index.equals(new_rows.index):
+            summary_df.at[i, 'Companies'] = _summary_companies(rows)
+        summary_df.at[i, 'Examples'] = _summary_examples(rows)
+    return _summary_ratios(summary_df)
+
+@st.cache_resource
+def ingest_cache():
+    # One for the whole server process - every session uploading the same export shares the result
+    return SharedCache(INGEST_CACHE_ENTRIES, INGEST_CACHE_BYTES)
+
+
+def ingest_upload(key, uploaded_file, us_dates=None):
+    """The ingest result for an upload, processed once per server and shared by every session.
+
+    key (see ingest_key) already covers the file contents and options. The result is not copied
+    so it must be treated as read only - publish_ingest gives the session its own sumdf and
+    anything that edits the data (eg Overwrite) copies df first.
+    """
+    result = ingest_cache().get(key)
+    if result is None:
+        with st.spinner("Processing data file..."):
+            result = ingest_cache().get_or_build(key, lambda: run_ingest(uploaded_file, us_dates))
+    return result
+
+
+def bump_data_version():
+    # Anything cached against the session data (eg rendered charts) keys off this. Versions come
+    # from one counter for the session so a portfolio switched back in (AL_Workspace) can keep its own
+    st.session_state.data_version_counter = st.session_state.get('data_version_counter', st.session_state.get('data_version', 0)) + 1
+    st.session_state.data_version = st.session_state.data_version_counter
+
+
+def publish_ingest(result, key=None):
+    """Copy an ingest result into session state for the other pages."""
+    st.session_state.df = result['df']
+    # The Stats page adds the locked value to sumdf, base_sumdf is kept as processed
+    st.session_state.base_sumdf = result['sumdf']
+    st.session_state.sumdf = result['sumdf'].copy()
+    st.session_state.summary_verified = result['summary_verified']
+    for name, value in result['counters'].items():
+        st.session_state[name] = value
+    st.session_state.has_angellist_data = result['has_angellist_data']
+    st.session_state.has_realized_dates = result['has_realized_dates']
+    st.session_state.date_format = result['date_format']
+    st.session_state.has_data_file = True
+    st.session_state.total_value = 0 # Reset this so it doesn't carry over from another session
+    # Snapshots don't carry the XIRR - Stats works it out again
+    if 'overall_XIRR' in result:
+        st.session_state.overall_XIRR = result['overall_XIRR']
+    else:
+        st.session_state.pop('overall_XIRR', None)
+    st.session_state.ingest_key = key
+    bump_data_version()
+    st.session_state.group_store = (st.session_state.data_version, result['groups'])
+
+
+def session_result():
+    """The session data as an ingest result - what publish_ingest would have been given.
+
+    sumdf is the summary as processed (base_sumdf), without any locked value added on Stats.
+    """
+    return {
+        'df': st.session_state.df,
+        'sumdf': st.session_state.base_sumdf,
+        'counters': {name: st.session_state[name] for name in COUNTERS},
+        'has_angellist_data': st.session_state.has_angellist_data,
+        'has_realized_dates': st.session_state.has_realized_dates,
+        'date_format': st.session_state.get('date_format'),
+        'summary_verified': st.session_state.get('summary_verified', False),
+        'groups': group_store(),
+    }
+
+
+def invalidate_ingest(clear_cache=False):
+    """Mark the session data as no longer matching the uploaded file (eg after an Overwrite).
+
+    The next visit to Load Data with the file still selected republishes the original data.
+    clear_cache also drops every cached ingest result for the process, for every session.
+    """
+    st.session_state.ingest_key = None
+    bump_data_version()
+    if clear_cache:
+        ingest_cache().clear()
+
+
+def group_store():
+    """The page aggregates (see build_group_store) for the session data.
+
+    Built at ingest and reused until the data changes - anything that bumps the data version
+    (eg an Overwrite) has them rebuilt from the session df on next use.
+    """
+    version, store = st.session_state.get('group_store', (None, None))
+    if store is None or version != st.session_state.get('data_version'):
+        with span('page aggregates'):
+            store = build_group_store(st.session_state.df)
+        st.session_state.group_store = (st.session_state.get('data_version'), store)
+    return store
@@ -0,0 +1,149 @@
+# AL_Ledger
+# AngelList finance ledger (the Tax page file) - parse it in whole-column operations, once per file
+
+import re
+from datetime import datetime
+import streamlit as st
+import numpy as np
+import pandas as pd
+from AL_Functions import convert_date
+from AL_Ingest import ingest_key
+from AL_Xirr import batch_xirr
+
+# Wording around the company name in the Description column
+LEDGER_PHRASES = ["Closing Proceeds from", "Amount adjustment for", "Refund for", "Closing proceeds from",
+                  "Investment in", "For investment in", "Return of Capital", "Dissolution Proceeds", "Holdback", "Acquisition", "acquisition.", "acquisition", "Merger", "Distribution"]
+# Escape special characters in phrases for regex and match any of them
+LEDGER_PATTERN = re.compile("|".join(re.escape(phrase) for phrase in LEDGER_PHRASES))
+# Anything in brackets, eg the round in "Closing Proceeds from Foo (Series A)"
+PARENTHETICAL_PATTERN = re.compile(r"\(.*?\)")
+
+# Money in/out of the account that isn't about a company
+NO_COMPANY_TRANSACTIONS = ['Deposit', 'Refill']
+
+# Which company rows are money going into an investment and which are money coming back from one,
+# whatever sign the ledger gave them. Anything else (eg adjustments) keeps the ledger's own sign
+OUTFLOW_PATTERN = re.compile(r"investment in", re.IGNORECASE)
+INFLOW_PATTERN = re.compile(r"proceeds|return of capital|holdback|refund|distribution|acquisition|merger", re.IGNORECASE)
+
+# Tried in order, the first that reads every date wins - convert_date's own format first
+LEDGER_DATE_FORMATS = ["%m/%d/%y", "%m/%d/%Y", "%Y-%m-%d"]
+
+
+def ledger_company_names(df3):
+    """'Company/Fund' for every ledger row - the Description cut at the first hyphen, without
+    anything in brackets or the LEDGER_PHRASES wording (in that order, as extract_company_name
+    does), or "" for deposits and refills."""
+    names = (df3['Description'].astype('string')
+             .str.split('-', n=1).str[0]
+             .str.replace(PARENTHETICAL_PATTERN, '', regex=True)
+             .str.replace(LEDGER_PATTERN, '', regex=True)
+             .str.strip()
+             .fillna(''))
+    names = names.mask(df3['Transaction'].isin(NO_COMPANY_TRANSACTIONS), '')
+    return names.astype(object)
+
+
+def ledger_dates(dates):
+    """Parse the Date column with one to_datetime call per format tried.
+
+    Anything none of LEDGER_DATE_FORMATS reads goes through convert_date, once per distinct value.
+    """
+    present = dates.notna()
+    for date_format in LEDGER_DATE_FORMATS:
+        parsed = pd.to_datetime(dates, format=date_format, errors='coerce')
+        if parsed[present].notna().all():
+            return parsed
+    unique_dates = dates[present].unique()
+    return pd.to_datetime(dates.map(dict(zip(unique_dates, (convert_date(date) for date in unique_dates)))))
+
+
+def parse_ledger(source):
+    """Read a finance ledger CSV and add the 'Company/Fund' and 'New Date' columns."""
+    df3 = pd.read_csv(source, header=0, skip_blank_lines=True)
+    df3['Company/Fund'] = ledger_company_names(df3)
+    df3['New Date'] = ledger_dates(df3['Date'])
+    return df3
+
+
+@st.cache_data(max_entries=4, show_spinner="Processing finance file...")
+def ledger_upload(key, _uploaded_file):
+    # Only the key (see ingest_key) is hashed - it covers the file contents
+    return parse_ledger(_uploaded_file)
+
+
+def load_ledger(uploaded_file):
+    return ledger_upload(ingest_key(uploaded_file), uploaded_file)
+
+
+def company_transactions(df3):
+    """Ledger rows for the companies that had at least one Disbursement, by company and date."""
+    df_t = df3[df3['Company/Fund'] != ""]
+    # Companies with at least one disbursement
+    disbursed = df_t.loc[df_t['Transaction'] == 'Disbursement', 'Company/Fund'].unique()
+    df_sorted = df_t[df_t['Company/Fund'].isin(disbursed)].sort_values(['Company/Fund', 'New Date'], ascending=[True, True])
+    # Show 'Company/Fund' first and drop the Balance column
+    return df_sorted[['Company/Fund', 'New Date', 'Transaction', 'Description', 'Amount', 'Date']]
+
+
+def ledger_cash_flows(df3):
+    """Dated cash flows per company from a parsed ledger - negative out, positive back in.
+
+    One row per ledger line with a company and a non-zero amount, with the Company/Fund, New Date
+    (as Date) and the signed Amount.
+    """
+    rows = df3[df3['Company/Fund'] != ""]
+    amount = pd.to_numeric(rows['Amount'], errors='coerce').astype(float)
+    description = rows['Description'].astype('string').fillna('')
+    outflow = description.str.contains(OUTFLOW_PATTERN).to_numpy(dtype=bool)
+    inflow = (description.str.contains(INFLOW_PATTERN) | (rows['Transaction'] == 'Disbursement')).to_numpy(dtype=bool) & ~outflow
+    signed = np.where(outflow, -amount.abs(), np.where(inflow, amount.abs(), amount))
+    flows = pd.DataFrame({'Company/Fund': rows['Company/Fund'].to_numpy(), 'Date': rows['New Date'].to_numpy(), 'Amount': signed})
+    return flows[(flows['Amount'] != 0) & flows['Amount'].notna()].reset_index(drop=True)
+
+
+def ledger_index(df3):
+    """Company/Fund -> positions of its rows in df3, so one company's lines are found without a scan."""
+    return df3.groupby('Company/Fund', sort=False).indices
+
+
+def _unrealized_by_company(df):
+    # Value still held per company in the export, by company name
+    unrealized = df.groupby('Company/Fund', observed=True)['Unrealized Value'].sum()
+    unrealized.index = unrealized.index.astype(str)
+    return unrealized
+
+
+def ledger_company_xirr(flows, df=None, as_of=None):
+    """XIRR per company from its ledger flows, solved for every company in one batch.
+
+    With the investment DataFrame (df) each company's Unrealized Value is added back at as_of so a
+    company that is still held isn't judged on its partial returns alone. NaN where there is
+    no solution (eg money out but nothing back yet and nothing held).
+    """
+    flows = flows.copy()
+    if df is not None:
+        unrealized = _unrealized_by_company(df).reindex(flows['Company/Fund'].unique()).fillna(0.0)
+        held = unrealized[unrealized != 0]
+        as_of = pd.Timestamp(as_of if as_of is not None else datetime.now())
+        flows = pd.concat([flows, pd.DataFrame({'Company/Fund': held.index, 'Date': as_of, 'Amount': held.to_numpy()})], ignore_index=True)
+    return batch_xirr(flows, 'Company/Fund')
+
+
+def ledger_portfolio_xirr(flows, unrealized_value=0.0, as_of=None):
+    """Portfolio XIRR from every ledger flow plus the unrealized total back at as_of."""
+    as_of = pd.Timestamp(as_of if as_of is not None else datetime.now())
+    flows = pd.concat([flows.assign(Portfolio=0), pd.DataFrame({'Portfolio': [0], 'Date': [as_of], 'Amount': [float(unrealized_value)]})], ignore_index=True)
+    return batch_xirr(flows[flows['Amount'] != 0], 'Portfolio').get(0, np.nan)
+
+
+def ledger_summary(flows, df=None, as_of=None):
+    """Invested, returned and XIRR per company from the ledger, plus the Unrealized Value held when df is given."""
+    summary = flows.assign(
+        Invested=-flows['Amount'].clip(upper=0),
+        Returned=flows['Amount'].clip(lower=0),
+    ).groupby('Company/Fund').agg(Invested=('Invested', 'sum'), Returned=('Returned', 'sum'), First=('Date', 'min'), Last=('Date', 'max'))
+    if df is not None:
+        summary['Unrealized'] = _unrealized_by_company(df).reindex(summary.index).fillna(0.0)
+    summary['Ledger XIRR'] = ledger_company_xirr(flows, df, as_of).reindex(summary.index)
+    return summary.reset_index()
@@ -0,0 +1,145 @@
+# AL_Names
+# Match company names from the Enhancement file and the finance ledger to the Company/Fund names
+# in the data file, allowing for case, punctuation, company suffixes and small spelling differences
+#
+# Names are normalized (see normalize_names) and looked up exactly first. Anything left is
+# scored only against the names sharing its rarer trigrams, through an inverted index, so
+# resolving a file costs about one lookup per distinct name rather than a comparison with every
+# company in the portfolio.
+
+import re
+from collections import defaultdict, OrderedDict
+import streamlit as st
+import numpy as np
+import pandas as pd
+
+# Words dropped from the end of a name before comparing - "Acme, Inc." and "ACME" are the same company
+NAME_SUFFIXES = ['inc', 'incorporated', 'llc', 'ltd', 'limited', 'corp', 'corporation', 'co', 'company', 'plc', 'gmbh', 'sa', 'sas', 'bv', 'pbc', 'spv', 'fund', 'lp']
+_SUFFIX_PATTERN = re.compile(r"(?:\s+(?:" + '|'.join(NAME_SUFFIXES) + r"))+$")
+_PUNCTUATION = re.compile(r"[^\w\s]")
+_SPACES = re.compile(r"\s+")
+_NUMBERS = re.compile(r"\d+")
+
+# Trigram similarity (Dice - twice the shared trigrams over the total) a name needs to be matched to
+# a company it isn't identical to after normalizing. Numbers in the names must be the same too, so
+# "Fund 2" is never taken for "Fund 3"
+MATCH_THRESHOLD = 0.75
+
+# A name that is about as close to two companies as it is to one matches neither
+AMBIGUOUS_MARGIN = 0.05
+
+# Trigrams in more than this share of the names don't pick candidates (they'd pick nearly
+# everyone) but still count towards the score
+COMMON_TRIGRAM_SHARE = 0.05
+# Candidates scored in full for each name, those sharing the most rare trigrams first
+MAX_CANDIDATES = 20
+
+# Frames whose names have been matched, kept per session
+MATCHED_FRAMES = 4
+
+
+def normalize_names(names):
+    """Comparison keys for a Series of names - lower case, no punctuation or company suffix, single spaced."""
+    keys = (names.astype('string').fillna('').str.lower()
+            .str.replace(_PUNCTUATION, ' ', regex=True)
+            .str.replace(_SPACES, ' ', regex=True)
+            .str.strip()
+            .str.replace(_SUFFIX_PATTERN, '', regex=True))
+    return keys.astype(object)
+
+
+def trigrams(key):
+    padded = f"  {key} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+class NameIndex:
+    """Canonical company names with an exact index on their normalized keys and a trigram index for the rest."""
+
+    def __init__(self, names, threshold=MATCH_THRESHOLD):
+        self.names = pd.Index(pd.Series(names).dropna().astype(str).unique())
+        self.threshold = threshold
+        keys = normalize_names(pd.Series(self.names))
+        self._by_name = {name: name for name in self.names}
+        # The first name with a key wins if two normalize the same
+        self._by_key = {}
+        for name, key in zip(self.names, keys):
+            self._by_key.setdefault(key, name)
+        self._grams = [trigrams(key) for key in keys]
+        self._numbers = [_NUMBERS.findall(key) for key in keys]
+        postings = defaultdict(list)
+        for position, grams in enumerate(self._grams):
+            for gram in grams:
+                postings[gram].append(position)
+        common = max(1, int(COMMON_TRIGRAM_SHARE * len(self.names)))
+        self._postings = {gram: np.array(rows) for gram, rows in postings.items() if len(rows) <= common or len(self.names) < 50}
+        self._resolved = {}
+
+    def _closest(self, key):
+        grams = trigrams(key)
+        numbers = _NUMBERS.findall(key)
+        hits = [self._postings[gram] for gram in grams if gram in self._postings]
+        if not hits:
+            return None
+        candidates, shared = np.unique(np.concatenate(hits), return_counts=True)
+        scores = []
+        for position in candidates[np.argsort(-shared, kind='stable')[:MAX_CANDIDATES]]:
+            if self._numbers[position] == numbers:
+                other = self._grams[position]
+                scores.append((2 * len(grams & other) / (len(grams) + len(other)), position))
+        scores.sort(reverse=True)
+        if not scores or scores[0][0] < self.threshold:
+            return None
+        if len(scores) > 1 and scores[0][0] - scores[1][0] < AMBIGUOUS_MARGIN:
+            return None
+        return self.names[scores[0][1]]
+
+    def resolve(self, names):
+        """{name: canonical name or None} for each distinct name, normalizing the new ones in one go."""
+        new = [name for name in names if name not in self._resolved]
+        unmatched = []
+        for name in new:
+            self._resolved[name] = self._by_name.get(name)
+            if self._resolved[name] is None:
+                unmatched.append(name)
+        for name, key in zip(unmatched, normalize_names(pd.Series(unmatched, dtype=object))):
+            if key:
+                self._resolved[name] = self._by_key.get(key) or self._closest(key)
+        return {name: self._resolved[name] for name in names}
+
+    def map(self, names):
+        """names mapped to canonical names - unmatched and empty names are kept as they are."""
+        names = pd.Series(names)
+        lookup = self.resolve([name for name in names.dropna().astype(str).unique() if name])
+        return names.map(lambda name: lookup.get(name) or name if isinstance(name, str) else name)
+
+
+def name_index():
+    """The NameIndex for the session data's Company/Fund names, rebuilt when the data version changes."""
+    version, index = st.session_state.get('name_index', (None, None))
+    if index is None or version != st.session_state.get('data_version'):
+        index = NameIndex(st.session_state.df['Company/Fund'])
+        st.session_state.name_index = (st.session_state.get('data_version'), index)
+    return index
+
+
+def matched_names(frame, col='Company/Fund'):
+    """frame with its col names replaced by the matching Company/Fund names from the session data.
+
+    Worked out once per frame and data version and kept across reruns. Returns frame itself when
+    no data file is loaded or frame has no col.
+    """
+    if not st.session_state.get('has_data_file', False) or col not in frame.columns:
+        return frame
+    matched = st.session_state.setdefault('matched_frames', OrderedDict())
+    key = (id(frame), col, st.session_state.get('data_version'))
+    entry = matched.get(key)
+    # The frame is kept with its result so a new frame reusing the id isn't mistaken for it
+    if entry is None or entry[0] is not frame:
+        result = frame.copy()
+        result[col] = name_index().map(frame[col]).to_numpy()
+        entry = matched[key] = (frame, result)
+        while len(matched) > MATCHED_FRAMES:
+            matched.popitem(last=False)
+    matched.move_to_end(key)
+    return entry[1]
@@ -0,0 +1,64 @@
+# AL_Overwrite
+# Overwrite primary investment values with the 'New Value' column from the Enhancement file
+
+from datetime import datetime
+import numpy as np
+import pandas as pd
+from AL_Functions import convert_date
+from AL_Xirr import row_xirr
+
+# Columns the change log reports, old and new
+CHANGE_COLUMNS = ['Company/Fund', 'Invest Date', 'Old Value', 'New Value', 'Old Real Multiple', 'New Real Multiple', 'Old XIRR', 'New XIRR']
+
+
+def match_new_values(df, df2):
+    """Match each 'New Value' in df2 to every df row with the same Company/Fund and Invest Date.
+
+    Returns the df index labels that match and the value for each of them.
+    """
+    updates = df2.loc[df2['New Value'].notna(), ['Company/Fund', 'Match Date', 'New Value']].copy()
+    updates['Match Date'] = updates['Match Date'].apply(convert_date)
+    # If the Enhancement file repeats a match the last one wins
+    updates = updates.drop_duplicates(subset=['Company/Fund', 'Match Date'], keep='last')
+    rows = df[['Company/Fund', 'Invest Date']].assign(Row=np.arange(len(df)))
+    matched = rows.merge(updates, left_on=['Company/Fund', 'Invest Date'], right_on=['Company/Fund', 'Match Date'], how='inner')
+    return df.index[matched['Row'].to_numpy()], matched['New Value'].astype(float).to_numpy()
+
+
+def apply_overwrite(df, df2, as_of=None):
+    """Overwrite Net Value, Unrealized Value, Real Multiple and XIRR in df (in place) from df2.
+
+    Returns the index labels that changed, those rows as they were before the change and a
+    DataFrame logging the old and new values.
+    """
+    as_of = as_of if as_of is not None else datetime.now()
+    touched, new_values = match_new_values(df, df2)
+    if len(touched) == 0:
+        return touched, df.iloc[:0].copy(), pd.DataFrame(columns=CHANGE_COLUMNS)
+
+    # Store old values
+    before = df.loc[touched].copy()
+    old = pd.DataFrame(index=touched)
+    old['Net Value'] = before['Net Value']
+    old['Real Multiple'] = before['Real Multiple'] if 'Real Multiple' in df.columns else 0
+    old['XIRR'] = before['XIRR'] if 'XIRR' in df.columns else 0
+
+    # Unrealized Value has to be set too or it gets overridden when everything is recalculated
+    df.loc[touched, 'Net Value'] = new_values
+    df.loc[touched, 'Unrealized Value'] = new_values
+    # As process_and_summarize_data works it out, so a realized investment keeps what it returned
+    df.loc[touched, 'Real Multiple'] = (df.loc[touched, 'Realized Value'].to_numpy(dtype=float) + new_values) / df.loc[touched, 'Invested'].to_numpy(dtype=float)
+    # Only the touched rows get their XIRR recalculated, all in one batch
+    df.loc[touched, 'XIRR'] = row_xirr(df.loc[touched], as_of).fillna(0.0).to_numpy()
+
+    changes_df = pd.DataFrame({
+        'Company/Fund': df.loc[touched, 'Company/Fund'].to_numpy(),
+        'Invest Date': df.loc[touched, 'Invest Date'].to_numpy(),
+        'Old Value': old['Net Value'].to_numpy(),
+        'New Value': df.loc[touched, 'Net Value'].to_numpy(),
+        'Old Real Multiple': old['Real Multiple'].to_numpy(),
+        'New Real Multiple': df.loc[touched, 'Real Multiple'].to_numpy(),
+        'Old XIRR': old['XIRR'].to_numpy(),
+        'New XIRR': df.loc[touched, 'XIRR'].to_numpy(),
+    }, columns=CHANGE_COLUMNS)
+    return touched, before, changes_df
@@ -0,0 +1,199 @@
+# AL_Pages
+# The tables and charts behind the analysis pages as functions of the data alone, so the pages
+# and the background warm-up (see AL_Prefetch) build them the same way and under the same keys
+
+import pandas as pd
+from AL_Aggregates import ROUND_ORDER
+from AL_Xirr import company_xirr
+from AL_Charts import (
+    treemap_figure, waterfall_figure, pie_figure, valuation_boxplot_figure, round_valuations_figure,
+    year_bars_figure, invested_over_time_figure, multiples_figure, invested_figure,
+    invested_vs_multiple_figure, lead_pie_figure, instruments_figure, themed
+)
+
+# Slider and selector values the pages open with - what the warm-up draws
+DEFAULT_TOP = 5
+DEFAULT_MARKETS = 8
+DEFAULT_ROUNDS = 3
+
+
+def _company_columns_first(table):
+    # Reorder columns to place 'Real Multiple' and 'XIRR' after 'Company/Fund'
+    cols = table.columns.tolist()
+    if 'Real Multiple' in cols and 'XIRR' in cols and 'Company/Fund' in cols :
+        cols.remove('Real Multiple')
+        cols.remove('XIRR')
+        company_index = cols.index('Company/Fund')
+        cols.insert(company_index + 1, 'Real Multiple')
+        cols.insert(company_index + 2, 'XIRR')
+        table = table[cols]
+    return table
+
+
+def top_investments(df):
+    """Investments returning more than 1x, best multiple first, with the display columns."""
+    filtered_df = df[df['Real Multiple'] > 1]
+    sorted_df = filtered_df.dropna(subset=['Real Multiple']).sort_values(by='Real Multiple', ascending=False)
+    sorted_df = sorted_df.drop(columns=['Status','Valuation Unknown', 'Multiple', 'Round Size'])
+    return _company_columns_first(sorted_df)
+
+
+def company_totals(df, has_realized_dates, as_of):
+    """Investments aggregated by Company/Fund with their Real Multiple and XIRR (as of as_of)."""
+    sorted_df = df.drop(columns=['Status','Valuation Unknown', 'Multiple', 'Round Size'])
+    aggregations = dict(
+        Invested=('Invested', 'sum'),
+        Net_Value=('Net Value', 'sum'),
+        Unrealized=('Unrealized Value', 'sum'),
+        Realized=('Realized Value', 'sum'),
+        First_Invest_Date=('Invest Date', 'min'),  # don't use either of these values yet
+        Last_Invest_Date=('Invest Date', 'max'), # this is the second not used
+    )
+    if 'URL' in sorted_df.columns:
+        aggregations['URL'] = ('URL', 'first')
+    grouped = sorted_df.groupby('Company/Fund', observed=True).agg(**aggregations).reset_index()
+    grouped['Real Multiple'] = grouped['Net_Value'] / grouped['Invested']
+    # Every company's investments are outflows and realizations inflows, with anything still
+    # held valued at as_of - all companies are solved together in one batch
+    company_xirrs = company_xirr(df, has_realized_dates, as_of)
+    grouped['XIRR'] = company_xirrs.reindex(grouped['Company/Fund']).fillna(0.0).to_numpy()
+    return grouped
+
+
+def realized_investments(df):
+    """The Realized (or Dead) investments, best Real Multiple first, with their Profit and the
+    display columns after Company/Fund - XIRR as a percentage."""
+    # Find rows where 'Status' is 'Realized' or 'Dead' - note not using Dead any more
+    status_realized_or_dead = df[df['Status'].isin(['Realized', 'Dead'])]
+
+    # Calculate profit and loss and Real Multiple (can be inaccurate in AngelList)
+    result_a = status_realized_or_dead.copy()
+    result_a["Profit"] = result_a["Realized Value"] - result_a["Invested"]
+    result_a['Real Multiple'] = result_a['Realized Value']/result_a['Invested']
+    result_sorted = result_a.sort_values(by='Real Multiple', ascending=False)
+
+    # reorder some columns
+    # insert Multiple after and remove the prior position
+    name_column_index = result_sorted.columns.get_loc('Company/Fund')
+    result_sorted.insert(name_column_index+1, 'Lead', result_sorted.pop('Lead'))
+    result_sorted.insert(name_column_index+1, 'XIRR', result_sorted.pop('XIRR'))
+    result_sorted.insert(name_column_index+1, 'Profit', result_sorted.pop('Profit'))
+    result_sorted.insert(name_column_index+1, 'Real Multiple', result_sorted.pop('Real Multiple'))
+    result_sorted['XIRR']=result_sorted['XIRR']*100 # For display only
+    return result_sorted
+
+
+def top_rows(table, top_filter, df2=None):
+    """The first top_filter rows of table for display - XIRR as a percentage and the Enhancement
+    file's columns (df2, names already matched) merged in when there is one."""
+    top_X_num = table.head(top_filter).copy()
+    top_X_num.loc[:,'XIRR'] = top_X_num['XIRR']*100
+    top_X_num = _company_columns_first(top_X_num)
+    if df2 is not None:
+        top_X_num = pd.merge(top_X_num, df2, on='Company/Fund', how='left')
+    return top_X_num
+
+
+def top_companies(grouped):
+    """company_totals best Real Multiple first."""
+    return grouped.dropna(subset=['Real Multiple']).sort_values(by='Real Multiple', ascending=False)
+
+
+def pie_slices(grouped, col, top=None, sort=True):
+    """grouped with negative col values counted as 0 (a pie can't show them), largest first and
+    limited to top rows."""
+    grouped = grouped.copy()
+    grouped.loc[grouped[col] < 0, col] = 0
+    if sort:
+        grouped = grouped.sort_values(by=col, ascending=False)
+    return grouped if top is None else grouped.head(top)
+
+
+def valid_rounds(groups):
+    """The rounds in the data in ROUND_ORDER."""
+    round_stats = groups['stats']['Round']
+    return [round_name for round_name in ROUND_ORDER if round_name in round_stats.index]
+
+
+def valuation_summary(df, groups):
+    """Count, median, min and max Valuation or Cap by round with a Total row."""
+    rounds = valid_rounds(groups)
+    valuations = groups['stats']['Round'].reindex(rounds)
+    summary_df = pd.DataFrame({
+        "Round": rounds,
+        "Count": valuations['Investments'].fillna(0).astype(int).to_numpy(),
+        "Median": valuations['Median Valuation'].fillna(0).to_numpy(),
+        "Min": valuations['Min Valuation'].fillna(0).to_numpy(),
+        "Max": valuations['Max Valuation'].fillna(0).to_numpy()
+    })
+    overall_min = summary_df["Min"].min()
+    overall_max = summary_df["Max"].max()
+    total_row = pd.DataFrame([["Total", df["Round"].size, groups['median_valuation'], overall_min, overall_max]], columns=summary_df.columns)
+    summary_df = pd.concat([summary_df, total_row], ignore_index=True)
+    summary_df['Round'] = pd.Categorical(summary_df['Round'], categories=ROUND_ORDER + ['Total'], ordered=True)
+    return summary_df.sort_values("Round")
+
+
+def round_investments(df, round_name):
+    """The round's investments with a Valuation or Cap (the rest can't be plotted) by Invest Date."""
+    investments = df[df['Round'] == round_name].sort_values(by='Invest Date')
+    return investments.dropna(subset=['Valuation or Cap'])
+
+
+def has_valuations(df):
+    return 'Valuation or Cap' in df.columns and not df['Valuation or Cap'].isnull().all()
+
+
+def page_work(page, data):
+    """The values and default-parameter charts for page, in the order the page shows them.
+
+    data has the session's df, groups (the group store), df2 (the matched Enhancement file or
+    None), has_realized_dates, advanced_user and as_of. Yields ('value', key, value) and
+    ('chart', key, draw) with the keys the page itself uses (see ALMenu), so anything built
+    ahead of time is picked up when the page is shown.
+    """
+    df = data['df']
+    groups = data['groups']
+    has_enhanced = data['df2'] is not None
+    if page == "Top Investments":
+        table = top_investments(df)
+        yield 'value', ('Top Investments', 'table'), table
+        rows = top_rows(table, DEFAULT_TOP, data['df2'])
+        yield 'chart', ('Top Investments', 'treemap', DEFAULT_TOP, has_enhanced), lambda: treemap_figure(rows['Net Value'], rows['Company/Fund'], rows['Real Multiple'])
+        yield 'chart', ('Top Investments', 'waterfall'), lambda: waterfall_figure(df, 'Net Value', "Waterfall Chart of Value Increase by Investment (Over 1%)")
+    elif page == "Top by Company":
+        grouped = company_totals(df, data['has_realized_dates'], data['as_of'])
+        yield 'value', ('Top by Company', 'companies'), grouped
+        rows = top_rows(top_companies(grouped), DEFAULT_TOP, data['df2'])
+        # Zero values can't be plotted
+        rows = rows[rows['Net_Value'] > 0]
+        yield 'chart', ('Top by Company', 'treemap', DEFAULT_TOP, has_enhanced), lambda: treemap_figure(rows['Net_Value'], rows['Company/Fund'], rows['Real Multiple'])
+        yield 'chart', ('Top by Company', 'waterfall'), lambda: waterfall_figure(grouped, 'Net_Value', 'Value Increase by Investment (showing > 1%)')
+    elif page == "Round":
+        invested = pie_slices(groups['round'], 'Invested')
+        yield 'chart', ('Round', 'invested pie'), lambda: pie_figure(invested["Invested"], invested["Round"], 'Investment Amount by Round')
+        increase = pie_slices(groups['round'], 'Increase', sort=False)
+        yield 'chart', ('Round', 'value pie'), lambda: pie_figure(increase["Increase"], increase["Round"], 'Value created by Round')
+        rounds = valid_rounds(groups)
+        if has_valuations(df) and rounds:
+            yield 'chart', ('Round', 'valuation boxplot', DEFAULT_ROUNDS), lambda: valuation_boxplot_figure(df, rounds[:DEFAULT_ROUNDS], groups['median_valuation'])
+            summary_df = valuation_summary(df, groups)
+            median_val = summary_df.loc[summary_df['Round'] == rounds[0], 'Median'].iloc[0]
+            investments = round_investments(df, rounds[0])
+            yield 'chart', ('Round', 'valuation scatter', rounds[0]), lambda: round_valuations_figure(investments, rounds[0], median_val)
+    elif page == "Market":
+        invested = pie_slices(groups['market'], 'Invested', DEFAULT_MARKETS)
+        yield 'chart', ('Market', 'invested pie', DEFAULT_MARKETS), lambda: pie_figure(invested["Invested"], invested["Market"], 'Investment Amount by Market')
+        increase = pie_slices(groups['market'], 'Increase', DEFAULT_MARKETS)
+        yield 'chart', ('Market', 'value pie', DEFAULT_MARKETS), lambda: pie_figure(increase["Increase"], increase["Market"], 'Value created by Market')
+    elif page == "Year":
+        if 'Invest Date' in df.columns:
+            yield 'chart', ('Year', 'bars'), lambda: year_bars_figure(groups['year'])
+            yield 'chart', ('Year', 'over time'), lambda: invested_over_time_figure(df)
+    elif page == "Graphs":
+        yield 'chart', ('Graphs', 'multiples'), themed(lambda: multiples_figure(df))
+        yield 'chart', ('Graphs', 'invested'), themed(lambda: invested_figure(df))
+        yield 'chart', ('Graphs', 'invested vs multiple'), themed(lambda: invested_vs_multiple_figure(df))
+        yield 'chart', ('Graphs', 'lead pie'), themed(lambda: lead_pie_figure(df))
+        if data['advanced_user'] and 'Instrument' in df.columns:
+            yield 'chart', ('Graphs', 'instruments'), themed(lambda: instruments_figure(df, groups['stats']['Instrument']['Invested']))
@@ -0,0 +1,171 @@
+# AL_Prefetch
+# Opt-in warm-up - once the data is loaded, build every analysis page's tables and default charts
+# (see AL_Pages.page_work) on background threads so switching pages doesn't wait for them
+#
+# Each page is one task in a process-wide pool so the pages are prepared side by side. The
+# numbers (eg the per-company XIRR) run in parallel, the charts take turns as they share
+# matplotlib's settings (see AL_Charts.draw_image). Results are kept per session in a Prefetch
+# for the data version they were built from - charts move to the session's figure cache when
+# they are first shown.
+
+import logging
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, wait
+from datetime import datetime
+import streamlit as st
+from AL_Cache import value_bytes
+from AL_Charts import draw_image
+from AL_Ingest import group_store
+from AL_Names import matched_names
+from AL_Pages import page_work
+from AL_Profile import span
+
+# Pages prepared, in this order
+PREFETCH_PAGES = ["Top Investments", "Top by Company", "Round", "Market", "Year", "Graphs"]
+
+# Pages prepared at once for the whole server - more wait their turn
+PREFETCH_WORKERS = 4
+
+# Prepared tables and images kept per session - the oldest are dropped first past this
+PREFETCH_MAX_BYTES = 32 * 1024 * 1024
+
+logger = logging.getLogger(__name__)
+
+
+@st.cache_resource
+def prefetch_workers():
+    return ThreadPoolExecutor(max_workers=PREFETCH_WORKERS, thread_name_prefix='al_prefetch')
+
+
+class Prefetch:
+    """The pages prepared in the background for one version of a session's data.
+
+    Entries are keyed like the figure cache, (data_version, image_format) + chart key, for
+    images and (data_version, 'value') + key for tables. A page still being prepared when it is
+    asked for is waited on rather than built a second time alongside.
+    """
+
+    def __init__(self, version, enhanced=False, image_format='png', max_bytes=PREFETCH_MAX_BYTES):
+        self.version = version
+        # Whether the Enhancement file was merged in - the treemaps differ
+        self.enhanced = enhanced
+        self.image_format = image_format
+        self.max_bytes = max_bytes
+        self.entries = OrderedDict()
+        self.futures = {}
+        # Pages prepared in full, and page -> the exception that stopped one being prepared
+        self.prepared = set()
+        self.errors = {}
+        self._lock = threading.Lock()
+        self._cancelled = threading.Event()
+
+    def start(self, data, workers, pages=PREFETCH_PAGES):
+        # data and workers are looked up by the caller, on the script thread
+        for page in pages:
+            self.futures[page] = workers.submit(self._run, page, data)
+        return self
+
+    def _run(self, page, data):
+        try:
+            for kind, key, item in page_work(page, data):
+                if self._cancelled.is_set():
+                    return
+                if kind == 'chart':
+                    self._put((self.version, self.image_format) + key, draw_image(item, self.image_format))
+                else:
+                    self._put((self.version, 'value') + key, item)
+            self.prepared.add(page)
+        except Exception as e:
+            # Whatever wasn't prepared is built by the page as usual - the error is kept for the
+            # Load Data page and logged with its traceback
+            self.errors[page] = e
+            logger.exception("Preparing the %s page in the background failed", page)
+
+    def _put(self, key, value):
+        size = len(value) if isinstance(value, bytes) else value_bytes(value)
+        with self._lock:
+            self.entries[key] = (value, size)
+            while len(self.entries) > 1 and sum(size for _, size in self.entries.values()) > self.max_bytes:
+                self.entries.popitem(last=False)
+
+    def _wait_for(self, key):
+        # key[2] is the page - wait if it is being prepared right now, not if it is still queued
+        future = self.futures.get(key[2]) if len(key) > 2 else None
+        if future is not None and future.running():
+            wait([future])
+
+    def get(self, key):
+        """The prepared value for key, or None."""
+        if key[0] != self.version:
+            return None
+        self._wait_for(key)
+        with self._lock:
+            entry = self.entries.get(key)
+        return None if entry is None else entry[0]
+
+    def take(self, key):
+        """get, dropping the entry - for whoever keeps it from then on (eg the figure cache)."""
+        value = self.get(key)
+        if value is not None:
+            with self._lock:
+                self.entries.pop(key, None)
+        return value
+
+    def cancel(self):
+        self._cancelled.set()
+        for future in self.futures.values():
+            future.cancel()
+
+    def progress(self):
+        """(pages prepared, pages that failed, pages) - cancelled pages are neither."""
+        return len(self.prepared), len(self.errors), len(self.futures)
+
+
+def page_data():
+    """What AL_Pages.page_work needs from the session, gathered on the script thread."""
+    has_enhanced = st.session_state.get('has_enhanced_data_file', False)
+    return {
+        'df': st.session_state.df,
+        'groups': group_store(),
+        'df2': matched_names(st.session_state.df2) if has_enhanced else None,
+        'has_realized_dates': st.session_state.get('has_realized_dates', False),
+        'advanced_user': st.session_state.get('advanced_user', False),
+        'as_of': datetime.now(),
+    }
+
+
+def start_prefetch():
+    """Prepare the pages for the session data, unless that is already under way for this data
+    version and Enhancement file. Anything prepared for earlier data is dropped."""
+    version = st.session_state.get('data_version')
+    enhanced = st.session_state.get('has_enhanced_data_file', False)
+    prefetch = st.session_state.get('prefetch')
+    if prefetch is not None and prefetch.version == version and prefetch.enhanced == enhanced:
+        return prefetch
+    stop_prefetch()
+    with span('prefetch: start'):
+        st.session_state.prefetch = Prefetch(version, enhanced).start(page_data(), prefetch_workers())
+    return st.session_state.prefetch
+
+
+def stop_prefetch():
+    prefetch = st.session_state.pop('prefetch', None)
+    if prefetch is not None:
+        prefetch.cancel()
+
+
+def page_value(key, build):
+    """The value for key (eg ('Top by Company', 'companies')) for the session data - kept from an
+    earlier rerun, prepared in the background, or build() - and kept until the data changes."""
+    version = st.session_state.get('data_version')
+    values = st.session_state.setdefault('page_values', {})
+    entry = values.get(tuple(key))
+    if entry is not None and entry[0] == version:
+        return entry[1]
+    prefetch = st.session_state.get('prefetch')
+    value = prefetch.take((version, 'value') + tuple(key)) if prefetch is not None else None
+    if value is None:
+        value = build()
+    values[tuple(key)] = (version, value)
+    return value
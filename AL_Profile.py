@@ -0,0 +1,166 @@
+# AL_Profile
+# Named timing spans for the pipeline stages and page sections, with optional memory tracking,
+# for the profiling panel advanced users get in the sidebar
+
+import json
+import threading
+import time
+import tracemalloc
+import weakref
+from collections import deque
+from contextlib import contextmanager
+import streamlit as st
+import pandas as pd
+from AL_Cache import value_bytes
+
+# Reruns kept for the panel and the JSON export, oldest dropped first
+PROFILE_HISTORY = 20
+
+# The Profiler recording the rerun running on this thread, if any. Streamlit runs each session's
+# script on its own thread, and code with no profiler (eg AL_Batch) pays for one getattr per span
+_active = threading.local()
+
+# The Profilers tracking memory, from every session. tracemalloc is one per process so it runs
+# while any of them wants it - a session that goes away drops out along with its Profiler
+_memory_users = weakref.WeakSet()
+_memory_lock = threading.Lock()
+
+
+def _set_tracing(profiler, on):
+    # Start tracemalloc for the first profiler tracking memory and stop it after the last
+    with _memory_lock:
+        if on:
+            _memory_users.add(profiler)
+        else:
+            _memory_users.discard(profiler)
+        if _memory_users and not tracemalloc.is_tracing():
+            tracemalloc.start()
+        elif not _memory_users and tracemalloc.is_tracing():
+            tracemalloc.stop()
+
+
+class Profiler:
+    """Spans for a session's recent reruns, newest last.
+
+    Each rerun is a dict with the page, its total seconds, the spans in the order they started
+    (name, depth, start and seconds) and the size of the DataFrames held in session state. With
+    track_memory each span and the rerun also get the peak memory allocated while they ran,
+    from tracemalloc, which makes everything noticeably slower while it is on. tracemalloc
+    covers the whole process, so those figures include whatever other sessions did meanwhile.
+    """
+
+    def __init__(self, history=PROFILE_HISTORY):
+        self.runs = deque(maxlen=history)
+        self._track_memory = False
+        self._run = None
+        self._open = []
+
+    @property
+    def track_memory(self):
+        return self._track_memory
+
+    @track_memory.setter
+    def track_memory(self, on):
+        self._track_memory = bool(on)
+        _set_tracing(self, self._track_memory)
+
+    def start_run(self, page=None):
+        self._run = {'page': page, 'started': time.time(), 'seconds': None, 'spans': []}
+        self._open = [self._run]
+        # Also stops tracemalloc if the sessions that wanted it have gone
+        _set_tracing(self, self.track_memory)
+        self._begin(self._run)
+        _active.profiler = self
+
+    def finish_run(self, page=None, state=None):
+        """Close the rerun, note the DataFrames held in state (eg st.session_state) and keep it."""
+        _active.profiler = None
+        if self._run is None:
+            return None
+        run = self._run
+        self._end(run)
+        if page is not None:
+            run['page'] = page
+        if state is not None:
+            sizes = {str(key): value_bytes(state[key]) for key in list(state.keys())}
+            run['state_bytes'] = {key: size for key, size in sorted(sizes.items(), key=lambda item: -item[1]) if size}
+        self.runs.append(run)
+        self._run = None
+        self._open = []
+        return run
+
+    @contextmanager
+    def span(self, name):
+        record = {'name': name, 'depth': len(self._open) - 1}
+        self._run['spans'].append(record)
+        self._begin(record)
+        self._open.append(record)
+        try:
+            yield record
+        finally:
+            self._open.pop()
+            self._end(record)
+
+    def _begin(self, record):
+        record['_clock'] = time.perf_counter()
+        record['start'] = record['_clock'] - self._open[0]['_clock'] if self._open else 0.0
+        if self.track_memory and tracemalloc.is_tracing():
+            # tracemalloc has one peak - hand it to the spans already open before resetting it
+            current, peak = tracemalloc.get_traced_memory()
+            self._raise_peaks(peak)
+            tracemalloc.reset_peak()
+            record['_memory'] = record['_peak'] = current
+
+    def _end(self, record):
+        record['seconds'] = time.perf_counter() - record.pop('_clock')
+        if '_memory' in record and tracemalloc.is_tracing():
+            current, peak = tracemalloc.get_traced_memory()
+            self._raise_peaks(peak)
+            record['_peak'] = max(record['_peak'], peak)
+            record['peak_bytes'] = record.pop('_peak') - record['_memory']
+            record['retained_bytes'] = current - record.pop('_memory')
+
+    def _raise_peaks(self, peak):
+        for record in self._open:
+            if '_peak' in record:
+                record['_peak'] = max(record['_peak'], peak)
+
+    def latest(self):
+        return self.runs[-1] if self.runs else None
+
+    def to_json(self):
+        return json.dumps({'reruns': list(self.runs)}, indent=2)
+
+
+@contextmanager
+def span(name):
+    """Time the block as a named span of the rerun being profiled - does nothing when none is."""
+    profiler = getattr(_active, 'profiler', None)
+    if profiler is None or profiler._run is None:
+        yield None
+        return
+    with profiler.span(name) as record:
+        yield record
+
+
+def profiler():
+    if 'profiler' not in st.session_state:
+        st.session_state.profiler = Profiler()
+    return st.session_state.profiler
+
+
+def breakdown(run):
+    """A rerun's spans as a table for display - indented by nesting, with the share of the rerun each took."""
+    rows = [{
+        'Span': ' ' * span['depth'] + span['name'],
+        'ms': span['seconds'] * 1000,
+        '%': 100 * span['seconds'] / run['seconds'] if run['seconds'] else 0.0,
+        'Peak MB': span['peak_bytes'] / 2**20 if 'peak_bytes' in span else None,
+    } for span in run['spans']]
+    # Whatever the top level spans don't cover - the page's own code, widgets and imports
+    outside = run['seconds'] - sum(span['seconds'] for span in run['spans'] if span['depth'] == 0)
+    rows.append({'Span': '(not in a span)', 'ms': outside * 1000, '%': 100 * outside / run['seconds'] if run['seconds'] else 0.0, 'Peak MB': None})
+    table = pd.DataFrame(rows, columns=['Span', 'ms', '%', 'Peak MB'])
+    if table['Peak MB'].isna().all():
+        table = table.drop(columns=['Peak MB'])
+    return table
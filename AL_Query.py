@@ -0,0 +1,335 @@
+# AL_Query
+# Queries for the 'Ask me anything' page - each text is parsed once, and filters are answered from
+# per-column indexes built once per data version rather than by scanning the frame on every rerun
+#
+# Filters use the DataFrame.query syntax ("Invested > 5000 and Market == 'Fintech'", backticks
+# around names with spaces). Anything the index can't answer (eg comparing two columns) is
+# handed to DataFrame.query as before. Aggregations are written "sum Invested by Market",
+# optionally followed by "where <filter>".
+
+import ast
+import io
+import re
+import tokenize
+from collections import OrderedDict
+from functools import lru_cache
+import streamlit as st
+import numpy as np
+import pandas as pd
+
+# Parsed query texts kept for the process, and row masks and whole answers kept per index
+QUERY_CACHE_SIZE = 256
+RESULT_CACHE_SIZE = 64
+ANSWER_CACHE_SIZE = 8
+
+# Words accepted for each aggregation
+AGGREGATIONS = {'sum': 'sum', 'total': 'sum', 'mean': 'mean', 'average': 'mean', 'avg': 'mean',
+                'median': 'median', 'min': 'min', 'max': 'max', 'count': 'count'}
+AGGREGATE_PATTERN = re.compile(r"^\s*(?P<func>" + '|'.join(AGGREGATIONS) + r")\s+(?:(?P<value>.+?)\s+)?by\s+(?P<by>.+?)(?:\s+where\s+(?P<where>.+?))?\s*$", re.IGNORECASE)
+
+_BACKTICKS = re.compile(r"`([^`]+)`")
+_OPERATORS = {ast.Eq: '==', ast.NotEq: '!=', ast.Lt: '<', ast.LtE: '<=', ast.Gt: '>', ast.GtE: '>=', ast.In: 'in', ast.NotIn: 'not in'}
+# The same comparison seen from the other side, for "5000 < Invested"
+_FLIPPED = {'==': '==', '!=': '!=', '<': '>', '<=': '>=', '>': '<', '>=': '<='}
+# As in DataFrame.query, & | and ~ bind like and, or and not rather than the bitwise operators
+_BOOLEAN_WORDS = {'&': 'and', '|': 'or', '~': 'not'}
+
+
+class QueryError(ValueError):
+    """The query can't be answered - bad syntax, an unknown column or a value of the wrong kind."""
+
+
+class _Unsupported(Exception):
+    # Valid query syntax the index doesn't handle - DataFrame.query gets it instead
+    pass
+
+
+def _constant(node):
+    if isinstance(node, ast.Constant):
+        return node.value
+    if isinstance(node, ast.UnaryOp) and isinstance(node.op, ast.USub) and isinstance(node.operand, ast.Constant):
+        return -node.operand.value
+    if isinstance(node, (ast.List, ast.Tuple, ast.Set)):
+        return tuple(_constant(element) for element in node.elts)
+    raise _Unsupported()
+
+
+def _column(node, names):
+    if isinstance(node, ast.Name):
+        return names.get(node.id, node.id)
+    raise _Unsupported()
+
+
+def _comparison(left, op, right, names):
+    # One column against one constant, whichever side the column is on
+    op = _OPERATORS.get(type(op))
+    if op is None:
+        raise _Unsupported()
+    if isinstance(left, ast.Name):
+        return ('cmp', _column(left, names), op, _constant(right))
+    if isinstance(right, ast.Name) and op in _FLIPPED:
+        return ('cmp', _column(right, names), _FLIPPED[op], _constant(left))
+    raise _Unsupported()
+
+
+def _compile(node, names):
+    # A plan is nested tuples so it can be used as a cache key
+    if isinstance(node, ast.BoolOp):
+        return ('and' if isinstance(node.op, ast.And) else 'or', tuple(_compile(value, names) for value in node.values))
+    if isinstance(node, ast.UnaryOp) and isinstance(node.op, ast.Not):
+        return ('not', _compile(node.operand, names))
+    if isinstance(node, ast.Compare):
+        # Chained comparisons (1000 < Invested < 5000) are each pair in turn
+        operands = [node.left, *node.comparators]
+        parts = tuple(_comparison(operands[i], op, operands[i + 1], names) for i, op in enumerate(node.ops))
+        return parts[0] if len(parts) == 1 else ('and', parts)
+    raise _Unsupported()
+
+
+def _replace_booleans(source):
+    tokens = [(tokenize.NAME, _BOOLEAN_WORDS[string]) if kind == tokenize.OP and string in _BOOLEAN_WORDS else (kind, string)
+              for kind, string, *_ in tokenize.generate_tokens(io.StringIO(source).readline)]
+    return tokenize.untokenize(tokens)
+
+
+def parse_filter(text):
+    """The plan for a filter expression, or None if only DataFrame.query can answer it."""
+    names = {}
+
+    def placeholder(match):
+        name = f"_column_{len(names)}"
+        names[name] = match.group(1)
+        return name
+
+    try:
+        tree = ast.parse(_replace_booleans(_BACKTICKS.sub(placeholder, text).strip()), mode='eval')
+    except (SyntaxError, tokenize.TokenError) as e:
+        raise QueryError(f"Can't read the query: {getattr(e, 'msg', None) or e.args[0]}") from e
+    try:
+        return _compile(tree.body, names)
+    except _Unsupported:
+        return None
+
+
+@lru_cache(maxsize=QUERY_CACHE_SIZE)
+def parse_query(text):
+    """Parse a query once per distinct text.
+
+    Returns ('aggregate', func, value column or None, by column, filter plan or None),
+    ('filter', plan) or ('pandas', text) for a filter the index can't answer.
+    """
+    match = AGGREGATE_PATTERN.match(text)
+    if match:
+        where = match.group('where')
+        plan = parse_filter(where) if where else None
+        if where and plan is None:
+            raise QueryError("The 'where' part of an aggregation can only compare columns with values")
+        value = match.group('value')
+        return ('aggregate', AGGREGATIONS[match.group('func').lower()], value and value.strip('`'), match.group('by').strip('`'), plan)
+    plan = parse_filter(text)
+    return ('filter', plan) if plan is not None else ('pandas', text)
+
+
+class QueryIndex:
+    """Per-column indexes over one DataFrame, each built the first time a query needs it.
+
+    Numeric and date columns get a sorted copy of their values and the row order, so range and
+    equality filters are two binary searches. Category and text columns get a row mask per
+    value asked for. Masks for whole filters are kept too, and the last few answers, so a
+    repeated query (eg the same text on a rerun) is a lookup.
+    """
+
+    def __init__(self, df):
+        self.df = df
+        self._sorted = {}
+        self._bitmaps = {}
+        self._groups = {}
+        self._results = OrderedDict()
+        self.answers = OrderedDict()
+
+    def column(self, name):
+        # Exact name first, then ignoring case
+        if name in self.df.columns:
+            return name
+        matches = [col for col in self.df.columns if str(col).lower() == str(name).strip().lower()]
+        if not matches:
+            raise QueryError(f"There is no column called '{name}'")
+        return matches[0]
+
+    def _sorted_column(self, col):
+        # (sorted values, row positions) with missing values left out
+        if col not in self._sorted:
+            values = self._numbers(col, self.df[col])
+            valid = np.flatnonzero(~np.isnan(values))
+            order = valid[np.argsort(values[valid], kind='stable')]
+            self._sorted[col] = (values[order], order)
+        return self._sorted[col]
+
+    def _numbers(self, col, values):
+        # Dates as float nanoseconds so they sort and search like any other number
+        if pd.api.types.is_datetime64_any_dtype(values):
+            as_ns = values.astype('datetime64[ns]')
+            return np.where(as_ns.isna(), np.nan, as_ns.to_numpy().view('i8').astype(float))
+        return pd.to_numeric(values, errors='coerce').to_numpy(dtype=float)
+
+    def _value(self, col, value):
+        # A constant as the kind of number _sorted_column holds for col
+        try:
+            if pd.api.types.is_datetime64_any_dtype(self.df[col]):
+                return float(pd.Timestamp(value).as_unit('ns').value)
+            return float(value)
+        except (TypeError, ValueError) as e:
+            raise QueryError(f"'{value}' can't be compared with {col}") from e
+
+    def _range(self, col, op, value):
+        values, order = self._sorted_column(col)
+        value = self._value(col, value)
+        lower, upper = {
+            '==': (np.searchsorted(values, value, 'left'), np.searchsorted(values, value, 'right')),
+            '<': (0, np.searchsorted(values, value, 'left')),
+            '<=': (0, np.searchsorted(values, value, 'right')),
+            '>': (np.searchsorted(values, value, 'right'), len(values)),
+            '>=': (np.searchsorted(values, value, 'left'), len(values)),
+        }[op]
+        mask = np.zeros(len(self.df), dtype=bool)
+        mask[order[lower:upper]] = True
+        return mask
+
+    def _bitmap(self, col, value):
+        # Rows where a category/text column equals value
+        key = (col, value)
+        if key not in self._bitmaps:
+            values = self.df[col]
+            if isinstance(values.dtype, pd.CategoricalDtype):
+                categories = values.cat.categories
+                code = categories.get_loc(value) if value in categories else -2
+                self._bitmaps[key] = values.cat.codes.to_numpy() == code
+            else:
+                self._bitmaps[key] = (values == value).to_numpy(dtype=bool)
+        return self._bitmaps[key]
+
+    def _compare(self, col, op, value):
+        col = self.column(col)
+        values = self.df[col]
+        if op in ('in', 'not in'):
+            options = value if isinstance(value, tuple) else (value,)
+            mask = np.zeros(len(values), dtype=bool)
+            for option in options:
+                mask |= self._compare(col, '==', option)
+            return ~mask if op == 'not in' else mask
+        numeric = pd.api.types.is_numeric_dtype(values) or pd.api.types.is_datetime64_any_dtype(values)
+        if op == '!=':
+            equal = self._range(col, '==', value) if numeric else self._bitmap(col, value)
+            return ~equal
+        if numeric:
+            return self._range(col, op, value)
+        if op == '==':
+            return self._bitmap(col, value)
+        if isinstance(values.dtype, pd.CategoricalDtype) and values.cat.ordered:
+            # eg Round > 'Seed' in round order
+            if value not in values.cat.categories:
+                raise QueryError(f"'{value}' isn't one of the {col} values")
+            codes = values.cat.codes.to_numpy()
+            code = values.cat.categories.get_loc(value)
+            return (codes >= 0) & {'<': codes < code, '<=': codes <= code, '>': codes > code, '>=': codes >= code}[op]
+        raise QueryError(f"{col} can only be compared with == or !=")
+
+    def _evaluate(self, plan):
+        kind = plan[0]
+        if kind == 'cmp':
+            return self._compare(*plan[1:])
+        if kind == 'not':
+            return ~self.mask(plan[1])
+        masks = [self.mask(part) for part in plan[1]]
+        return np.logical_and.reduce(masks) if kind == 'and' else np.logical_or.reduce(masks)
+
+    def mask(self, plan):
+        """Boolean row mask for a filter plan (see parse_filter), from the result cache when it can be."""
+        if plan in self._results:
+            self._results.move_to_end(plan)
+            return self._results[plan]
+        mask = self._evaluate(plan)
+        self._results[plan] = mask
+        while len(self._results) > RESULT_CACHE_SIZE:
+            self._results.popitem(last=False)
+        return mask
+
+    def groups(self, col):
+        """(code per row, labels) for a column - its categories when it has them."""
+        if col not in self._groups:
+            values = self.df[col]
+            if isinstance(values.dtype, pd.CategoricalDtype):
+                self._groups[col] = (values.cat.codes.to_numpy(), values.cat.categories)
+            else:
+                self._groups[col] = pd.factorize(values, sort=True)
+        return self._groups[col]
+
+    def aggregate(self, func, value_col, by_col, plan=None):
+        """func (sum, mean, median, min, max or count) of value_col for each by_col value, largest first."""
+        by_col = self.column(by_col)
+        codes, labels = self.groups(by_col)
+        keep = codes >= 0
+        if plan is not None:
+            keep &= self.mask(plan)
+        counts = np.bincount(codes[keep], minlength=len(labels))
+        if func == 'count' and value_col is None:
+            result = pd.Series(counts, index=labels, name='count')
+        else:
+            if value_col is None:
+                raise QueryError(f"Say which column to {func}, eg '{func} Invested by {by_col}'")
+            value_col = self.column(value_col)
+            values = pd.to_numeric(self.df[value_col], errors='coerce').to_numpy(dtype=float)
+            keep &= ~np.isnan(values)
+            if func in ('sum', 'mean', 'count'):
+                totals = np.bincount(codes[keep], weights=values[keep], minlength=len(labels))
+                counted = np.bincount(codes[keep], minlength=len(labels))
+                data = {'sum': totals, 'count': counted}.get(func)
+                if func == 'mean':
+                    with np.errstate(invalid='ignore', divide='ignore'):
+                        data = totals / counted
+                result = pd.Series(data, index=labels, name=f"{func} of {value_col}")
+            else:
+                result = pd.Series(values[keep]).groupby(codes[keep]).agg(func)
+                result.index = labels[result.index]
+                result.name = f"{func} of {value_col}"
+        result = result[counts > 0] if len(result) == len(counts) else result
+        result.index.name = by_col
+        return result.sort_values(ascending=False).reset_index()
+
+
+def _answer(index, parsed):
+    if parsed[0] == 'aggregate':
+        return index.aggregate(*parsed[1:])
+    if parsed[0] == 'filter':
+        return index.df[index.mask(parsed[1])]
+    try:
+        return index.df.query(parsed[1])
+    except Exception as e:
+        raise QueryError(f"Can't answer that query: {e}") from e
+
+
+def run_query(index, text):
+    """Answer a query from the 'Ask me anything' page: the matching rows, or an aggregation table.
+
+    The answer is shared with later calls for the same query, so treat it as read only.
+    """
+    if not text.strip():
+        raise QueryError("Enter a query")
+    parsed = parse_query(text.strip())
+    if parsed in index.answers:
+        index.answers.move_to_end(parsed)
+        return index.answers[parsed]
+    answer = _answer(index, parsed)
+    index.answers[parsed] = answer
+    while len(index.answers) > ANSWER_CACHE_SIZE:
+        index.answers.popitem(last=False)
+    return answer
+
+
+def query_index():
+    """The QueryIndex for the session data, rebuilt when the data version changes."""
+    version, index = st.session_state.get('query_index', (None, None))
+    if index is None or version != st.session_state.get('data_version') or index.df is not st.session_state.df:
+        index = QueryIndex(st.session_state.df)
+        st.session_state.query_index = (st.session_state.get('data_version'), index)
+    return index
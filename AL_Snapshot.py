@@ -0,0 +1,124 @@
+# AL_Snapshot
+# Save a processed portfolio to a single file and open it again without reparsing the export
+#
+# A snapshot is an uncompressed zip of Arrow IPC files - one per DataFrame - plus meta.json with
+# the format version, each frame's schema and the counters/flags. Members are stored, not
+# deflated, so a snapshot on disk is memory mapped and each table read in place.
+
+import io
+import json
+import struct
+import zipfile
+from datetime import datetime, timezone
+import pandas as pd
+from AL_Aggregates import build_group_store
+
+# Bump when the layout changes - older snapshots are still read, newer ones are refused
+SNAPSHOT_VERSION = 1
+SNAPSHOT_EXTENSION = 'alsnap'
+
+# Scalars from an ingest result that are saved with the frames
+RESULT_FLAGS = ['has_angellist_data', 'has_realized_dates', 'date_format', 'summary_verified']
+
+
+class SnapshotError(ValueError):
+    """The file isn't a snapshot this version can read, or it doesn't match its own schema."""
+
+
+def _schema(df):
+    return {str(col): str(dtype) for col, dtype in df.dtypes.items()}
+
+
+def _json_default(value):
+    # numpy scalars from the counters and summary
+    if hasattr(value, 'item'):
+        return value.item()
+    raise TypeError(f"Can't save {type(value).__name__} in a snapshot")
+
+
+def write_snapshot(target, frames, meta=None):
+    """Write DataFrames (name -> frame) and a JSON-able meta dict to target (a path or binary file)."""
+    import pyarrow as pa
+    import pyarrow.feather as feather
+
+    info = {
+        'snapshot_version': SNAPSHOT_VERSION,
+        'created': datetime.now(timezone.utc).isoformat(),
+        'pandas': pd.__version__,
+        'pyarrow': pa.__version__,
+        'schemas': {name: _schema(df) for name, df in frames.items()},
+        'meta': meta or {},
+    }
+    with zipfile.ZipFile(target, 'w', compression=zipfile.ZIP_STORED) as archive:
+        for name, df in frames.items():
+            buffer = io.BytesIO()
+            feather.write_feather(df, buffer, compression='uncompressed')
+            archive.writestr(f"{name}.arrow", buffer.getvalue())
+        archive.writestr('meta.json', json.dumps(info, default=_json_default))
+
+
+def _member(data, archive, name):
+    # A stored member's bytes, sliced out of data without copying. The local header gives the
+    # length of the name and extra field that come before them
+    member = archive.getinfo(name)
+    if member.compress_type != zipfile.ZIP_STORED:
+        raise SnapshotError(f"{name} is compressed - snapshots are written uncompressed")
+    name_length, extra_length = struct.unpack('<HH', data[member.header_offset + 26:member.header_offset + 30].to_pybytes())
+    start = member.header_offset + 30 + name_length + extra_length
+    return data.slice(start, member.file_size)
+
+
+def read_snapshot(source):
+    """Read a snapshot written by write_snapshot. Returns (frames, meta).
+
+    source is a path (memory mapped) or anything with getbuffer(), eg an uploaded file.
+    """
+    import pyarrow as pa
+    import pyarrow.ipc as ipc
+
+    data = pa.memory_map(source).read_buffer() if isinstance(source, str) else pa.py_buffer(source.getbuffer())
+    try:
+        archive = zipfile.ZipFile(pa.BufferReader(data))
+        info = json.loads(archive.read('meta.json'))
+    except (zipfile.BadZipFile, KeyError, ValueError) as e:
+        raise SnapshotError(f"Not a snapshot file: {e}") from e
+    if info.get('snapshot_version', 0) > SNAPSHOT_VERSION:
+        raise SnapshotError(f"Snapshot version {info.get('snapshot_version')} is newer than this program can read ({SNAPSHOT_VERSION})")
+
+    frames = {}
+    for name, schema in info['schemas'].items():
+        df = ipc.open_file(_member(data, archive, f"{name}.arrow")).read_pandas()
+        if _schema(df) != schema:
+            raise SnapshotError(f"Snapshot table '{name}' doesn't match its saved schema")
+        frames[name] = df
+    return frames, info['meta']
+
+
+def save_result(target, result, df2=None):
+    """Snapshot an ingest result (see AL_Ingest.run_ingest) and, optionally, the Enhancement data."""
+    frames = {'df': result['df'], 'sumdf': result['sumdf']}
+    if df2 is not None and not df2.empty:
+        frames['df2'] = df2
+    meta = {'counters': result['counters'], **{flag: result[flag] for flag in RESULT_FLAGS}}
+    write_snapshot(target, frames, meta)
+
+
+def load_result(source):
+    """An ingest result from a snapshot, with the page aggregates rebuilt, and any Enhancement data (or None)."""
+    frames, meta = read_snapshot(source)
+    if 'df' not in frames or 'sumdf' not in frames:
+        raise SnapshotError("Snapshot has no portfolio data")
+    result = {
+        'df': frames['df'],
+        'sumdf': frames['sumdf'],
+        'counters': dict(meta['counters']),
+        **{flag: meta[flag] for flag in RESULT_FLAGS},
+        'groups': build_group_store(frames['df']),
+    }
+    return result, frames.get('df2')
+
+
+def snapshot_bytes(result, df2=None):
+    buffer = io.BytesIO()
+    save_result(buffer, result, df2)
+    return buffer.getvalue()
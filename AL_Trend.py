@@ -0,0 +1,66 @@
+# AL_Trend
+# Weighted least-squares trendlines with confidence bands, in closed form with numpy
+
+from statistics import NormalDist
+import numpy as np
+import pandas as pd
+
+
+def _t_quantile(p, dof):
+    # Student t quantile from the normal one (Abramowitz & Stegun 26.7.5) - close enough for a
+    # chart band and saves importing scipy
+    z = NormalDist().inv_cdf(p)
+    if not np.isfinite(dof):
+        return z
+    g1 = (z**3 + z) / 4
+    g2 = (5*z**5 + 16*z**3 + 3*z) / 96
+    g3 = (3*z**7 + 19*z**5 + 17*z**3 - 15*z) / 384
+    g4 = (79*z**9 + 776*z**7 + 1482*z**5 - 1920*z**3 - 945*z) / 92160
+    return z + g1/dof + g2/dof**2 + g3/dof**3 + g4/dof**4
+
+
+def weighted_fit(x, y, weights=None):
+    """Fit y = intercept + slope * x by weighted least squares.
+
+    Rows with a missing x or y, or a weight that isn't positive, are ignored. Returns a dict with
+    slope, intercept, n, the weighted mean of x, the weighted sum of squares of x about it and the
+    residual variance - everything trendline() needs for its bands. With fewer than two distinct
+    x values the line is flat at the weighted mean of y.
+    """
+    x = np.asarray(x, dtype=float)
+    y = np.asarray(y, dtype=float)
+    w = np.ones_like(x) if weights is None else np.asarray(weights, dtype=float)
+    keep = np.isfinite(x) & np.isfinite(y) & np.isfinite(w) & (w > 0)
+    x, y, w = x[keep], y[keep], w[keep]
+
+    n = len(x)
+    if n == 0:
+        return {'slope': 0.0, 'intercept': np.nan, 'n': 0, 'x_mean': np.nan, 'sxx': 0.0, 'variance': np.nan, 'weight_sum': 0.0}
+    weight_sum = w.sum()
+    x_mean = np.dot(w, x) / weight_sum
+    y_mean = np.dot(w, y) / weight_sum
+    dx = x - x_mean
+    sxx = np.dot(w, dx * dx)
+    slope = np.dot(w, dx * (y - y_mean)) / sxx if sxx > 0 else 0.0
+    intercept = y_mean - slope * x_mean
+    # Residual variance per unit weight, so scaling all the weights doesn't change the bands
+    residuals = y - (intercept + slope * x)
+    variance = np.dot(w, residuals * residuals) / (n - 2) if n > 2 else np.nan
+    return {'slope': slope, 'intercept': intercept, 'n': n, 'x_mean': x_mean, 'sxx': sxx, 'variance': variance, 'weight_sum': weight_sum}
+
+
+def trendline(x, y, weights=None, at=None, level=0.95):
+    """Weighted trendline of y over x with a confidence band for the fitted line.
+
+    The line is evaluated at the points in at (x by default). Returns a DataFrame with columns
+    x, fit, lower and upper; the band is NaN when there are too few points to estimate it.
+    """
+    fit = weighted_fit(x, y, weights)
+    at = np.asarray(x if at is None else at, dtype=float)
+    line = fit['intercept'] + fit['slope'] * at
+    if fit['n'] > 2 and fit['sxx'] > 0:
+        spread = np.sqrt(fit['variance'] * (1 / fit['weight_sum'] + (at - fit['x_mean'])**2 / fit['sxx']))
+        half_width = _t_quantile(0.5 + level / 2, fit['n'] - 2) * spread
+    else:
+        half_width = np.full_like(line, np.nan)
+    return pd.DataFrame({'x': at, 'fit': line, 'lower': line - half_width, 'upper': line + half_width})
@@ -0,0 +1,165 @@
+# AL_Worker
+# Process uploaded exports on background threads so the page stays responsive - each upload is a
+# job that reports the stage it is at, can be cancelled and is published by the page when done
+#
+# Threads rather than processes: the result goes into the process-wide ingest cache (see
+# AL_Ingest.ingest_cache) and pickling it back from another process would cost about as much as
+# the parse. Cancelling is checked between stages - a stage that has started runs to the end.
+#
+# Jobs don't touch the session that started them: everything run_ingest needs (the bytes and
+# us_dates) is handed over on the script thread, and the result is shared with every session.
+
+import io
+import threading
+from concurrent.futures import ThreadPoolExecutor
+import streamlit as st
+from AL_Ingest import run_ingest, ingest_cache
+
+# Uploads processed at once for the whole server - more wait their turn
+INGEST_WORKERS = 2
+
+# How often the page checks on running jobs, in seconds
+PROGRESS_INTERVAL = 0.5
+
+# Stage -> (share of the work done when it starts, what to tell the user)
+INGEST_STAGES = {
+    'queued': (0.0, "Waiting to start"),
+    'parse': (0.05, "Reading the file"),
+    'summarize': (0.35, "Processing the investments"),
+    'normalize': (0.75, "Tidying up the data"),
+    'xirr': (0.8, "Calculating the IRR"),
+    'aggregate': (0.85, "Building the page tables"),
+    'done': (1.0, "Done"),
+    'cancelled': (1.0, "Cancelled"),
+    'failed': (1.0, "Failed"),
+}
+FINISHED_STAGES = {'done', 'cancelled', 'failed'}
+
+
+class IngestCancelled(Exception):
+    """Raised inside a job at its next stage once it has been cancelled."""
+
+
+@st.cache_resource
+def ingest_workers():
+    return ThreadPoolExecutor(max_workers=INGEST_WORKERS, thread_name_prefix='al_ingest')
+
+
+class IngestJob:
+    """One upload being processed into an ingest result (see AL_Ingest.run_ingest) in the background."""
+
+    def __init__(self, name, key, data, us_dates=None):
+        self.name = name
+        self.key = key
+        self.stage = 'queued'
+        self.result = None
+        self.error = None
+        self._cancelled = threading.Event()
+        # The bytes are copied out of the upload - the uploaded file belongs to the script run
+        self._data = data
+        self._us_dates = us_dates
+        self.future = None
+
+    def start(self, cache, workers):
+        # cache and workers are looked up by the caller, on the script thread
+        self.future = workers.submit(self._run, cache)
+        return self
+
+    def _check_cancelled(self):
+        if self._cancelled.is_set():
+            raise IngestCancelled()
+
+    def _progress(self, stage):
+        self._check_cancelled()
+        self.stage = stage
+
+    def _run(self, cache):
+        try:
+            # Through the shared cache so another session uploading the same file waits for this
+            # job rather than starting its own - still cancellable while it waits
+            self.result = cache.get_or_build(self.key, lambda: run_ingest(io.BytesIO(self._data), self._us_dates, self._progress),
+                                             waiting=self._check_cancelled)
+            self.stage = 'done'
+        except IngestCancelled:
+            self.stage = 'cancelled'
+        except Exception as e:
+            self.error = e
+            self.stage = 'failed'
+        finally:
+            self._data = None
+
+    def cancel(self):
+        self._cancelled.set()
+        # Not started yet - it never will be
+        if self.future is not None and self.future.cancel():
+            self.stage = 'cancelled'
+
+    @property
+    def finished(self):
+        return self.stage in FINISHED_STAGES
+
+    @property
+    def fraction(self):
+        return INGEST_STAGES[self.stage][0]
+
+    @property
+    def label(self):
+        return INGEST_STAGES[self.stage][1]
+
+
+def ingest_jobs():
+    """This session's jobs by portfolio name."""
+    if 'ingest_jobs' not in st.session_state:
+        st.session_state.ingest_jobs = {}
+    return st.session_state.ingest_jobs
+
+
+def start_ingest(name, key, uploaded_file, us_dates=None):
+    """Process an upload in the background, unless there is already a job for it (however it
+    ended). A job for the same name with different contents (a new upload of that file) is
+    cancelled first."""
+    jobs = ingest_jobs()
+    job = jobs.get(name)
+    if job is not None and job.key == key:
+        return job
+    if job is not None:
+        job.cancel()
+    jobs[name] = IngestJob(name, key, uploaded_file.getvalue(), us_dates).start(ingest_cache(), ingest_workers())
+    return jobs[name]
+
+
+def cancel_ingest(keep=()):
+    """Cancel and forget every job whose (name, key) isn't in keep - eg a file removed from the uploader."""
+    jobs = ingest_jobs()
+    for name, job in list(jobs.items()):
+        if (name, job.key) not in keep:
+            job.cancel()
+            del jobs[name]
+
+
+def running_jobs():
+    return [job for job in ingest_jobs().values() if not job.finished]
+
+
+def completed_jobs():
+    """Remove and return the jobs that have a result, for the page to publish. Failed and
+    cancelled jobs are kept so the same upload isn't processed again on the next rerun."""
+    jobs = ingest_jobs()
+    completed = [job for job in jobs.values() if job.stage == 'done']
+    for job in completed:
+        del jobs[job.name]
+    return completed
+
+
+@st.fragment(run_every=PROGRESS_INTERVAL)
+def ingest_progress():
+    """Progress bars (with a Cancel button) for the running jobs, redrawn on their own every
+    PROGRESS_INTERVAL seconds. Reruns the whole page once none are left running, to publish them."""
+    jobs = running_jobs()
+    if not jobs:
+        st.rerun()
+    for job in jobs:
+        bar, button = st.columns([5, 1])
+        bar.progress(job.fraction, text=f"{job.name}: {job.label}")
+        if button.button("Cancel", key=f"cancel_ingest_{job.name}"):
+            job.cancel()
@@ -0,0 +1,163 @@
+# AL_Workspace
+# Several loaded portfolios per session - the active one lives in session state as before, the
+# others are parked here and spilled to disk as snapshots (least recently used first) past a memory budget
+
+import os
+import pickle
+import shutil
+import tempfile
+import weakref
+from collections import OrderedDict
+import streamlit as st
+import pandas as pd
+from AL_Ingest import COUNTERS, publish_ingest
+from AL_Snapshot import write_snapshot, read_snapshot
+
+# Session state that belongs to a portfolio rather than the session. The Enhancement (df2) and
+# Tax (df3) files are re-read from their uploaders so are shared by every portfolio
+PORTFOLIO_KEYS = ['df', 'base_sumdf', 'sumdf', 'summary_verified', *COUNTERS, 'has_angellist_data', 'has_realized_dates',
+                  'date_format', 'total_value', 'overall_XIRR', 'ingest_key', 'data_version', 'group_store']
+
+# Parked portfolios in memory plus the active one are kept under this, beyond it the least
+# recently used are written to disk
+WORKSPACE_BUDGET_BYTES = 256 * 1024 * 1024
+
+
+def state_bytes(state):
+    """Approximate memory held by the DataFrames in a portfolio's state."""
+    return int(sum(value.memory_usage(deep=True).sum() for value in state.values() if isinstance(value, pd.DataFrame)))
+
+
+class Workspace:
+    """Portfolios by name in least recently used order, each either in memory or spilled to disk."""
+
+    def __init__(self, budget_bytes=WORKSPACE_BUDGET_BYTES):
+        self.budget_bytes = budget_bytes
+        self.portfolios = OrderedDict()
+        self.spill_dir = tempfile.mkdtemp(prefix='al_workspace_')
+        # Remove the spilled files when the session (and so the workspace) goes away
+        self._cleanup = weakref.finalize(self, shutil.rmtree, self.spill_dir, ignore_errors=True)
+
+    def names(self):
+        return list(self.portfolios)
+
+    def info(self, name):
+        """Name, ingest key, size and whether it is spilled - without loading it back."""
+        entry = self.portfolios[name]
+        return {'name': name, 'ingest_key': entry['ingest_key'], 'bytes': entry['bytes'], 'spilled': entry['state'] is None}
+
+    def park(self, name, state, active_bytes=0):
+        # Keep a portfolio that is no longer active. active_bytes is what the active one holds
+        # and counts towards the budget too
+        self.discard(name)
+        self.portfolios[name] = {'state': dict(state), 'bytes': state_bytes(state), 'path': None, 'ingest_key': state.get('ingest_key')}
+        self._enforce_budget(active_bytes)
+
+    def take(self, name):
+        """Remove a portfolio from the workspace and return its state, reading it back if spilled."""
+        entry = self.portfolios.pop(name)
+        if entry['state'] is not None:
+            return entry['state']
+        state = _read_spill(entry['path'])
+        shutil.rmtree(entry['path'], ignore_errors=True)
+        return state
+
+    def discard(self, name):
+        entry = self.portfolios.pop(name, None)
+        if entry is not None and entry['path'] is not None:
+            shutil.rmtree(entry['path'], ignore_errors=True)
+
+    def memory_bytes(self):
+        return sum(entry['bytes'] for entry in self.portfolios.values() if entry['state'] is not None)
+
+    def _enforce_budget(self, active_bytes):
+        for name, entry in self.portfolios.items():
+            if self.memory_bytes() + active_bytes <= self.budget_bytes:
+                break
+            if entry['state'] is not None:
+                entry['path'] = tempfile.mkdtemp(dir=self.spill_dir)
+                _write_spill(entry['path'], entry['state'])
+                entry['state'] = None
+
+
+def _write_spill(path, state):
+    # As a snapshot (see AL_Snapshot) so reading it back is a memory mapped read, pickled if there
+    # is no pyarrow or a column won't convert. The aggregates are dropped - group_store() rebuilds them
+    state = {key: value for key, value in state.items() if key != 'group_store'}
+    frames = {key: value for key, value in state.items() if isinstance(value, pd.DataFrame)}
+    rest = {key: value for key, value in state.items() if key not in frames}
+    try:
+        write_snapshot(os.path.join(path, 'spill.alsnap'), frames, rest)
+    except (ImportError, ValueError, TypeError):
+        with open(os.path.join(path, 'spill.pkl'), 'wb') as f:
+            pickle.dump(state, f)
+
+
+def _read_spill(path):
+    snapshot = os.path.join(path, 'spill.alsnap')
+    if os.path.exists(snapshot):
+        frames, rest = read_snapshot(snapshot)
+        return {**rest, **frames}
+    with open(os.path.join(path, 'spill.pkl'), 'rb') as f:
+        return pickle.load(f)
+
+
+def workspace():
+    if 'workspace' not in st.session_state:
+        st.session_state.workspace = Workspace()
+    return st.session_state.workspace
+
+
+def active_name():
+    # Data loaded before there was a name for it (eg force_load) is just 'Portfolio'
+    if not st.session_state.get('has_data_file', False):
+        return None
+    return st.session_state.get('portfolio_name') or 'Portfolio'
+
+
+def portfolio_names():
+    """Every loaded portfolio, the active one included, in name order."""
+    names = set(workspace().names())
+    if active_name() is not None:
+        names.add(active_name())
+    return sorted(names)
+
+
+def portfolio_ingest_key(name):
+    # The ingest key a portfolio was last loaded with (None after an Overwrite changed it)
+    if name == active_name():
+        return st.session_state.get('ingest_key')
+    if name in workspace().portfolios:
+        return workspace().info(name)['ingest_key']
+    return None
+
+
+def _park_active(active_bytes=0):
+    name = active_name()
+    if name is not None:
+        state = {key: st.session_state[key] for key in PORTFOLIO_KEYS if key in st.session_state}
+        workspace().park(name, state, active_bytes)
+    for key in PORTFOLIO_KEYS:
+        st.session_state.pop(key, None)
+
+
+def open_portfolio(name, result, key=None):
+    """Publish an ingest result as the active portfolio, parking the one it replaces."""
+    workspace().discard(name)
+    # Reloading the active portfolio just replaces it
+    if name != active_name():
+        _park_active(state_bytes({'df': result['df']}))
+    publish_ingest(result, key)
+    st.session_state.portfolio_name = name
+
+
+def switch_portfolio(name):
+    """Make a parked portfolio the active one without reprocessing its export."""
+    if name == active_name() or name not in workspace().portfolios:
+        return
+    state = workspace().take(name)
+    _park_active(state_bytes(state))
+    for key, value in state.items():
+        st.session_state[key] = value
+    st.session_state.portfolio_name = name
+    st.session_state.has_data_file = True
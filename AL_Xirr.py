@@ -0,0 +1,157 @@
+# AL_Xirr
+# Batched XIRR engine - solves the IRR of every cash-flow group in one vectorised pass
+
+from datetime import datetime
+import numpy as np
+import pandas as pd
+
+# Solver settings - Newton first, bisection for any group Newton can't settle
+NEWTON_ITERATIONS = 50
+BISECTION_ITERATIONS = 200
+TOLERANCE = 1e-9
+MIN_RATE = -0.999999   # rate can't go to -100% or below
+MAX_RATE = 1e6         # upper bracket for bisection, 1,000,000x per year is plenty
+
+
+def _npv_and_derivative(rates, codes, years, amounts):
+    # NPV and its derivative per group using bincount so there is no python loop over groups
+    log_base = np.log1p(rates)[codes]
+    discount = np.exp(-years * log_base)
+    npv = np.bincount(codes, weights=amounts * discount, minlength=len(rates))
+    slope = np.bincount(codes, weights=-years * amounts * discount / (1 + rates[codes]), minlength=len(rates))
+    return npv, slope
+
+
+def _npv(rates, codes, years, amounts):
+    discount = np.exp(-years * np.log1p(rates)[codes])
+    return np.bincount(codes, weights=amounts * discount, minlength=len(rates))
+
+
+def batch_xirr(flows, group_col, date_col='Date', amount_col='Amount', guess=0.1):
+    """Return the XIRR of every group in flows as a Series keyed by group.
+
+    flows holds one row per cash flow (negative for money invested, positive for
+    money returned). Groups without both an outflow and an inflow, or where no
+    rate solves the NPV, are NaN. Uses the same actual/365 convention as pyxirr.
+    """
+    data = flows[[group_col, date_col, amount_col]].dropna()
+    codes, groups = pd.factorize(data[group_col], sort=True)
+    num_groups = len(groups)
+    result = pd.Series(np.nan, index=pd.Index(groups, name=group_col), name='XIRR')
+    if num_groups == 0:
+        return result
+
+    amounts = data[amount_col].to_numpy(dtype=float)
+    dates = pd.to_datetime(data[date_col]).to_numpy(dtype='datetime64[D]')
+    # Years since the first flow of each group
+    first_date = np.full(num_groups, np.datetime64('9999-12-31', 'D'))
+    np.minimum.at(first_date, codes, dates)
+    years = (dates - first_date[codes]).astype(float) / 365.0
+
+    # Only groups with money going both ways have an IRR
+    has_out = np.bincount(codes, weights=(amounts < 0), minlength=num_groups) > 0
+    has_in = np.bincount(codes, weights=(amounts > 0), minlength=num_groups) > 0
+
+    # 1. Newton pass on all groups at once
+    candidates = has_out & has_in
+    rates = np.full(num_groups, float(guess))
+    solved = np.zeros(num_groups, dtype=bool)
+    failed = np.zeros(num_groups, dtype=bool)
+    with np.errstate(all='ignore'):
+        for _ in range(NEWTON_ITERATIONS):
+            active = candidates & ~solved & ~failed
+            if not active.any():
+                break
+            npv, slope = _npv_and_derivative(rates, codes, years, amounts)
+            step = npv / slope
+            new_rates = rates - step
+            # Anything that wanders out of range is left to bisection
+            bad = active & (~np.isfinite(new_rates) | (new_rates <= MIN_RATE) | (new_rates >= MAX_RATE))
+            good = active & ~bad
+            rates = np.where(good, new_rates, rates)
+            solved |= good & (np.abs(step) < TOLERANCE)
+            failed |= bad
+
+        # 2. Bisection for whatever Newton didn't settle
+        todo = candidates & ~solved
+        if todo.any():
+            lo = np.full(num_groups, MIN_RATE)
+            hi = np.full(num_groups, MAX_RATE)
+            f_lo = _npv(lo, codes, years, amounts)
+            f_hi = _npv(hi, codes, years, amounts)
+            bracketed = todo & (np.sign(f_lo) != np.sign(f_hi))
+            for _ in range(BISECTION_ITERATIONS):
+                if not bracketed.any():
+                    break
+                mid = (lo + hi) / 2
+                f_mid = _npv(mid, codes, years, amounts)
+                left = np.sign(f_mid) == np.sign(f_lo)
+                lo = np.where(bracketed & left, mid, lo)
+                f_lo = np.where(bracketed & left, f_mid, f_lo)
+                hi = np.where(bracketed & ~left, mid, hi)
+                if np.all(np.abs(hi - lo)[bracketed] < TOLERANCE):
+                    break
+            rates = np.where(bracketed, (lo + hi) / 2, rates)
+            solved |= bracketed
+
+    result[:] = np.where(solved, rates, np.nan)
+    return result
+
+
+def company_cash_flows(df, has_realized_dates=False, as_of=None):
+    # Build the flows for each Company/Fund: every investment out at its Invest Date, and
+    # the summed Net Value back in at the last row's Realized Date (or as_of if none)
+    as_of = as_of if as_of is not None else datetime.now()
+    outflows = pd.DataFrame({
+        'Company/Fund': df['Company/Fund'].to_numpy(),
+        'Date': df['Invest Date'].to_numpy(),
+        'Amount': -df['Invested'].to_numpy(dtype=float),
+    })
+    grouped = df.groupby('Company/Fund', sort=False, observed=True)
+    exit_value = grouped['Net Value'].sum()
+    exit_date = pd.Series(pd.Timestamp(as_of), index=exit_value.index)
+    if has_realized_dates and 'Realized Date' in df.columns:
+        last_realized = grouped['Realized Date'].nth(-1)
+        last_realized.index = df.loc[last_realized.index, 'Company/Fund'].to_numpy()
+        exit_date = pd.to_datetime(last_realized.reindex(exit_value.index)).fillna(pd.Timestamp(as_of))
+    inflows = pd.DataFrame({'Company/Fund': exit_value.index, 'Date': exit_date.to_numpy(), 'Amount': exit_value.to_numpy()})
+    return pd.concat([outflows, inflows], ignore_index=True)
+
+
+def company_xirr(df, has_realized_dates=False, as_of=None):
+    """XIRR per Company/Fund across all of its investments, 0.0 where it can't be calculated."""
+    flows = company_cash_flows(df, has_realized_dates, as_of)
+    xirr = batch_xirr(flows, 'Company/Fund')
+    # As before, a company whose first investment shows no value (or none at all - the first row
+    # by position, not the first that has one) doesn't get an XIRR
+    first_rows = df.loc[~df['Company/Fund'].duplicated(), ['Company/Fund', 'Net Value']]
+    first_value = pd.Series(first_rows['Net Value'].to_numpy(dtype=float), index=first_rows['Company/Fund'].to_numpy())
+    xirr[~(first_value.reindex(xirr.index).to_numpy() > 0)] = np.nan
+    return xirr.fillna(0.0)
+
+
+def row_xirr(df, as_of=None):
+    """XIRR of each row on its own (Invested out at Invest Date, Net Value back at as_of), keyed by row index."""
+    as_of = as_of if as_of is not None else datetime.now()
+    flows = pd.DataFrame({
+        'Row': np.concatenate([df.index.to_numpy(), df.index.to_numpy()]),
+        'Date': np.concatenate([pd.to_datetime(df['Invest Date']).to_numpy(), np.full(len(df), np.datetime64(pd.Timestamp(as_of)))]),
+        'Amount': np.concatenate([-df['Invested'].to_numpy(dtype=float), df['Net Value'].to_numpy(dtype=float)]),
+    })
+    return batch_xirr(flows, 'Row').reindex(df.index)
+
+
+def portfolio_xirr(df, has_realized_dates=False, unrealized_value=0.0, as_of=None):
+    """Overall portfolio XIRR: every investment out, realized values back when realized and the unrealized total back at as_of."""
+    as_of = pd.Timestamp(as_of if as_of is not None else datetime.now())
+    realized = df['Realized Value'].fillna(0).to_numpy(dtype=float) if 'Realized Value' in df.columns else np.zeros(len(df))
+    if has_realized_dates and 'Realized Date' in df.columns:
+        realized_dates = pd.to_datetime(df['Realized Date']).fillna(as_of).to_numpy()
+    else:
+        realized_dates = np.full(len(df), np.datetime64(as_of))
+    flows = pd.DataFrame({
+        'Portfolio': 0,
+        'Date': np.concatenate([pd.to_datetime(df['Invest Date']).to_numpy(), realized_dates, [np.datetime64(as_of)]]),
+        'Amount': np.concatenate([-df['Invested'].to_numpy(dtype=float), realized, [float(unrealized_value)]]),
+    })
+    return batch_xirr(flows[flows['Amount'] != 0], 'Portfolio').get(0, np.nan)
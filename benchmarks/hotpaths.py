@@ -0,0 +1,158 @@
+# hotpaths
+# Time the app's data paths on synthetic portfolios (see synthetic.py) at several sizes and write
+# the results as JSON, optionally checking them against an earlier run
+#
+#   python benchmarks/hotpaths.py [--sizes 100,10000,1000000] [--repeat N] [--out results.json]
+#                                 [--baseline old.json] [--tolerance 0.25]
+#
+# Needs the app's own dependencies (streamlit, pandas, AL_Functions) to be importable.
+
+import argparse
+import json
+import os
+import platform
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import numpy as np
+import pandas as pd
+from streamlit.logger import set_log_level
+from synthetic import write_portfolio
+from AL_Ingest import read_export, summarize, compact_dtypes
+from AL_Aggregates import round_summary, market_summary, year_summary, lead_summary, locked_summary, build_group_store
+from AL_Xirr import company_xirr, portfolio_xirr
+from AL_Overwrite import apply_overwrite
+from AL_Pages import top_investments, company_totals, realized_investments
+from AL_Ledger import parse_ledger, ledger_cash_flows, ledger_company_xirr
+
+DEFAULT_SIZES = [100, 10_000, 1_000_000]
+
+# Run outside `streamlit run` - Streamlit's warnings about the missing session are expected
+set_log_level('error')
+
+# A stage is only a regression when it is slower than the baseline by more than the tolerance
+# and by more than this many seconds, so the sub-millisecond stages don't fail on noise
+NOISE_SECONDS = 0.005
+
+# Fixed so the XIRR stages solve the same flows on every run
+AS_OF = pd.Timestamp('2025-01-01')
+
+
+def page_aggregates(has_realized_dates):
+    """What each page works out from the processed data before it draws anything - the pages' own
+    functions, called as the pages call them (Top by Company includes its per-company XIRR)."""
+    return {
+        'Top Investments': top_investments,
+        'Top by Company': lambda df: company_totals(df, has_realized_dates, AS_OF),
+        'Round': round_summary,
+        'Market': market_summary,
+        'Year': year_summary,
+        'Lead Stats': lead_summary,
+        'Leads no values': locked_summary,
+        'Realized': realized_investments,
+        'All pages (group store)': build_group_store,
+    }
+
+
+def time_stage(run, setup=None, repeat=3):
+    """Seconds for each of repeat calls of run(setup()), setup not included. Returns (times, last result)."""
+    times = []
+    result = None
+    for _ in range(repeat):
+        argument = setup() if setup is not None else None
+        start = time.perf_counter()
+        result = run(argument) if setup is not None else run()
+        times.append(time.perf_counter() - start)
+    return times, result
+
+
+def _stage_report(times):
+    return {'best': min(times), 'median': float(np.median(times)), 'runs': [round(t, 6) for t in times]}
+
+
+def measure(rows, repeat=3, seed=0):
+    """Times for every stage on a portfolio of rows investments, in pipeline order."""
+    stages = {}
+
+    def record(name, run, setup=None):
+        times, result = time_stage(run, setup, repeat)
+        stages[name] = _stage_report(times)
+        return result
+
+    with tempfile.TemporaryDirectory(prefix='al_bench_') as tmp:
+        paths = write_portfolio(tmp, rows, seed)
+        raw, us_dates = record('read_csv', lambda: read_export(paths['export']))
+        df, sumdf, *_, has_realized_dates = record('process_and_summarize_data', lambda copy: summarize(copy, us_dates), raw.copy)
+        df = compact_dtypes(df)
+        unrealized = sumdf.loc[sumdf['Category'] == 'Totals', 'Unrealized'].iloc[0]
+
+        record('portfolio_xirr', lambda: portfolio_xirr(df, has_realized_dates, unrealized, AS_OF))
+        record('company_xirr', lambda: company_xirr(df, has_realized_dates, AS_OF))
+        df2 = pd.read_csv(paths['enhancement'], header=1, skip_blank_lines=True)
+        record('overwrite', lambda copy: apply_overwrite(copy, df2, AS_OF), df.copy)
+        for page, aggregate in page_aggregates(has_realized_dates).items():
+            record(f"page: {page}", lambda: aggregate(df))
+
+        df3 = record('tax: parse ledger', lambda: parse_ledger(paths['ledger']))
+        flows = record('tax: cash flows', lambda: ledger_cash_flows(df3))
+        record('tax: company xirr', lambda: ledger_company_xirr(flows, df, AS_OF))
+    return {'rows': rows, 'stages': stages}
+
+
+def compare(report, baseline, tolerance):
+    """Stages slower than in baseline by more than tolerance (a fraction) and NOISE_SECONDS."""
+    regressions = []
+    for size, result in report['sizes'].items():
+        before = baseline.get('sizes', {}).get(size, {}).get('stages', {})
+        for stage, times in result['stages'].items():
+            if stage not in before:
+                continue
+            was, now = before[stage]['best'], times['best']
+            if now > was * (1 + tolerance) and now - was > NOISE_SECONDS:
+                regressions.append({'rows': int(size), 'stage': stage, 'baseline': was, 'best': now, 'ratio': now / was if was else None})
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Startup Data Analyser - data path benchmarks")
+    parser.add_argument('--sizes', default=','.join(str(size) for size in DEFAULT_SIZES), help="Comma separated portfolio sizes (rows)")
+    parser.add_argument('--repeat', type=int, default=3, help="Runs per stage, the best is compared")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--out', help="Write the JSON report here as well as printing it")
+    parser.add_argument('--baseline', help="An earlier report to check for regressions against")
+    parser.add_argument('--tolerance', type=float, default=0.25, help="Fraction slower than the baseline allowed")
+    args = parser.parse_args(argv)
+
+    report = {
+        'created': datetime.now(timezone.utc).isoformat(),
+        'python': platform.python_version(),
+        'pandas': pd.__version__,
+        'numpy': np.__version__,
+        'machine': platform.machine(),
+        'repeat': args.repeat,
+        'sizes': {},
+    }
+    for rows in (int(size) for size in args.sizes.split(',')):
+        report['sizes'][str(rows)] = measure(rows, args.repeat, args.seed)
+
+    ok = True
+    if args.baseline:
+        with open(args.baseline) as f:
+            report['regressions'] = compare(report, json.load(f), args.tolerance)
+        ok = not report['regressions']
+    report['ok'] = ok
+
+    if args.out:
+        with open(args.out, 'w') as f:
+            json.dump(report, f, indent=2)
+    print(json.dumps(report, indent=2))
+    return 0 if ok else 1
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
@@ -0,0 +1,73 @@
+# startup
+# Cold-start benchmark - time the first paint of the About and Load Data pages in a fresh interpreter
+# and check that none of the heavy chart/model libraries were imported to get there
+#
+#   python benchmarks/startup.py [--runs N] [--budget SECONDS]
+#
+# Needs the app's own dependencies (streamlit, pandas, AL_Functions) to be importable.
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+
+APP = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'ALMenu.py')
+
+# Cold first paint of About, and the switch to Load Data, should each fit in this many seconds
+STARTUP_BUDGET_SECONDS = 1.5
+
+# Only the chart pages should pull these in
+HEAVY_MODULES = ['matplotlib', 'seaborn', 'squarify', 'sklearn']
+
+# Run in a child process so every measurement starts with an empty sys.modules.
+# Streamlit itself is imported before the clock starts as every page pays for it regardless.
+_CHILD = '''
+import json, sys, time
+from streamlit.testing.v1 import AppTest
+app = sys.argv[1]
+sys.path.insert(0, __import__('os').path.dirname(app))
+at = AppTest.from_file(app, default_timeout=120)
+# A new session lands on About, then the user moves to Load Data
+start = time.perf_counter()
+at.run()
+about = time.perf_counter() - start
+start = time.perf_counter()
+at.sidebar.selectbox[0].select('Load Data').run()
+load = time.perf_counter() - start
+print(json.dumps({
+    'about_seconds': about,
+    'load_data_seconds': load,
+    'exceptions': [str(e.value) for e in at.exception],
+    'heavy_modules': sorted({name.split('.')[0] for name in sys.modules} & set(sys.argv[2:])),
+}))
+'''
+
+
+def measure(runs=3):
+    """Cold About and Load Data times, best of runs, each in a fresh interpreter."""
+    results = []
+    for _ in range(runs):
+        out = subprocess.run([sys.executable, '-c', _CHILD, APP, *HEAVY_MODULES],
+                             capture_output=True, text=True, check=True)
+        results.append(json.loads(out.stdout.strip().splitlines()[-1]))
+    best = min(results, key=lambda r: r['about_seconds'])
+    best['about_runs'] = [round(r['about_seconds'], 4) for r in results]
+    return best
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Startup Data Analyser - cold-start benchmark")
+    parser.add_argument('--runs', type=int, default=3, help="Fresh interpreters per page")
+    parser.add_argument('--budget', type=float, default=STARTUP_BUDGET_SECONDS, help="Seconds allowed for the first paint")
+    args = parser.parse_args(argv)
+
+    report = {'budget_seconds': args.budget, **measure(args.runs)}
+    report['ok'] = (report['about_seconds'] <= args.budget and report['load_data_seconds'] <= args.budget
+                    and not report['heavy_modules'] and not report['exceptions'])
+    print(json.dumps(report, indent=2))
+    return 0 if report['ok'] else 1
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
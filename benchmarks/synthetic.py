@@ -0,0 +1,163 @@
+# synthetic
+# Made up AngelList files for the benchmarks - an Investments export, an Enhancement file and a
+# finance ledger, in the layouts the app reads, at any number of rows
+#
+#   python benchmarks/synthetic.py --rows 10000 --out /tmp/portfolio [--seed 0]
+#
+# Only numpy and pandas are needed. The same rows and seed always give the same files.
+
+import argparse
+import os
+import numpy as np
+import pandas as pd
+
+# First lines of the files, before the header row
+EXPORT_TITLE = "AngelList Investments export"
+ENHANCEMENT_TITLE = "Enhancement data"
+
+# Dates are written the way the app reads them - the export month first with the year in full
+# (see AL_Ingest.US_DATE_FORMAT), the ledger with two digit years (see convert_date in AL_Functions)
+EXPORT_DATE_FORMAT = "%m/%d/%Y"
+LEDGER_DATE_FORMAT = "%m/%d/%y"
+
+ROUNDS = ['Pre-Seed', 'Seed', 'Seed+', 'Series A', 'Series A+', 'Series B', 'Series B+', 'Series C', 'Other']
+MARKETS = ['SaaS', 'Fintech', 'Healthcare', 'Consumer', 'AI', 'Climate', 'Crypto', 'Marketplaces', 'Biotech', 'Hardware', 'Education', 'Gaming']
+INSTRUMENTS = ['Equity', 'SAFE', 'Convertible Note']
+STATUSES = ['Active', 'Realized', 'Dead']
+STATUS_WEIGHTS = [0.8, 0.12, 0.08]
+
+# Share of rows whose value AngelList shows as Locked, and that the Enhancement file gives a new value for
+LOCKED_SHARE = 0.05
+ENHANCED_SHARE = 0.05
+
+# Earliest invest date and the span they are spread over
+FIRST_DATE = pd.Timestamp('2013-01-01')
+DATE_SPAN_DAYS = 11 * 365
+
+
+def _money(values):
+    return pd.Series(values).map('${:,.2f}'.format)
+
+
+def _dates(values, date_format):
+    return pd.Series(pd.to_datetime(values)).dt.strftime(date_format).fillna('')
+
+
+def company_names(rows):
+    """The company name pool for an export of rows rows - about one company for every three rows."""
+    return np.array([f"Company {i:06d}" for i in range(max(1, rows // 3))], dtype=object)
+
+
+def export_frame(rows, seed=0):
+    """An Investments export as a DataFrame of text, the way the CSV holds it."""
+    rng = np.random.default_rng(seed)
+    names = company_names(rows)
+    leads = np.array([f"Lead {i:04d}" for i in range(max(1, rows // 20))], dtype=object)
+
+    invested = np.round(rng.lognormal(8.5, 0.9, rows), 2)
+    multiple = rng.lognormal(0.0, 1.0, rows) * (rng.random(rows) > 0.15)
+    net_value = np.round(invested * multiple, 2)
+    status = rng.choice(STATUSES, rows, p=STATUS_WEIGHTS)
+    realized = np.where(status == 'Realized', net_value, 0.0)
+    invest_date = FIRST_DATE + pd.to_timedelta(rng.integers(0, DATE_SPAN_DAYS, rows), unit='D')
+    realized_date = pd.Series(invest_date + pd.to_timedelta(rng.integers(180, 2500, rows), unit='D')).where(status == 'Realized')
+
+    df = pd.DataFrame({
+        'Company/Fund': rng.choice(names, rows),
+        'Investment Entity': 'Synthetic LLC',
+        'Invest Date': _dates(invest_date, EXPORT_DATE_FORMAT),
+        'Invested': _money(invested),
+        'Net Value': _money(net_value),
+        'Realized Value': _money(realized),
+        'Multiple': pd.Series(multiple).map('{:.2f}x'.format),
+        'Unrealized Value': _money(net_value - realized),
+        'Lead': rng.choice(leads, rows),
+        'Market': rng.choice(MARKETS, rows),
+        'Round': rng.choice(ROUNDS, rows),
+        'Status': status,
+        'Instrument': rng.choice(INSTRUMENTS, rows),
+        'Investment Type': 'Syndicate',
+        'Fund Name': '',
+        'Allocation': '',
+        'Valuation or Cap': _money(np.round(rng.lognormal(16.5, 1.2, rows), -3)),
+        'Valuation or Cap Type': 'Post-Money Valuation',
+        'Round Size': _money(np.round(rng.lognormal(15.5, 1.0, rows), -3)),
+        'Discount': '',
+        'Carry': '20%',
+        'Share Class': 'Preferred',
+        'Realized Date': _dates(realized_date, EXPORT_DATE_FORMAT),
+    })
+    locked = rng.random(rows) < LOCKED_SHARE
+    df.loc[locked, ['Net Value', 'Unrealized Value']] = 'Locked'
+    return df
+
+
+def enhancement_frame(export, seed=0):
+    """An Enhancement file for an export - a New Value and a Comment for some of its investments."""
+    rng = np.random.default_rng(seed + 1)
+    picked = export[rng.random(len(export)) < ENHANCED_SHARE]
+    invested = picked['Invested'].str.replace(r'[$,]', '', regex=True).astype(float).to_numpy()
+    return pd.DataFrame({
+        'Company/Fund': picked['Company/Fund'].to_numpy(),
+        'Match Date': picked['Invest Date'].to_numpy(),
+        'New Value': np.round(invested * rng.lognormal(0.3, 0.8, len(picked)), 2),
+        'Comment': 'Marked from the latest investor update',
+    })
+
+
+def ledger_frame(rows, seed=0):
+    """A finance ledger (the Tax page file) of rows lines over the companies of an export of the same size."""
+    rng = np.random.default_rng(seed + 2)
+    names = company_names(rows)
+    kind = rng.choice(['Investment', 'Proceeds', 'Distribution', 'Deposit', 'Refill'], rows, p=[0.55, 0.15, 0.1, 0.15, 0.05])
+    company = rng.choice(names, rows)
+    description = np.select(
+        [kind == 'Investment', kind == 'Proceeds', kind == 'Distribution'],
+        ['Investment in ' + company,
+         'Closing Proceeds from ' + company + ' - Series A',
+         'Return of Capital ' + company + ' - final'],
+        default=kind.astype(object),
+    )
+    transaction = np.select([kind == 'Proceeds', kind == 'Distribution'], ['Disbursement', 'Distribution'], default=kind.astype(object))
+    amount = np.round(rng.lognormal(8.0, 1.0, rows), 2) * np.where(np.isin(kind, ['Investment', 'Refill']), -1, 1)
+    date = FIRST_DATE + pd.to_timedelta(rng.integers(0, DATE_SPAN_DAYS, rows), unit='D')
+    return pd.DataFrame({
+        'Date': _dates(date, LEDGER_DATE_FORMAT),
+        'Transaction': transaction,
+        'Description': description,
+        'Amount': amount,
+        'Balance': np.round(np.cumsum(amount), 2),
+    })
+
+
+def _write_csv(df, path, title=None):
+    with open(path, 'w', newline='') as f:
+        if title is not None:
+            f.write(title + '\n')
+        df.to_csv(f, index=False)
+
+
+def write_portfolio(out_dir, rows, seed=0):
+    """Write export.csv, enhancement.csv and ledger.csv for rows investments to out_dir and return their paths."""
+    os.makedirs(out_dir, exist_ok=True)
+    export = export_frame(rows, seed)
+    paths = {name: os.path.join(out_dir, f"{name}.csv") for name in ('export', 'enhancement', 'ledger')}
+    _write_csv(export, paths['export'], EXPORT_TITLE)
+    _write_csv(enhancement_frame(export, seed), paths['enhancement'], ENHANCEMENT_TITLE)
+    _write_csv(ledger_frame(rows, seed), paths['ledger'])
+    return paths
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Startup Data Analyser - synthetic AngelList files")
+    parser.add_argument('--rows', type=int, default=10_000, help="Investments in the export (and lines in the ledger)")
+    parser.add_argument('--out', required=True, help="Directory for export.csv, enhancement.csv and ledger.csv")
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args(argv)
+    for path in write_portfolio(args.out, args.rows, args.seed).values():
+        print(path)
+    return 0
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
@@ -0,0 +1,8 @@
+# Tests run against the modules in the repository root, with the synthetic files from benchmarks/
+
+import os
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, 'benchmarks'))
@@ -0,0 +1,58 @@
+import threading
+
+import pytest
+
+from AL_Cache import SharedCache
+
+
+class Stop(Exception):
+    pass
+
+
+def test_waiter_gets_the_builders_value():
+    cache = SharedCache(max_entries=4, max_bytes=1 << 20)
+    started, release = threading.Event(), threading.Event()
+
+    def build():
+        started.set()
+        release.wait(5)
+        return 'built'
+
+    builder = threading.Thread(target=cache.get_or_build, args=('key', build))
+    builder.start()
+    started.wait(5)
+    results = []
+    waiter = threading.Thread(target=lambda: results.append(cache.get_or_build('key', lambda: 'again')))
+    waiter.start()
+    release.set()
+    builder.join(5)
+    waiter.join(5)
+    assert results == ['built']
+
+
+def test_waiting_can_stop_the_wait():
+    cache = SharedCache(max_entries=4, max_bytes=1 << 20)
+    started, release = threading.Event(), threading.Event()
+
+    def build():
+        started.set()
+        release.wait(5)
+        return 'built'
+
+    builder = threading.Thread(target=cache.get_or_build, args=('key', build))
+    builder.start()
+    started.wait(5)
+    calls = []
+
+    def waiting():
+        calls.append(1)
+        raise Stop()
+
+    try:
+        with pytest.raises(Stop):
+            cache.get_or_build('key', lambda: 'again', waiting=waiting)
+        assert calls == [1]
+    finally:
+        release.set()
+        builder.join(5)
+    assert cache.get('key') == 'built'
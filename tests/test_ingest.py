@@ -0,0 +1,112 @@
+# The summary kept up to date after an edit (see AL_Ingest.update_summary) checked against
+# process_and_summarize_data's own. Needs AL_Functions and its dependencies to be importable
+
+import pandas as pd
+import pytest
+
+AL_Functions = pytest.importorskip('AL_Functions')
+
+import streamlit as st
+from synthetic import write_portfolio
+import AL_Ingest
+from AL_Ingest import (SUMMARY_CATEGORIES, DATE_COLUMNS, US_DATE_FORMAT, DAY_FIRST_DATE_FORMAT, read_export, parse_dates,
+                       run_ingest, summarize, summary_matches, update_summary)
+from AL_Overwrite import apply_overwrite
+
+AS_OF = pd.Timestamp('2025-01-01')
+
+
+@pytest.fixture(scope='module')
+def portfolio(tmp_path_factory):
+    return write_portfolio(str(tmp_path_factory.mktemp('portfolio')), 600)
+
+
+@pytest.fixture(scope='module')
+def result(portfolio):
+    return run_ingest(portfolio['export'])
+
+
+def dates_copy(path, out, date_format, title="Investments export"):
+    # The same export with its dates written in date_format - by default under a title row that isn't AngelList's
+    with open(path) as f:
+        first_line = f.readline()
+        df = pd.read_csv(f, dtype=str, keep_default_na=False)
+    for col in DATE_COLUMNS:
+        df[col] = pd.to_datetime(df[col], format=US_DATE_FORMAT, errors='coerce').dt.strftime(date_format).fillna('')
+    with open(out, 'w', newline='') as f:
+        f.write(title + "\n" if title else first_line)
+        df.to_csv(f, index=False)
+    return str(out)
+
+
+def day_first_copy(path, out):
+    return dates_copy(path, out, DAY_FIRST_DATE_FORMAT)
+
+
+@pytest.mark.parametrize('us_dates, date_format', [(True, '%m/%d/%y'), (False, '%d/%m/%y')])
+def test_two_digit_years(portfolio, tmp_path, us_dates, date_format):
+    expected = run_ingest(portfolio['export'])['df']
+    short = dates_copy(portfolio['export'], tmp_path / 'short.csv', date_format, title=None if us_dates else "Investments export")
+    df = run_ingest(short)['df']
+    for col in DATE_COLUMNS:
+        pd.testing.assert_series_equal(df[col], expected[col])
+
+
+def test_unread_dates_are_logged(caplog):
+    df = pd.DataFrame({'Invest Date': ['01/02/2019', '03/04/19', '', 'soon'], 'Realized Date': [None] * 4})
+    with caplog.at_level('WARNING', logger='AL_Ingest'):
+        parse_dates(df, True)
+    assert df['Invest Date'].tolist()[:2] == [pd.Timestamp('2019-01-02'), pd.Timestamp('2019-03-04')]
+    assert df['Invest Date'].iloc[2:].isna().all()
+    assert [record.getMessage() for record in caplog.records] == ["1 Invest Date values aren't month first dates, eg 'soon' - left empty"]
+
+
+def test_helper_keeps_parsed_dates_whatever_the_flag(portfolio):
+    raw, us_dates = read_export(portfolio['export'])
+    expected = summarize(raw.copy(), us_dates)[0]
+    st.session_state.has_angellist_data = not us_dates
+    df = AL_Functions.process_and_summarize_data(parse_dates(raw.copy(), us_dates))[0]
+    for col in DATE_COLUMNS:
+        pd.testing.assert_series_equal(df[col], expected[col])
+
+
+def test_conventions_in_turn(portfolio, tmp_path):
+    # As in a reused AL_Batch worker - a month first export, then a day first one
+    month_first = run_ingest(portfolio['export'])
+    day_first = run_ingest(day_first_copy(portfolio['export'], tmp_path / 'dayfirst.csv'))
+    assert month_first['has_angellist_data'] and not day_first['has_angellist_data']
+    assert day_first['df']['Invest Date'].notna().all()
+    for col in DATE_COLUMNS:
+        pd.testing.assert_series_equal(day_first['df'][col], month_first['df'][col])
+
+
+def test_categories_are_the_helpers(result):
+    assert list(result['sumdf']['Category']) == list(SUMMARY_CATEGORIES)
+    assert result['summary_verified']
+
+
+def test_mismatched_examples_not_verified(result):
+    sumdf = result['sumdf'].copy()
+    sumdf.loc[0, 'Examples'] = ''
+    assert not summary_matches(result['df'], sumdf)
+
+
+def test_update_after_overwrite_matches_recompute(portfolio, result):
+    df = result['df'].copy()
+    df2 = pd.read_csv(portfolio['enhancement'], header=1, skip_blank_lines=True)
+    touched, before, _ = apply_overwrite(df, df2, AS_OF)
+    assert len(touched)
+    updated = update_summary(result['sumdf'], before, df.loc[touched], df)
+    recomputed = summarize(df.copy(), result['has_angellist_data'])[1]
+    pd.testing.assert_frame_equal(updated, recomputed, check_dtype=False)
+    assert summary_matches(df, updated)
+
+
+def test_chunked_read_matches_whole(portfolio, result, monkeypatch):
+    # Dates parsed and grouping columns categorical per chunk, as a large export is read
+    monkeypatch.setattr(AL_Ingest, 'CHUNKED_INGEST_BYTES', 0)
+    monkeypatch.setattr(AL_Ingest, 'INGEST_CHUNK_ROWS', 100)
+    chunked = run_ingest(portfolio['export'])
+    assert chunked['summary_verified']
+    pd.testing.assert_frame_equal(chunked['sumdf'], result['sumdf'])
+    pd.testing.assert_frame_equal(chunked['df'], result['df'], check_categorical=False)
@@ -0,0 +1,35 @@
+# Ledger company names (see AL_Ledger.ledger_company_names) checked against extract_company_name,
+# the per-row helper they replace. Needs AL_Functions and its dependencies to be importable
+
+import pandas as pd
+import pytest
+
+AL_Functions = pytest.importorskip('AL_Functions')
+
+from AL_Ledger import LEDGER_PATTERN, ledger_company_names
+
+DESCRIPTIONS = [
+    "Investment in Foo Inc",
+    "For investment in Foo Inc (Series A)",
+    "Closing Proceeds from Foo Inc (Series A) - final",
+    "Closing proceeds from Foo (Pre-Seed) - x",
+    "Return of Capital Bar Labs (Seed) (2nd close)",
+    "Refund for Baz Co.(SAFE)",
+    "Acquisition of Qux by Big Corp - cash",
+    "Amount adjustment for Self-Driving Co",
+    "Distribution Quux (Fund I)",
+    "Holdback",
+    "No hyphen or brackets",
+    None,
+]
+
+
+def test_names_match_extract_company_name():
+    df3 = pd.DataFrame({'Description': DESCRIPTIONS, 'Transaction': 'Disbursement'})
+    expected = [AL_Functions.extract_company_name(description, LEDGER_PATTERN.pattern) for description in DESCRIPTIONS]
+    assert ledger_company_names(df3).tolist() == expected
+
+
+def test_deposits_and_refills_have_no_company():
+    df3 = pd.DataFrame({'Description': ["Deposit (wire)", "Refill - Foo"], 'Transaction': ['Deposit', 'Refill']})
+    assert ledger_company_names(df3).tolist() == ['', '']
@@ -0,0 +1,79 @@
+# Enhancement and ledger names matched to the data file's Company/Fund names (see AL_Names)
+
+import pandas as pd
+import pytest
+import streamlit as st
+
+from AL_Names import MATCH_THRESHOLD, NameIndex, normalize_names, trigrams, matched_names
+
+COMPANIES = ['ACME', 'Globex Robotics', 'Initech Software', 'Fund 2', 'Fund 3', 'Hooli Labs', 'Hooli Labz',
+             'Stark Industries', 'Wayne Enterprises']
+
+
+def dice(a, b):
+    a, b = trigrams(a), trigrams(b)
+    return 2 * len(a & b) / (len(a) + len(b))
+
+
+@pytest.fixture
+def index():
+    return NameIndex(COMPANIES)
+
+
+def test_normalize():
+    names = pd.Series(['Acme, Inc.', '  Globex   Robotics LLC', 'Stark Industries Corp. Ltd', 'Wayne-Enterprises', None])
+    assert normalize_names(names).tolist() == ['acme', 'globex robotics', 'stark industries', 'wayne enterprises', '']
+
+
+@pytest.mark.parametrize('name, expected', [
+    ('ACME', 'ACME'),
+    ('Acme, Inc.', 'ACME'),
+    ('acme corp', 'ACME'),
+    ('Globex Robotics, LLC', 'Globex Robotics'),
+    ('Initech Sofware', 'Initech Software'),
+    ('Stark Industries Inc', 'Stark Industries'),
+])
+def test_matches(index, name, expected):
+    assert index.resolve([name]) == {name: expected}
+
+
+def test_numbers_must_agree(index):
+    # Close enough on trigrams, but a different fund
+    assert index.resolve(['Fund 2', 'Fund 3']) == {'Fund 2': 'Fund 2', 'Fund 3': 'Fund 3'}
+    assert index.resolve(['Fund 4', 'The Fund 2'])['Fund 4'] is None
+    assert NameIndex(['Fund 3']).resolve(['Fund 2']) == {'Fund 2': None}
+
+
+def test_threshold():
+    index = NameIndex(['Wayne Enterprises'])
+    near, far = 'Wayne Enterprizes', 'Wayne Ent'
+    assert dice('wayne enterprizes', 'wayne enterprises') >= MATCH_THRESHOLD > dice('wayne ent', 'wayne enterprises')
+    assert index.resolve([near, far]) == {near: 'Wayne Enterprises', far: None}
+    assert NameIndex(['Wayne Enterprises'], threshold=0.3).resolve([far]) == {far: 'Wayne Enterprises'}
+
+
+def test_ambiguous_names_stay_unmatched(index):
+    # As close to Hooli Labs as to Hooli Labz
+    assert abs(dice('hooli lab', 'hooli labs') - dice('hooli lab', 'hooli labz')) < 0.05
+    assert index.resolve(['Hooli Lab']) == {'Hooli Lab': None}
+
+
+def test_map_keeps_unmatched_and_missing(index):
+    mapped = index.map(pd.Series(['Acme, Inc.', 'Unknown Co', None, '']))
+    assert mapped[[0, 1, 3]].tolist() == ['ACME', 'Unknown Co', ''] and pd.isna(mapped[2])
+
+
+def test_matched_names():
+    st.session_state.has_data_file = True
+    st.session_state.data_version = 'names-test'
+    st.session_state.df = pd.DataFrame({'Company/Fund': COMPANIES})
+    try:
+        frame = pd.DataFrame({'Company/Fund': ['Acme, Inc.', 'Fund 4'], 'Sector': ['Industrial', 'Funds']})
+        matched = matched_names(frame)
+        assert matched['Company/Fund'].tolist() == ['ACME', 'Fund 4']
+        assert frame['Company/Fund'].tolist() == ['Acme, Inc.', 'Fund 4']
+        assert matched_names(frame) is matched
+        assert matched_names(frame, col='Name') is frame
+    finally:
+        for key in ['has_data_file', 'data_version', 'df', 'name_index', 'matched_frames']:
+            st.session_state.pop(key, None)
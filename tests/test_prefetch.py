@@ -0,0 +1,35 @@
+# Pages prepared in the background (see AL_Prefetch) - what progress counts
+
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+pytest.importorskip('AL_Functions')
+
+import AL_Prefetch
+from AL_Prefetch import Prefetch
+
+
+def test_progress_counts_only_prepared_pages(monkeypatch):
+    release = threading.Event()
+
+    def page_work(page, data):
+        if page == 'Broken':
+            raise ValueError("no data")
+        if page == 'Slow':
+            release.wait(5)
+        yield 'value', (page, 'table'), page
+
+    monkeypatch.setattr(AL_Prefetch, 'page_work', page_work)
+    with ThreadPoolExecutor(max_workers=1) as workers:
+        prefetch = Prefetch(1).start({}, workers, pages=['Good', 'Broken', 'Slow', 'Queued'])
+        try:
+            prefetch.futures['Broken'].result(5)
+            prefetch.cancel()
+        finally:
+            release.set()
+    assert prefetch.progress() == (1, 1, 4)
+    assert prefetch.get((1, 'value', 'Good', 'table')) == 'Good'
+    assert isinstance(prefetch.errors['Broken'], ValueError)
+    assert prefetch.futures['Queued'].cancelled()
@@ -0,0 +1,83 @@
+# Filters and aggregations answered from AL_Query's indexes checked against pandas
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from AL_Query import QueryError, QueryIndex, parse_query, run_query
+
+ROUNDS = ['Pre-Seed', 'Seed', 'Series A', 'Series B']
+
+FILTERS = [
+    "Invested > 5000",
+    "Invested >= 5000",
+    "Invested == 5000",
+    "Invested != 5000",
+    "5000 < Invested",
+    "1000 < Invested <= 20000",
+    "Market == 'Fintech'",
+    "Market != 'Fintech'",
+    "Market in ['Fintech', 'Health']",
+    "Market not in ('Fintech',)",
+    "Invested > 5000 and Market == 'SaaS' or Status == 'Realized'",
+    "not (Invested > 5000) & ~(Status == 'Realized')",
+    "`Invest Date` >= '2019-01-01' and `Real Multiple` < 1",
+    "Round > 'Seed' | `Net Value` <= -1",
+    "Invested > `Net Value`",
+]
+
+
+@pytest.fixture(scope='module')
+def df():
+    rng = np.random.default_rng(3)
+    rows = 400
+    invested = rng.choice([500.0, 1000.0, 5000.0, 10000.0, 25000.0], rows)
+    invested[rng.random(rows) < 0.05] = np.nan
+    multiple = rng.choice([0.0, 0.5, 1.0, 3.0], rows)
+    return pd.DataFrame({
+        'Company/Fund': [f"Company {i % 50}" for i in range(rows)],
+        'Invested': invested,
+        'Net Value': invested * multiple,
+        'Real Multiple': multiple,
+        'Invest Date': pd.Timestamp('2015-01-01') + pd.to_timedelta(rng.integers(0, 3000, rows), unit='D'),
+        'Market': pd.Categorical(rng.choice(['Fintech', 'Health', 'SaaS'], rows)),
+        'Status': rng.choice(['Active', 'Realized'], rows).astype(object),
+        'Round': pd.Categorical(rng.choice(ROUNDS, rows), categories=ROUNDS, ordered=True),
+    })
+
+
+@pytest.mark.parametrize('text', FILTERS)
+def test_filter_matches_dataframe_query(df, text):
+    pd.testing.assert_frame_equal(run_query(QueryIndex(df), text), df.query(text))
+
+
+def test_filters_from_the_index(df):
+    # All but the column against column filter are answered without DataFrame.query
+    assert [parse_query(text)[0] for text in FILTERS] == ['filter'] * (len(FILTERS) - 1) + ['pandas']
+
+
+@pytest.mark.parametrize('func', ['sum', 'mean', 'median', 'min', 'max', 'count'])
+def test_aggregate_matches_groupby(df, func):
+    answer = run_query(QueryIndex(df), f"{func} Invested by Market where Status == 'Active'")
+    expected = df[df['Status'] == 'Active'].groupby('Market', observed=True)['Invested'].agg(func)
+    expected = expected[expected.index.isin(answer['Market'])]
+    got = answer.set_index('Market').iloc[:, 0]
+    np.testing.assert_allclose(got.sort_index().to_numpy(dtype=float), expected.sort_index().to_numpy(dtype=float))
+    assert got.is_monotonic_decreasing
+
+
+def test_count_rows(df):
+    answer = run_query(QueryIndex(df), "count by Status")
+    assert dict(zip(answer['Status'], answer['count'])) == df['Status'].value_counts().to_dict()
+
+
+def test_repeated_query_is_shared(df):
+    index = QueryIndex(df)
+    assert run_query(index, "Invested > 5000") is run_query(index, " Invested > 5000 ")
+
+
+@pytest.mark.parametrize('text', ["", "Invested >", "Nothing > 5", "Market > 'Fintech'", "Round > 'Series Z'",
+                                  "sum Invested by Market where Invested > `Net Value`"])
+def test_errors(df, text):
+    with pytest.raises(QueryError):
+        run_query(QueryIndex(df), text)
@@ -0,0 +1,126 @@
+# Snapshots (see AL_Snapshot) written and read back. Needs pyarrow
+
+import io
+import json
+import zipfile
+
+import numpy as np
+import pandas as pd
+import pytest
+
+pytest.importorskip('pyarrow')
+
+from AL_Aggregates import ROUND_ORDER, build_group_store
+from AL_Snapshot import SNAPSHOT_VERSION, SnapshotError, read_snapshot, write_snapshot, load_result, snapshot_bytes
+
+
+def processed_frame(rows=60, seed=0):
+    # The columns the pages read after process_and_summarize_data, with its dtypes
+    rng = np.random.default_rng(seed)
+    invested = rng.integers(1, 50, rows) * 1000.0
+    multiple = rng.choice([0.0, 0.5, 1.0, 2.5, 8.0], rows)
+    realized = rng.random(rows) < 0.3
+    return pd.DataFrame({
+        'Company/Fund': pd.Categorical([f"Company {i % 20}" for i in range(rows)]),
+        'Invest Date': pd.Timestamp('2016-01-01') + pd.to_timedelta(rng.integers(0, 2500, rows), unit='D'),
+        'Invested': invested,
+        'Net Value': invested * multiple,
+        'Realized Value': np.where(realized, invested * multiple, 0.0),
+        'Unrealized Value': np.where(realized, 0.0, invested * multiple),
+        'Real Multiple': multiple,
+        'Multiple': multiple,
+        'Status': pd.Categorical(np.where(realized, 'Realized', 'Active')),
+        'Round': pd.Categorical(rng.choice(ROUND_ORDER[:4], rows), categories=ROUND_ORDER, ordered=True),
+        'Market': pd.Categorical(rng.choice(['Fintech', 'Health', 'SaaS'], rows)),
+        'Lead': pd.Categorical(rng.choice(['Lead A', 'Lead B'], rows)),
+        'Instrument': pd.Categorical(rng.choice(['Equity', 'SAFE'], rows)),
+        'Valuation or Cap': rng.integers(1, 100, rows) * 1e6,
+        'Valuation Unknown': rng.random(rows) < 0.1,
+    })
+
+
+def ingest_result(df):
+    sumdf = pd.DataFrame({'Category': ['Totals'], 'Invested': [df['Invested'].sum()], 'Examples': ['Company 1']})
+    return {
+        'df': df, 'sumdf': sumdf, 'groups': build_group_store(df),
+        'counters': {'num_uniques': np.int64(20), 'num_leads': 2, 'num_zero_value_leads': 0, 'num_locked': 3},
+        'has_angellist_data': True, 'has_realized_dates': False, 'date_format': '%m/%d/%Y', 'summary_verified': True,
+    }
+
+
+def test_roundtrip():
+    frames = {'df': processed_frame(), 'other': pd.DataFrame({'a': [1, 2], 'b': ['x', None]})}
+    buffer = io.BytesIO()
+    write_snapshot(buffer, frames, {'note': 'kept'})
+    read, meta = read_snapshot(buffer)
+    assert meta == {'note': 'kept'}
+    assert list(read) == list(frames)
+    for name, df in frames.items():
+        pd.testing.assert_frame_equal(read[name], df)
+
+
+def test_snapshot_file_is_memory_mapped(tmp_path):
+    path = str(tmp_path / 'portfolio.alsnap')
+    df = processed_frame()
+    write_snapshot(path, {'df': df})
+    pd.testing.assert_frame_equal(read_snapshot(path)[0]['df'], df)
+
+
+def rewrite_meta(data, change):
+    # The snapshot in data with its meta.json passed through change
+    source, target = zipfile.ZipFile(io.BytesIO(data)), io.BytesIO()
+    with zipfile.ZipFile(target, 'w', compression=zipfile.ZIP_STORED) as archive:
+        for member in source.namelist():
+            content = source.read(member)
+            if member == 'meta.json':
+                info = json.loads(content)
+                change(info)
+                content = json.dumps(info)
+            archive.writestr(member, content)
+    return target
+
+
+def test_newer_version_refused():
+    data = snapshot_bytes(ingest_result(processed_frame()))
+    newer = rewrite_meta(data, lambda info: info.update(snapshot_version=SNAPSHOT_VERSION + 1))
+    with pytest.raises(SnapshotError, match='newer'):
+        read_snapshot(newer)
+
+
+def test_schema_mismatch_refused():
+    data = snapshot_bytes(ingest_result(processed_frame()))
+    changed = rewrite_meta(data, lambda info: info['schemas']['df'].update({'Invested': 'int64'}))
+    with pytest.raises(SnapshotError, match="doesn't match"):
+        read_snapshot(changed)
+
+
+def test_not_a_snapshot():
+    with pytest.raises(SnapshotError):
+        read_snapshot(io.BytesIO(b'Company/Fund,Invested\n'))
+
+
+def test_load_result_rebuilds_groups():
+    result = ingest_result(processed_frame())
+    df2 = pd.DataFrame({'Company/Fund': ['Company 1'], 'Sector': ['Fintech']})
+    loaded, loaded_df2 = load_result(io.BytesIO(snapshot_bytes(result, df2)))
+    pd.testing.assert_frame_equal(loaded['df'], result['df'])
+    pd.testing.assert_frame_equal(loaded['sumdf'], result['sumdf'])
+    pd.testing.assert_frame_equal(loaded_df2, df2)
+    assert loaded['counters'] == result['counters']
+    assert loaded['has_angellist_data'] and loaded['summary_verified']
+    assert loaded['groups'].keys() == result['groups'].keys()
+    for key, stats in result['groups']['stats'].items():
+        pd.testing.assert_frame_equal(loaded['groups']['stats'][key], stats)
+    pd.testing.assert_frame_equal(loaded['groups']['round'], result['groups']['round'])
+
+
+def test_no_enhancement_data():
+    loaded, df2 = load_result(io.BytesIO(snapshot_bytes(ingest_result(processed_frame()), pd.DataFrame())))
+    assert df2 is None and 'df' in loaded
+
+
+def test_mixed_column_cant_be_saved():
+    # What the Load Data page reports rather than crashing on
+    df2 = pd.DataFrame({'Company/Fund': ['Company 1', 'Company 2'], 'Notes': [1.5, 'text']})
+    with pytest.raises((ValueError, TypeError)):
+        snapshot_bytes(ingest_result(processed_frame()), df2)
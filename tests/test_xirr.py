@@ -0,0 +1,102 @@
+# The batched XIRR engine (see AL_Xirr) checked against a plain one-group-at-a-time solver
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from AL_Xirr import batch_xirr, company_xirr
+
+START = pd.Timestamp('2015-01-01')
+
+
+def reference_xirr(dates, amounts):
+    # Bisection on the actual/365 NPV of one group - slow and simple
+    years = np.array([(date - min(dates)).days / 365.0 for date in dates])
+    amounts = np.asarray(amounts, dtype=float)
+
+    def npv(rate):
+        return float(np.sum(amounts / (1 + rate) ** years))
+
+    lo, hi = -0.9999999, 1000.0
+    assert np.sign(npv(lo)) != np.sign(npv(hi))
+    for _ in range(300):
+        mid = (lo + hi) / 2
+        if np.sign(npv(mid)) == np.sign(npv(lo)):
+            lo = mid
+        else:
+            hi = mid
+    return (lo + hi) / 2
+
+
+def random_flows(groups=200, seed=0):
+    # Each group invests one or more times, then gets between nothing much and 5x back one or more
+    # times at least six months later, so it has exactly one IRR
+    rng = np.random.default_rng(seed)
+    rows = []
+    for group in range(groups):
+        day = 0
+        invested = 0.0
+        for _ in range(rng.integers(1, 5)):
+            day += int(rng.integers(0, 400))
+            amount = float(rng.uniform(100, 10_000))
+            invested += amount
+            rows.append((group, START + pd.Timedelta(days=day), -amount))
+        returns = rng.integers(1, 4)
+        for _ in range(returns):
+            day += int(rng.integers(180, 900))
+            rows.append((group, START + pd.Timedelta(days=day), invested * float(rng.uniform(0.01, 5)) / returns))
+    return pd.DataFrame(rows, columns=['Group', 'Date', 'Amount'])
+
+
+def test_matches_reference_on_random_groups():
+    flows = random_flows()
+    result = batch_xirr(flows, 'Group')
+    expected = pd.Series({group: reference_xirr(list(rows['Date']), rows['Amount']) for group, rows in flows.groupby('Group')})
+    assert result.notna().all()
+    np.testing.assert_allclose(result.to_numpy(), expected.reindex(result.index).to_numpy(), rtol=1e-6, atol=1e-8)
+
+
+def test_all_negative_flows_have_no_xirr():
+    flows = pd.DataFrame({'Group': 'a', 'Date': [START, START + pd.Timedelta(days=100)], 'Amount': [-100.0, -50.0]})
+    assert np.isnan(batch_xirr(flows, 'Group')['a'])
+
+
+def test_single_flow_has_no_xirr():
+    flows = pd.DataFrame({'Group': ['a'], 'Date': [START], 'Amount': [-100.0]})
+    assert np.isnan(batch_xirr(flows, 'Group')['a'])
+
+
+def test_near_total_loss():
+    # 1,000 out, 1 cent back a year later - a rate just above -100%
+    flows = pd.DataFrame({'Group': 'a', 'Date': [START, START + pd.Timedelta(days=365)], 'Amount': [-1000.0, 0.01]})
+    assert batch_xirr(flows, 'Group')['a'] == pytest.approx(0.01 / 1000 - 1, abs=1e-9)
+
+
+def test_groups_are_independent():
+    flows = random_flows(groups=20, seed=1)
+    together = batch_xirr(flows, 'Group')
+    for group, rows in flows.groupby('Group'):
+        assert together[group] == pytest.approx(batch_xirr(rows, 'Group')[group], rel=1e-9)
+
+
+def investments(net_values):
+    return pd.DataFrame({
+        'Company/Fund': 'Acme',
+        'Invest Date': [START + pd.Timedelta(days=200 * i) for i in range(len(net_values))],
+        'Invested': 1000.0,
+        'Net Value': net_values,
+    })
+
+
+def test_company_xirr():
+    xirr = company_xirr(investments([1500.0, 2500.0]), as_of=pd.Timestamp('2020-01-01'))
+    expected = reference_xirr([START, START + pd.Timedelta(days=200), pd.Timestamp('2020-01-01')], [-1000.0, -1000.0, 4000.0])
+    assert xirr['Acme'] == pytest.approx(expected, rel=1e-6)
+
+
+@pytest.mark.parametrize('first_value', [np.nan, 0.0])
+def test_company_xirr_needs_a_value_on_the_first_investment(first_value):
+    # As the per-company loop it replaced - the first row by position decides, even when a later
+    # investment has a value
+    xirr = company_xirr(investments([first_value, 5000.0]), as_of=pd.Timestamp('2020-01-01'))
+    assert xirr['Acme'] == 0.0